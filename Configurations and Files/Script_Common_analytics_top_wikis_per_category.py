@@ -1,6 +1,33 @@
+import argparse
 import requests
 import pandas as pd
 import os
+from article_dictionary import ArticleDictionary, read_top_pages
+from partitioned_store import write_partitioned, with_year_month
+from spark_pipeline import RawBatchWriter, run_collector_postprocess
+import sqlite_store
+import wikimedia_api as api
+from collector_profiler import CollectorProfiler
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--partitioned", action="store_true",
+                    help="also write a year=/month= partitioned copy under local_store/partitioned/")
+parser.add_argument("--engine", choices=["pandas", "spark"], default="pandas",
+                    help="run the post-processing in pandas or PySpark")
+parser.add_argument("--spark-master", default="local[*]", help="Spark master URL for --engine spark")
+parser.add_argument("--sqlite", action="store_true",
+                    help="upsert the results into the shared SQLite store (local_store/wikimedia.db) instead of the CSV")
+parser.add_argument("--profile", action="store_true",
+                    help="record stage timers, a sampling CPU profile and allocations under profiles/")
+args = parser.parse_args()
+if args.sqlite and args.engine == "spark":
+    parser.error("--sqlite stores the pandas results; it cannot be combined with --engine spark")
+
+# Stage timers, CPU samples and allocations with --profile (see collector_profiler.py)
+profiler = CollectorProfiler("top_pages_by_category", enabled=args.profile)
+
+# With --engine spark raw responses are spooled to disk and processed by spark_pipeline
+raw_batches = RawBatchWriter("top_pages_by_category") if args.engine == "spark" else None
 
 headers = {
     "accept": "application/json",
@@ -19,18 +46,23 @@ months = [f"{m:02d}" for m in range(1, 13)]
 
 output_csv = "top_pages_by_category.csv"
 
-if os.path.exists(output_csv):
-    collected_data = pd.read_csv(output_csv)
+# Article titles are stored as ids from the shared article dictionary
+articles_dict = ArticleDictionary()
+
+# With --sqlite the run only upserts the rows it fetched
+if os.path.exists(output_csv) and not args.sqlite:
+    collected_data = read_top_pages(output_csv, articles_dict)
 else:
-    collected_data = pd.DataFrame(columns=["category", "category_scope", "wiki", "year", "month", "article", "views_ceil", "rank"])
+    collected_data = pd.DataFrame(columns=["category", "category_scope", "wiki", "year", "month", "article_id", "views_ceil", "rank"])
 
 def fetch_commons_data(category, category_scope, wiki, year, month):
     url = (f"https://wikimedia.org/api/rest_v1/metrics/commons-analytics/top-pages-per-category-monthly/"
            f"{category}/{category_scope}/{wiki}/{year}/{month}")
-    response = requests.get(url, headers=headers)
-    response.raise_for_status()
-    data = response.json()
-    return data
+    with profiler.stage("fetch"):
+        response = requests.get(url, headers=headers)
+        response.raise_for_status()
+    with profiler.stage("decode"):
+        return api.loads(response.content)
 
 for category in categories:
     for category_scope in scopes:
@@ -39,41 +71,60 @@ for category in categories:
                 for month in months:
                     try:
                         data = fetch_commons_data(category, category_scope, wiki, year, month)
-                        items = data.get("items", [])
-                        if not items:
-                            continue
-                        # items contain page data
-                        df_temp = pd.DataFrame(items)
-                        
-                        if df_temp.empty:
+                        if raw_batches is not None:
+                            raw_batches.append({"category": category, "category_scope": category_scope, "wiki": wiki, "year": year, "month": month}, data)
                             continue
+                        with profiler.stage("frame"):
+                            # items contain page data; page-title and pageview-count come
+                            # back as article and views_ceil, next to the parameter columns
+                            df_temp = api.top_pages_by_category_frame(data, category, category_scope, wiki, year, month)
 
-                        # Rename columns to match desired naming (article, views_ceil)
-                        if 'page-title' in df_temp.columns:
-                            df_temp.rename(columns={'page-title': 'article', 'pageview-count': 'views_ceil'}, inplace=True)
+                            if df_temp.empty:
+                                continue
+                            df_temp["article_id"] = articles_dict.encode(df_temp["article"])
 
-                        # Add parameter columns
-                        df_temp["category"] = category
-                        df_temp["category_scope"] = category_scope
-                        df_temp["wiki"] = wiki
-                        df_temp["year"] = year
-                        df_temp["month"] = month
+                            # Reorder columns
+                            df_temp = df_temp[["category", "category_scope", "wiki", "year", "month", "article_id", "views_ceil", "rank"]]
 
-                        # Reorder columns
-                        df_temp = df_temp[["category", "category_scope", "wiki", "year", "month", "article", "views_ceil", "rank"]]
-
-                        collected_data = pd.concat([collected_data, df_temp], ignore_index=True)
+                            with profiler.stage("concat"):
+                                collected_data = pd.concat([collected_data, df_temp], ignore_index=True)
 
                     except requests.exceptions.RequestException as e:
                         print(f"Error fetching data for {category}, {category_scope}, {wiki}, {year}-{month}: {e}")
                     except KeyError as ke:
                         print(f"KeyError: {ke} for {category}, {category_scope}, {wiki}, {year}-{month}, skipping.")
 
-# Remove duplicates if any
-collected_data.drop_duplicates(inplace=True)
+if raw_batches is not None:
+    with profiler.stage("postprocess"):
+        raw_batches.close()
+        rows = run_collector_postprocess("top_pages_by_category", output_csv, "top_pages_by_category" if args.partitioned else None, args.spark_master)
+    print(f"Data collection completed. {rows} rows saved in {output_csv}")
+else:
+    # Keep article ids compact (concat with the empty seed frame widens them to object)
+    collected_data["article_id"] = collected_data["article_id"].astype("int32")
+
+    # Remove duplicates if any
+    with profiler.stage("sort"):
+        collected_data.drop_duplicates(inplace=True)
+
+        # Sort for readability
+        collected_data.sort_values(by=["category", "category_scope", "wiki", "year", "month", "rank"], inplace=True)
+
+    if args.sqlite:
+        # Straight into the transactional store: concurrent runs queue on its write
+        # lock instead of overwriting each other's CSV
+        with profiler.stage("write"):
+            rows = sqlite_store.upsert_dataset("top_pages_by_category", collected_data, articles_dict)
+        print(f"Data collection completed. {rows} rows upserted into {sqlite_store.DB_PATH}")
+    else:
+        with profiler.stage("write"):
+            collected_data.to_csv(output_csv, index=False)
+        print(f"Data collection completed. Results saved in {output_csv}")
 
-# Sort for readability
-collected_data.sort_values(by=["category", "category_scope", "wiki", "year", "month", "rank"], inplace=True)
+    # Optional Hive-style copy so Spark/pandas readers can prune by month
+    if args.partitioned:
+        with profiler.stage("write"):
+            write_partitioned(with_year_month(collected_data), "top_pages_by_category", ["year", "month"])
+        print("Partitioned copy written to local_store/partitioned/top_pages_by_category")
 
-collected_data.to_csv(output_csv, index=False)
-print(f"Data collection completed. Results saved in {output_csv}")
+profiler.finish()
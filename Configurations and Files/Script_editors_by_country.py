@@ -1,7 +1,33 @@
+import argparse
 import requests
 import pandas as pd
 import datetime
 import os
+from partitioned_store import write_partitioned, with_year_month
+from spark_pipeline import RawBatchWriter, run_collector_postprocess
+import sqlite_store
+import wikimedia_api as api
+from collector_profiler import CollectorProfiler
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--partitioned", action="store_true",
+                    help="also write a year=/month= partitioned copy under local_store/partitioned/")
+parser.add_argument("--engine", choices=["pandas", "spark"], default="pandas",
+                    help="run the post-processing in pandas or PySpark")
+parser.add_argument("--spark-master", default="local[*]", help="Spark master URL for --engine spark")
+parser.add_argument("--sqlite", action="store_true",
+                    help="upsert the results into the shared SQLite store (local_store/wikimedia.db) instead of the CSV")
+parser.add_argument("--profile", action="store_true",
+                    help="record stage timers, a sampling CPU profile and allocations under profiles/")
+args = parser.parse_args()
+if args.sqlite and args.engine == "spark":
+    parser.error("--sqlite stores the pandas results; it cannot be combined with --engine spark")
+
+# Stage timers, CPU samples and allocations with --profile (see collector_profiler.py)
+profiler = CollectorProfiler("editors_by_country", enabled=args.profile)
+
+# With --engine spark raw responses are spooled to disk and processed by spark_pipeline
+raw_batches = RawBatchWriter("editors_by_country") if args.engine == "spark" else None
 
 # User-Agent header required by the API
 headers = {
@@ -19,7 +45,8 @@ months = ["01", "02", "03", "04", "05", "06", "07", "08", "09", "10", "11", "12"
 output_csv = "editors_by_country.csv"
 
 # Initialize the DataFrame
-if os.path.exists(output_csv):
+# With --sqlite the run only upserts the rows it fetched
+if os.path.exists(output_csv) and not args.sqlite:
     collected_data = pd.read_csv(output_csv)
 else:
     collected_data = pd.DataFrame(columns=["project", "activity_level", "year", "month", "country", "editors"])
@@ -27,10 +54,11 @@ else:
 def fetch_editors_data(project, activity_level, year, month):
     url = (f"https://wikimedia.org/api/rest_v1/metrics/editors/by-country/"
            f"{project}/{activity_level}/{year}/{month}")
-    response = requests.get(url, headers=headers)
-    response.raise_for_status()
-    data = response.json()
-    return data
+    with profiler.stage("fetch"):
+        response = requests.get(url, headers=headers)
+        response.raise_for_status()
+    with profiler.stage("decode"):
+        return api.loads(response.content)
 
 # Iterate over all combinations of parameters
 for project in projects:
@@ -39,47 +67,49 @@ for project in projects:
             for month in months:
                 try:
                     data = fetch_editors_data(project, activity_level, year, month)
-                    items = data.get("items", [])
-                    
-                    if items:
-                        # Usually there's one item per request
-                        item = items[0]
-                        results = item.get("countries", [])
-                        
-                        # Create a temporary DataFrame
-                        temp_df = pd.DataFrame(results)
-                        
+                    if raw_batches is not None:
+                        raw_batches.append({"project": project, "activity_level": activity_level, "year": year, "month": month}, data)
+                        continue
+                    with profiler.stage("frame"):
+                        # Countries of the first item, editors-ceil renamed to editors and "--" excluded
+                        temp_df = api.editors_by_country_frame(data, project, activity_level, year, month)
+
                         if not temp_df.empty:
-                            # Rename editors-ceil to editors
-                            if "editors-ceil" in temp_df.columns:
-                                temp_df.rename(columns={"editors-ceil": "editors"}, inplace=True)
-                            
-                            # Exclude rows where country is "--"
-                            temp_df = temp_df[temp_df["country"] != "--"]
-
-                            if not temp_df.empty:
-                                # Add parameter columns
-                                temp_df["project"] = project
-                                temp_df["activity_level"] = activity_level
-                                temp_df["year"] = year
-                                temp_df["month"] = month
-
-                                # Reorder columns
-                                temp_df = temp_df[["project", "activity_level", "year", "month", "country", "editors"]]
-
-                                # Append to the main DataFrame
+                            # Append to the main DataFrame
+                            with profiler.stage("concat"):
                                 collected_data = pd.concat([collected_data, temp_df], ignore_index=True)
 
                 except requests.exceptions.RequestException as e:
                     print(f"Error fetching data for {project}, {activity_level}, {year}-{month}: {e}")
 
-# Remove duplicates if any
-collected_data.drop_duplicates(inplace=True)
+if raw_batches is not None:
+    with profiler.stage("postprocess"):
+        raw_batches.close()
+        rows = run_collector_postprocess("editors_by_country", output_csv, "editors_by_country" if args.partitioned else None, args.spark_master)
+    print(f"Data collection completed. {rows} rows saved in {output_csv}")
+else:
+    # Remove duplicates if any
+    with profiler.stage("sort"):
+        collected_data.drop_duplicates(inplace=True)
+
+        # Sort data by project, activity_level, year, month
+        collected_data.sort_values(by=["project", "activity_level", "year", "month"], inplace=True)
 
-# Sort data by project, activity_level, year, month
-collected_data.sort_values(by=["project", "activity_level", "year", "month"], inplace=True)
+    if args.sqlite:
+        # Straight into the transactional store: concurrent runs queue on its write
+        # lock instead of overwriting each other's CSV
+        with profiler.stage("write"):
+            rows = sqlite_store.upsert_dataset("editors_by_country", collected_data)
+        print(f"Data collection completed. {rows} rows upserted into {sqlite_store.DB_PATH}")
+    else:
+        with profiler.stage("write"):
+            collected_data.to_csv(output_csv, index=False)
+        print(f"Data collection completed. Results saved in {output_csv}")
 
-# Save to CSV
-collected_data.to_csv(output_csv, index=False)
+    # Optional Hive-style copy so Spark/pandas readers can prune by month
+    if args.partitioned:
+        with profiler.stage("write"):
+            write_partitioned(with_year_month(collected_data), "editors_by_country", ["year", "month"])
+        print("Partitioned copy written to local_store/partitioned/editors_by_country")
 
-print(f"Data collection completed. Results saved in {output_csv}")
+profiler.finish()
@@ -1,6 +1,32 @@
+import argparse
 import requests
 import pandas as pd
 import datetime
+from partitioned_store import write_partitioned, with_year_month
+from spark_pipeline import RawBatchWriter, run_collector_postprocess
+import sqlite_store
+import wikimedia_api as api
+from collector_profiler import CollectorProfiler
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--partitioned", action="store_true",
+                    help="also write a year=/month= partitioned copy under local_store/partitioned/")
+parser.add_argument("--engine", choices=["pandas", "spark"], default="pandas",
+                    help="run the post-processing in pandas or PySpark")
+parser.add_argument("--spark-master", default="local[*]", help="Spark master URL for --engine spark")
+parser.add_argument("--sqlite", action="store_true",
+                    help="upsert the results into the shared SQLite store (local_store/wikimedia.db) instead of the CSV")
+parser.add_argument("--profile", action="store_true",
+                    help="record stage timers, a sampling CPU profile and allocations under profiles/")
+args = parser.parse_args()
+if args.sqlite and args.engine == "spark":
+    parser.error("--sqlite stores the pandas results; it cannot be combined with --engine spark")
+
+# Stage timers, CPU samples and allocations with --profile (see collector_profiler.py)
+profiler = CollectorProfiler("editors_data", enabled=args.profile)
+
+# With --engine spark raw responses are spooled to disk and processed by spark_pipeline
+raw_batches = RawBatchWriter("editors_data") if args.engine == "spark" else None
 
 # User-Agent header required by the API
 headers = {
@@ -22,22 +48,25 @@ end_date = "20240101"
 # Output CSV file
 output_csv = "editors_data.csv"
 
-# Initialize an empty DataFrame or check if the file already exists
-try:
-    # If file exists, append to it
-    existing_df = pd.read_csv(output_csv)
-    collected_data = existing_df
-except FileNotFoundError:
-    collected_data = pd.DataFrame(columns=["project", "editor_type", "page_type", "activity_level", "date", "editors"])
+# Initialize an empty DataFrame or check if the file already exists; with --sqlite
+# the run only upserts the rows it fetched
+collected_data = pd.DataFrame(columns=["project", "editor_type", "page_type", "activity_level", "date", "editors"])
+if not args.sqlite:
+    try:
+        # If file exists, append to it
+        collected_data = pd.read_csv(output_csv)
+    except FileNotFoundError:
+        pass
 
 # Function to fetch data for a given parameter set
 def fetch_editors_data(project, editor_type, page_type, activity_level, granularity, start, end):
     url = (f"https://wikimedia.org/api/rest_v1/metrics/editors/aggregate/"
            f"{project}/{editor_type}/{page_type}/{activity_level}/{granularity}/{start}/{end}")
-    response = requests.get(url, headers=headers)
-    response.raise_for_status()
-    data = response.json()
-    return data
+    with profiler.stage("fetch"):
+        response = requests.get(url, headers=headers)
+        response.raise_for_status()
+    with profiler.stage("decode"):
+        return api.loads(response.content)
 
 # Iterate over all combinations of parameters
 for project in projects:
@@ -46,55 +75,68 @@ for project in projects:
             for activity_level in activity_levels:
                 try:
                     data = fetch_editors_data(project, editor_type, page_type, activity_level, "daily", start_date, end_date)
-                    items = data.get("items", [])
+                    if raw_batches is not None:
+                        raw_batches.append({"project": project, "editor_type": editor_type, "page_type": page_type, "activity_level": activity_level}, data)
+                        continue
+                    with profiler.stage("frame"):
+                        items = data.get("items", [])
                     
-                    if items:
-                        # Each item has "results" which contain timestamps and editors count
-                        # Example structure:
-                        # "items": [
-                        #   {
-                        #     "project": "en.wikipedia",
-                        #     "editor-type": "all-editor-types",
-                        #     "page-type": "all-page-types",
-                        #     "activity-level": "5..24-edits",
-                        #     "granularity": "monthly",
-                        #     "results": [
-                        #       {
-                        #         "timestamp": "2023-01-01T00:00:00.000Z",
-                        #         "editors": 48660
-                        #       }
-                        #     ]
-                        #   }
-                        # ]
-
-                        # Usually there's one item matching the requested parameters
-                        item = items[0]
-                        results = item.get("results", [])
-                        temp_df = pd.DataFrame(results)
-
-                        # Convert timestamp to a date string (YYYY-MM-DD)
-                        temp_df["date"] = pd.to_datetime(temp_df["timestamp"]).dt.date
-
-                        # Add parameter columns
-                        temp_df["project"] = project
-                        temp_df["editor_type"] = editor_type
-                        temp_df["page_type"] = page_type
-                        temp_df["activity_level"] = activity_level
-
-                        # Select the required columns
-                        temp_df = temp_df[["project", "editor_type", "page_type", "activity_level", "date", "editors"]]
-
-                        # Append to the main dataframe
-                        collected_data = pd.concat([collected_data, temp_df], ignore_index=True)
+                        if items:
+                            # Each item has "results" which contain timestamps and editors count
+                            # Example structure:
+                            # "items": [
+                            #   {
+                            #     "project": "en.wikipedia",
+                            #     "editor-type": "all-editor-types",
+                            #     "page-type": "all-page-types",
+                            #     "activity-level": "5..24-edits",
+                            #     "granularity": "monthly",
+                            #     "results": [
+                            #       {
+                            #         "timestamp": "2023-01-01T00:00:00.000Z",
+                            #         "editors": 48660
+                            #       }
+                            #     ]
+                            #   }
+                            # ]
+
+                            # Usually there's one item matching the requested parameters; its
+                            # results become the date and editors columns next to the parameters
+                            temp_df = api.editors_frame(data, project, editor_type, page_type, activity_level)
+
+                            # Append to the main dataframe
+                            with profiler.stage("concat"):
+                                collected_data = pd.concat([collected_data, temp_df], ignore_index=True)
 
                 except requests.exceptions.RequestException as e:
                     print(f"Error fetching data for {project}, {editor_type}, {page_type}, {activity_level}: {e}")
 
-# Remove duplicates if any, and sort by date
-collected_data.drop_duplicates(inplace=True)
-collected_data.sort_values(by=["project", "editor_type", "page_type", "activity_level", "date"], inplace=True)
-
-# Save to CSV
-collected_data.to_csv(output_csv, index=False)
-
-print(f"Data collection completed. Results saved in {output_csv}")
+if raw_batches is not None:
+    with profiler.stage("postprocess"):
+        raw_batches.close()
+        rows = run_collector_postprocess("editors_data", output_csv, "editors_data" if args.partitioned else None, args.spark_master)
+    print(f"Data collection completed. {rows} rows saved in {output_csv}")
+else:
+    # Remove duplicates if any, and sort by date
+    with profiler.stage("sort"):
+        collected_data.drop_duplicates(inplace=True)
+        collected_data.sort_values(by=["project", "editor_type", "page_type", "activity_level", "date"], inplace=True)
+
+    if args.sqlite:
+        # Straight into the transactional store: concurrent runs queue on its write
+        # lock instead of overwriting each other's CSV
+        with profiler.stage("write"):
+            rows = sqlite_store.upsert_dataset("editors_data", collected_data)
+        print(f"Data collection completed. {rows} rows upserted into {sqlite_store.DB_PATH}")
+    else:
+        with profiler.stage("write"):
+            collected_data.to_csv(output_csv, index=False)
+        print(f"Data collection completed. Results saved in {output_csv}")
+
+    # Optional Hive-style copy so Spark/pandas readers can prune by month
+    if args.partitioned:
+        with profiler.stage("write"):
+            write_partitioned(with_year_month(collected_data, "date"), "editors_data", ["year", "month"])
+        print("Partitioned copy written to local_store/partitioned/editors_data")
+
+profiler.finish()
@@ -0,0 +1,176 @@
+import argparse
+import bz2
+import gzip
+import os
+import re
+from array import array
+from multiprocessing import Pool
+from urllib.parse import unquote
+import numpy as np
+import pandas as pd
+import local_store
+from collector_profiler import CollectorProfiler
+
+# Parser for the daily mediacounts dumps (mediacounts.YYYY-MM-DD.v00.tsv.bz2,
+# https://dumps.wikimedia.org/other/mediacounts/). Each input is read once by
+# its own worker process, which keeps compact per-file counters and then rolls
+# them up to daily totals for the categories in commons_category_allow_list.tsv.
+#
+# Mediacounts rows name media files, not categories, so the join needs a
+# category membership file: a TSV of (category, file title) pairs, e.g. exported
+# from the Commons categorylinks table.
+#
+#   python Script_mediacounts.py dumps/mediacounts.2024-01-*.tsv.bz2 --members category_files.tsv
+
+dataset = "mediacounts_by_category"
+files_dataset = "mediacounts_files"
+
+# 0-based columns of the dump that we keep per file
+counter_columns = {"total_bytes": 1, "transfers": 2, "original_transfers": 3}
+
+dump_name = re.compile(r"mediacounts\.(\d{4}-\d{2}-\d{2})\.")
+
+# Set in every worker by init_worker
+file_categories = None
+categories = None
+
+
+def open_dump(path):
+    if path.endswith(".bz2"):
+        return bz2.open(path, "rt", encoding="utf-8", errors="replace")
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8", errors="replace")
+    return open(path, encoding="utf-8", errors="replace")
+
+
+def file_title(base_name):
+    # /wikipedia/commons/a/ab/Foo%20bar.jpg -> Foo_bar.jpg
+    return unquote(base_name.rsplit("/", 1)[-1]).replace(" ", "_")
+
+
+def load_category_members(members_path, allow_list_path="commons_category_allow_list.tsv"):
+    allowed = pd.read_csv(allow_list_path, sep='\t', header=None)[0].tolist()
+    category_index = {category: i for i, category in enumerate(allowed)}
+    mapping = {}
+    with open(members_path, encoding="utf-8") as f:
+        for line in f:
+            fields = line.rstrip("\n").split("\t")
+            if len(fields) < 2:
+                continue
+            i = category_index.get(fields[0].replace(" ", "_"))
+            if i is None:
+                continue
+            title = fields[1].replace(" ", "_")
+            if title.startswith("File:"):
+                title = title[5:]
+            mapping.setdefault(title, []).append(i)
+    return allowed, {title: np.unique(np.asarray(ids, dtype=np.int32)) for title, ids in mapping.items()}
+
+
+def init_worker(allowed, mapping):
+    global categories, file_categories
+    categories = allowed
+    file_categories = mapping
+
+
+class FileCounters:
+    # One slot per distinct media file: a dict for the name -> slot lookup and
+    # one flat int64 array per counter, so memory grows with distinct files only
+    def __init__(self):
+        self.slots = {}
+        self.values = {name: array("q") for name in counter_columns}
+
+    def add(self, title, counts):
+        slot = self.slots.get(title)
+        if slot is None:
+            self.slots[title] = len(self.slots)
+            for name, value in zip(counter_columns, counts):
+                self.values[name].append(value)
+        else:
+            for name, value in zip(counter_columns, counts):
+                self.values[name][slot] += value
+
+    def to_frame(self):
+        df = pd.DataFrame({"file": list(self.slots)})
+        for name, values in self.values.items():
+            df[name] = np.frombuffer(values, dtype=np.int64)
+        return df
+
+
+def parse_dump(task):
+    path, keep_files = task
+    counters = FileCounters()
+    indexes = list(counter_columns.values())
+    width = max(indexes) + 1
+    with open_dump(path) as f:
+        for line in f:
+            fields = line.split("\t", width)
+            if len(fields) < width:
+                continue
+            try:
+                counts = [int(fields[i]) for i in indexes]
+            except ValueError:
+                continue
+            counters.add(file_title(fields[0]), counts)
+
+    # Roll the per-file counters up to the allow-listed categories
+    totals = np.zeros((len(categories), len(counter_columns)), dtype=np.int64)
+    files = np.zeros(len(categories), dtype=np.int64)
+    columns = [np.frombuffer(values, dtype=np.int64) for values in counters.values.values()]
+    for title, slot in counters.slots.items():
+        ids = file_categories.get(title)
+        if ids is None:
+            continue
+        totals[ids] += [column[slot] for column in columns]
+        files[ids] += 1
+
+    day = dump_name.search(os.path.basename(path)).group(1)
+    rollup = pd.DataFrame(totals, columns=list(counter_columns))
+    rollup.insert(0, "category", categories)
+    rollup.insert(1, "date", day)
+    rollup.insert(2, "files", files)
+    rollup = rollup[rollup["files"] > 0]
+    if keep_files:
+        local_store.write_partition_part(files_dataset, {"date": day}, counters.to_frame(), "0000")
+    return day, len(counters.slots), rollup
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Roll mediacounts dumps up to per-category daily totals.")
+    parser.add_argument("files", nargs="+", help="mediacounts.YYYY-MM-DD.v00.tsv.bz2 files")
+    parser.add_argument("--members", required=True, help="TSV of (category, file title) pairs")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="worker processes")
+    parser.add_argument("--keep-files", action="store_true", help="also store the per-file counters")
+    parser.add_argument("--profile", action="store_true",
+                        help="record stage timers, a sampling CPU profile and allocations under profiles/ "
+                             "(with --workers 1 the dumps are parsed in this process and profiled too)")
+    args = parser.parse_args()
+
+    profiler = CollectorProfiler("mediacounts", enabled=args.profile)
+    paths = [p for p in args.files if dump_name.search(os.path.basename(p))]
+    with profiler.stage("load"):
+        allowed, mapping = load_category_members(args.members)
+    print(f"{len(mapping)} media files belong to {len(allowed)} allow-listed categories")
+
+    collected = []
+    tasks = [(p, args.keep_files) for p in paths]
+    if args.workers == 1:
+        init_worker(allowed, mapping)
+        pool = None
+    else:
+        pool = Pool(processes=args.workers, initializer=init_worker, initargs=(allowed, mapping))
+    try:
+        with profiler.stage("parse"):
+            for day, distinct_files, rollup in (pool.imap_unordered if pool else map)(parse_dump, tasks):
+                print(f"{day}: {distinct_files} distinct media files, {len(rollup)} categories with traffic")
+                collected.append(rollup)
+    finally:
+        if pool is not None:
+            pool.terminate()
+
+    if collected:
+        with profiler.stage("write"):
+            rows = local_store.upsert_dataset(dataset, pd.concat(collected, ignore_index=True))
+        print(f"Data collection completed. {rows} rows stored in {local_store.dataset_path(dataset)}")
+
+    profiler.finish()
@@ -1,6 +1,33 @@
+import argparse
 import requests
 import pandas as pd
 import os
+from article_dictionary import ArticleDictionary, read_top_pages
+from partitioned_store import write_partitioned, with_year_month
+from spark_pipeline import RawBatchWriter, run_collector_postprocess
+import sqlite_store
+import wikimedia_api as api
+from collector_profiler import CollectorProfiler
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--partitioned", action="store_true",
+                    help="also write a year=/month= partitioned copy under local_store/partitioned/")
+parser.add_argument("--engine", choices=["pandas", "spark"], default="pandas",
+                    help="run the post-processing in pandas or PySpark")
+parser.add_argument("--spark-master", default="local[*]", help="Spark master URL for --engine spark")
+parser.add_argument("--sqlite", action="store_true",
+                    help="upsert the results into the shared SQLite store (local_store/wikimedia.db) instead of the CSV")
+parser.add_argument("--profile", action="store_true",
+                    help="record stage timers, a sampling CPU profile and allocations under profiles/")
+args = parser.parse_args()
+if args.sqlite and args.engine == "spark":
+    parser.error("--sqlite stores the pandas results; it cannot be combined with --engine spark")
+
+# Stage timers, CPU samples and allocations with --profile (see collector_profiler.py)
+profiler = CollectorProfiler("most_viewed_pages", enabled=args.profile)
+
+# With --engine spark raw responses are spooled to disk and processed by spark_pipeline
+raw_batches = RawBatchWriter("most_viewed_pages") if args.engine == "spark" else None
 
 headers = {
     "accept": "application/json",
@@ -15,18 +42,23 @@ days = [f"{d:02d}" for d in range(1, 32)]
 
 output_csv = "most_viewed_pages.csv"
 
-if os.path.exists(output_csv):
-    collected_data = pd.read_csv(output_csv)
+# Article titles are stored as ids from the shared article dictionary
+articles_dict = ArticleDictionary()
+
+# With --sqlite the run only upserts the rows it fetched
+if os.path.exists(output_csv) and not args.sqlite:
+    collected_data = read_top_pages(output_csv, articles_dict)
 else:
-    collected_data = pd.DataFrame(columns=["project", "access", "year", "month", "day", "article", "views", "rank"])
+    collected_data = pd.DataFrame(columns=["project", "access", "year", "month", "day", "article_id", "views", "rank"])
 
 def fetch_top_pages(project, access, year, month, day):
     url = (f"https://wikimedia.org/api/rest_v1/metrics/pageviews/top/"
            f"{project}/{access}/{year}/{month}/{day}")
-    response = requests.get(url, headers=headers)
-    response.raise_for_status()
-    data = response.json()
-    return data
+    with profiler.stage("fetch"):
+        response = requests.get(url, headers=headers)
+        response.raise_for_status()
+    with profiler.stage("decode"):
+        return api.loads(response.content)
 
 for project in projects:
     for access in access_methods:
@@ -35,38 +67,58 @@ for project in projects:
                 for day in days:
                     try:
                         data = fetch_top_pages(project, access, year, month, day)
-                        items = data.get("items", [])
-                        if not items:
-                            continue
-                        # items[0] should contain the articles list
-                        articles = items[0].get("articles", [])
-                        if not articles:
+                        if raw_batches is not None:
+                            raw_batches.append({"project": project, "access": access, "year": year, "month": month, "day": day}, data)
                             continue
+                        with profiler.stage("frame"):
+                            # Articles of the first item, with project, access, year, month, day added
+                            temp_df = api.top_pages_frame(data, project, access, year, month, day)
+                            if temp_df.empty:
+                                continue
+                            temp_df["article_id"] = articles_dict.encode(temp_df["article"])
 
-                        temp_df = pd.DataFrame(articles)
-                        # temp_df should have columns: article, views, rank
-                        # Add project, access, year, month, day
-                        temp_df["project"] = project
-                        temp_df["access"] = access
-                        temp_df["year"] = year
-                        temp_df["month"] = month
-                        temp_df["day"] = day
+                            # Reorder columns
+                            temp_df = temp_df[["project", "access", "year", "month", "day", "article_id", "views", "rank"]]
 
-                        # Reorder columns
-                        temp_df = temp_df[["project", "access", "year", "month", "day", "article", "views", "rank"]]
-
-                        collected_data = pd.concat([collected_data, temp_df], ignore_index=True)
+                            with profiler.stage("concat"):
+                                collected_data = pd.concat([collected_data, temp_df], ignore_index=True)
 
                     except requests.exceptions.RequestException as e:
                         print(f"Error fetching data for {project}, {access}, {year}-{month}-{day}: {e}")
                     except KeyError as ke:
                         print(f"KeyError: {ke} for {project}, {access}, {year}-{month}-{day}, skipping.")
 
-# Remove duplicates if any
-collected_data.drop_duplicates(inplace=True)
+if raw_batches is not None:
+    with profiler.stage("postprocess"):
+        raw_batches.close()
+        rows = run_collector_postprocess("most_viewed_pages", output_csv, "most_viewed_pages" if args.partitioned else None, args.spark_master)
+    print(f"Data collection completed. {rows} rows saved in {output_csv}")
+else:
+    # Keep article ids compact (concat with the empty seed frame widens them to object)
+    collected_data["article_id"] = collected_data["article_id"].astype("int32")
+
+    # Remove duplicates if any
+    with profiler.stage("sort"):
+        collected_data.drop_duplicates(inplace=True)
+
+        # Sort the data for readability
+        collected_data.sort_values(by=["project", "access", "year", "month", "day", "rank"], inplace=True)
+
+    if args.sqlite:
+        # Straight into the transactional store: concurrent runs queue on its write
+        # lock instead of overwriting each other's CSV
+        with profiler.stage("write"):
+            rows = sqlite_store.upsert_dataset("most_viewed_pages", collected_data, articles_dict)
+        print(f"Data collection completed. {rows} rows upserted into {sqlite_store.DB_PATH}")
+    else:
+        with profiler.stage("write"):
+            collected_data.to_csv(output_csv, index=False)
+        print(f"Data collection completed. Results saved in {output_csv}")
 
-# Sort the data for readability
-collected_data.sort_values(by=["project", "access", "year", "month", "day", "rank"], inplace=True)
+    # Optional Hive-style copy so Spark/pandas readers can prune by month
+    if args.partitioned:
+        with profiler.stage("write"):
+            write_partitioned(with_year_month(collected_data), "most_viewed_pages", ["year", "month"])
+        print("Partitioned copy written to local_store/partitioned/most_viewed_pages")
 
-collected_data.to_csv(output_csv, index=False)
-print(f"Data collection completed. Results saved in {output_csv}")
+profiler.finish()
@@ -0,0 +1,214 @@
+import argparse
+import gzip
+import os
+import re
+import shutil
+import tempfile
+import zlib
+from collections import defaultdict
+from multiprocessing import Pool
+import pandas as pd
+import local_store
+import sketches
+from collector_profiler import CollectorProfiler
+
+# Bulk ingestion of the public hourly pageview dumps (pageviews-YYYYMMDD-HH.gz,
+# https://dumps.wikimedia.org/other/pageviews/) into daily per-(project, article,
+# access) counts. No network is needed once the files are on disk.
+#
+# Two parallel passes keep memory bounded:
+#   1. map: one worker process per hourly file stream-decompresses and parses it,
+#      aggregating counts in a dict that is spilled to hash-partitioned shard files
+#      whenever it exceeds max_keys entries;
+#   2. reduce: one worker per shard sums that shard's spills for the day and
+#      writes it as a Parquet part of the dump_pageviews dataset. Each shard also
+#      sketches its articles per project; the shard sketches are merged into the
+#      per-(project, month) sketches in local_store/sketches/dump_pageviews.
+#
+#   python Script_pageview_dumps.py dumps/pageviews-20240101-*.gz --workers 8
+
+dataset = "dump_pageviews"
+
+# Domain code suffix -> project family (see the dumps README)
+project_suffixes = {
+    "": "wikipedia",
+    "b": "wikibooks",
+    "d": "wiktionary",
+    "n": "wikinews",
+    "q": "wikiquote",
+    "s": "wikisource",
+    "v": "wikiversity",
+    "voy": "wikivoyage",
+}
+# Sites that live under wikimedia.org and use the ".m" suffix for the project itself
+wikimedia_sites = {"commons", "meta", "species", "incubator", "outreach", "wikimania", "foundation"}
+special_codes = {
+    "www.wd": ("wikidata.org", "desktop"),
+    "m.wd": ("wikidata.org", "mobile"),
+    "www.w": ("www.mediawiki.org", "desktop"),
+    "m.w": ("www.mediawiki.org", "mobile"),
+}
+
+dump_name = re.compile(r"pageviews-(\d{8})-(\d{2})(\d{4})?\.gz$")
+
+
+def parse_domain_code(code):
+    # Returns (project, access) or None for codes we do not map.
+    # The hourly dumps only distinguish desktop from mobile (web and app combined).
+    if code in special_codes:
+        return special_codes[code]
+    parts = code.split(".")
+    lang, rest = parts[0], parts[1:]
+    if lang in wikimedia_sites:
+        # commons.m = desktop, commons.m.m = mobile
+        if rest[:1] != ["m"]:
+            return None
+        return f"{lang}.wikimedia.org", "mobile" if rest[1:] == ["m"] else "desktop"
+    access = "desktop"
+    if rest[:1] == ["m"]:
+        access = "mobile"
+        rest = rest[1:]
+    family = project_suffixes.get(rest[0] if rest else "")
+    if family is None or len(rest) > 1:
+        return None
+    return f"{lang}.{family}.org", access
+
+
+def shard_of(key, shards):
+    # crc32 rather than hash(): it must agree across worker processes
+    return zlib.crc32("\t".join(key).encode("utf-8")) % shards
+
+
+def spill(counts, spill_dir, shards, tag):
+    files = {}
+    try:
+        for key, views in counts.items():
+            shard = shard_of(key, shards)
+            f = files.get(shard)
+            if f is None:
+                f = files[shard] = open(os.path.join(spill_dir, f"shard-{shard:04d}", f"{tag}.tsv"), "a", encoding="utf-8")
+            f.write(f"{key[0]}\t{key[1]}\t{key[2]}\t{views}\n")
+    finally:
+        for f in files.values():
+            f.close()
+    counts.clear()
+
+
+def map_hourly_file(task):
+    path, spill_dir, shards, max_keys = task
+    tag = os.path.basename(path).replace(".gz", "")
+    counts = defaultdict(int)
+    domain_cache = {}
+    lines = 0
+    with gzip.open(path, "rt", encoding="utf-8", errors="replace") as f:
+        for line in f:
+            fields = line.split(" ")
+            if len(fields) < 3:
+                continue
+            code, title, views = fields[0], fields[1], fields[2]
+            mapped = domain_cache.get(code)
+            if mapped is None:
+                mapped = domain_cache[code] = parse_domain_code(code) or ()
+            if not mapped or not views.isdigit():
+                continue
+            counts[(mapped[0], title, mapped[1])] += int(views)
+            lines += 1
+            if len(counts) >= max_keys:
+                spill(counts, spill_dir, shards, tag)
+    spill(counts, spill_dir, shards, tag)
+    return lines
+
+
+def reduce_shard(task):
+    shard_dir, day, part, sketch_projects = task
+    counts = defaultdict(int)
+    for name in os.listdir(shard_dir):
+        with open(os.path.join(shard_dir, name), encoding="utf-8") as f:
+            for line in f:
+                project, article, access, views = line.rstrip("\n").split("\t")
+                counts[(project, article, access)] += int(views)
+    if not counts:
+        return 0, {}
+    df = pd.DataFrame(list(counts.keys()), columns=["project", "article", "access"])
+    df["views"] = pd.Series(list(counts.values()), dtype="int64")
+    df = df.sort_values(by=["project", "access", "article"])
+    local_store.write_partition_part(dataset, {"date": day}, df, part)
+    shard_sketches = {}
+    for project, rows in df[df["project"].isin(sketch_projects)].groupby("project"):
+        sketch = sketches.ArticleSketch()
+        sketch.update(rows["article"], rows["views"])
+        shard_sketches[project] = sketch
+    return len(df), shard_sketches
+
+
+def ingest_day(day, paths, workers, shards, max_keys, sketch_projects, profiler=None):
+    profiler = profiler or CollectorProfiler(dataset)
+    spill_dir = tempfile.mkdtemp(prefix=f"pageview_dumps_{day}_")
+    # With one worker both passes run in this process, so --profile sees them
+    pool = Pool(processes=workers) if workers > 1 else None
+    imap = pool.imap_unordered if pool is not None else map
+    try:
+        for shard in range(shards):
+            os.makedirs(os.path.join(spill_dir, f"shard-{shard:04d}"))
+        with profiler.stage("map"):
+            lines = sum(imap(map_hourly_file, [(p, spill_dir, shards, max_keys) for p in paths]))
+        # Re-ingesting a day replaces its partition
+        shutil.rmtree(local_store.partition_path(dataset, {"date": day}), ignore_errors=True)
+        rows = 0
+        day_sketches = {}
+        with profiler.stage("reduce"):
+            for shard_rows, shard_sketches in imap(
+                reduce_shard,
+                [(os.path.join(spill_dir, f"shard-{shard:04d}"), day, f"{shard:04d}", sketch_projects) for shard in range(shards)]
+            ):
+                rows += shard_rows
+                for project, sketch in shard_sketches.items():
+                    if project in day_sketches:
+                        day_sketches[project].merge(sketch)
+                    else:
+                        day_sketches[project] = sketch
+    finally:
+        if pool is not None:
+            pool.terminate()
+        shutil.rmtree(spill_dir, ignore_errors=True)
+    # After the partition is written; the day's sketches replace any from an earlier ingest
+    with profiler.stage("sketches"):
+        sketches.replace_day_sketches(dataset, {(project, day): sketch for project, sketch in day_sketches.items()})
+    return lines, rows
+
+
+def group_by_day(paths):
+    days = defaultdict(list)
+    for path in paths:
+        match = dump_name.search(os.path.basename(path))
+        if not match:
+            print(f"Skipping {path}: not a pageviews-YYYYMMDD-HH.gz file")
+            continue
+        d = match.group(1)
+        days[f"{d[:4]}-{d[4:6]}-{d[6:]}"].append(path)
+    return dict(sorted(days.items()))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ingest hourly pageview dump files into daily counts.")
+    parser.add_argument("files", nargs="+", help="pageviews-YYYYMMDD-HH*.gz files")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="worker processes")
+    parser.add_argument("--shards", type=int, default=64, help="hash partitions for the reduce pass")
+    parser.add_argument("--max-keys", type=int, default=2_000_000, help="distinct keys a worker holds before spilling")
+    parser.add_argument("--sketch-projects", nargs="*",
+                        default=["en.wikipedia.org", "de.wikipedia.org", "fr.wikipedia.org", "es.wikipedia.org"],
+                        help="projects to keep distinct-article / heavy-hitter sketches for")
+    parser.add_argument("--profile", action="store_true",
+                        help="record stage timers, a sampling CPU profile and allocations under profiles/ "
+                             "(with --workers 1 the files are parsed in this process and profiled too)")
+    args = parser.parse_args()
+
+    profiler = CollectorProfiler(dataset, enabled=args.profile)
+
+    for day, paths in group_by_day(args.files).items():
+        if len(paths) < 24:
+            print(f"Warning: {day} has {len(paths)} of 24 hourly files")
+        lines, rows = ingest_day(day, sorted(paths), args.workers, args.shards, args.max_keys, set(args.sketch_projects), profiler)
+        print(f"{day}: {lines} lines from {len(paths)} files -> {rows} daily rows in {local_store.partition_path(dataset, {'date': day})}")
+
+    profiler.finish()
@@ -1,7 +1,33 @@
+import argparse
 import requests
 import pandas as pd
 import os
 from datetime import datetime
+from partitioned_store import write_partitioned, with_year_month
+from spark_pipeline import RawBatchWriter, run_collector_postprocess
+import sqlite_store
+import wikimedia_api as api
+from collector_profiler import CollectorProfiler
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--partitioned", action="store_true",
+                    help="also write a year=/month= partitioned copy under local_store/partitioned/")
+parser.add_argument("--engine", choices=["pandas", "spark"], default="pandas",
+                    help="run the post-processing in pandas or PySpark")
+parser.add_argument("--spark-master", default="local[*]", help="Spark master URL for --engine spark")
+parser.add_argument("--sqlite", action="store_true",
+                    help="upsert the results into the shared SQLite store (local_store/wikimedia.db) instead of the CSV")
+parser.add_argument("--profile", action="store_true",
+                    help="record stage timers, a sampling CPU profile and allocations under profiles/")
+args = parser.parse_args()
+if args.sqlite and args.engine == "spark":
+    parser.error("--sqlite stores the pandas results; it cannot be combined with --engine spark")
+
+# Stage timers, CPU samples and allocations with --profile (see collector_profiler.py)
+profiler = CollectorProfiler("pageviews", enabled=args.profile)
+
+# With --engine spark raw responses are spooled to disk and processed by spark_pipeline
+raw_batches = RawBatchWriter("pageviews") if args.engine == "spark" else None
 
 # User-Agent header required by the API
 headers = {
@@ -23,7 +49,8 @@ granularity = "daily"
 output_csv = "pageviews_daily_all_params.csv"
 
 # Check if the CSV already exists; if not, create an empty DataFrame
-if os.path.exists(output_csv):
+# With --sqlite the run only upserts the rows it fetched
+if os.path.exists(output_csv) and not args.sqlite:
     collected_data = pd.read_csv(output_csv)
 else:
     collected_data = pd.DataFrame(columns=["project", "access", "agent", "timestamp", "views"])
@@ -31,10 +58,11 @@ else:
 def fetch_pageviews_data(project, access, agent, granularity, start, end):
     url = (f"https://wikimedia.org/api/rest_v1/metrics/pageviews/aggregate/"
            f"{project}/{access}/{agent}/{granularity}/{start}/{end}")
-    response = requests.get(url, headers=headers)
-    response.raise_for_status()
-    data = response.json()
-    return data
+    with profiler.stage("fetch"):
+        response = requests.get(url, headers=headers)
+        response.raise_for_status()
+    with profiler.stage("decode"):
+        return api.loads(response.content)
 
 # Iterate over all combinations of project, access, agent
 for project in projects:
@@ -42,29 +70,47 @@ for project in projects:
         for agent in agents:
             try:
                 data = fetch_pageviews_data(project, access, agent, granularity, start, end)
-                items = data.get("items", [])
-                if items:
-                    df = pd.DataFrame(items)
-                    # Convert timestamp to datetime
-                    df["timestamp"] = pd.to_datetime(df["timestamp"], format="%Y%m%d%H")
-                    # Add project, access, agent columns
-                    df["project"] = project
-                    df["access"] = access
-                    df["agent"] = agent
-                    # Keep required columns
-                    df = df[["project", "access", "agent", "timestamp", "views"]]
-                    # Append to main DataFrame
-                    collected_data = pd.concat([collected_data, df], ignore_index=True)
+                if raw_batches is not None:
+                    raw_batches.append({"project": project, "access": access, "agent": agent}, data)
+                    continue
+                with profiler.stage("frame"):
+                    # Typed columns with the timestamp parsed and project, access, agent added
+                    df = api.pageviews_frame(data, project, access, agent)
+                    if not df.empty:
+                        # Append to main DataFrame
+                        with profiler.stage("concat"):
+                            collected_data = pd.concat([collected_data, df], ignore_index=True)
             except requests.exceptions.RequestException as e:
                 print(f"Error fetching data for {project}, {access}, {agent}: {e}")
 
-# Remove duplicates if any
-collected_data.drop_duplicates(inplace=True)
+if raw_batches is not None:
+    with profiler.stage("postprocess"):
+        raw_batches.close()
+        rows = run_collector_postprocess("pageviews", output_csv, "pageviews_daily_all_params" if args.partitioned else None, args.spark_master)
+    print(f"Data collection completed. {rows} rows saved in {output_csv}")
+else:
+    # Remove duplicates if any
+    with profiler.stage("sort"):
+        collected_data.drop_duplicates(inplace=True)
+
+        # Sort the data
+        collected_data.sort_values(by=["project", "access", "agent", "timestamp"], inplace=True)
 
-# Sort the data
-collected_data.sort_values(by=["project", "access", "agent", "timestamp"], inplace=True)
+    if args.sqlite:
+        # Straight into the transactional store: concurrent runs queue on its write
+        # lock instead of overwriting each other's CSV
+        with profiler.stage("write"):
+            rows = sqlite_store.upsert_dataset("pageviews", collected_data)
+        print(f"Data collection completed. {rows} rows upserted into {sqlite_store.DB_PATH}")
+    else:
+        with profiler.stage("write"):
+            collected_data.to_csv(output_csv, index=False)
+        print(f"Data collection completed. Results saved in {output_csv}")
 
-# Save to CSV
-collected_data.to_csv(output_csv, index=False)
+    # Optional Hive-style copy so Spark/pandas readers can prune by month
+    if args.partitioned:
+        with profiler.stage("write"):
+            write_partitioned(with_year_month(collected_data, "timestamp"), "pageviews_daily_all_params", ["year", "month"])
+        print("Partitioned copy written to local_store/partitioned/pageviews_daily_all_params")
 
-print(f"Data collection completed. Results saved in {output_csv}")
+profiler.finish()
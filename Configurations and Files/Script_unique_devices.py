@@ -0,0 +1,76 @@
+import argparse
+import requests
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import local_store
+import wikimedia_api as api
+from collector_profiler import CollectorProfiler
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--profile", action="store_true",
+                    help="record stage timers, a sampling CPU profile and allocations under profiles/")
+args = parser.parse_args()
+
+profiler = CollectorProfiler("unique_devices", enabled=args.profile)
+
+# Parameters
+projects = [
+    "all-wikipedia-projects",
+    "en.wikipedia.org",
+    "de.wikipedia.org",
+    "fr.wikipedia.org",
+    "es.wikipedia.org",
+    "hi.wikipedia.org",
+    "commons.wikimedia.org",
+    "meta.wikimedia.org",
+    "wikidata.org"
+]
+access_sites = ["all-sites", "desktop-site", "mobile-site"]
+granularities = ["daily", "monthly"]
+
+# Fixed date range in YYYYMMDD format
+start = "20180101"
+end = "20240101"
+
+# Number of requests in flight at once
+max_workers = 8
+
+dataset = "unique_devices"
+
+def fetch_series(project, access_site, granularity):
+    with profiler.stage("fetch"):
+        response = api.get(f"unique-devices/{project}/{access_site}/{granularity}/{start}/{end}", session)
+    with profiler.stage("decode"):
+        data = api.loads(response.content)
+    with profiler.stage("frame"):
+        return api.unique_devices_frame(data, project, access_site, granularity)
+
+session = requests.Session()
+collected = []
+
+# Fetch every (project, access site, granularity) series concurrently
+with ThreadPoolExecutor(max_workers=max_workers) as executor:
+    futures = {
+        executor.submit(fetch_series, project, access_site, granularity): (project, access_site, granularity)
+        for project in projects
+        for access_site in access_sites
+        for granularity in granularities
+    }
+    for future in as_completed(futures):
+        project, access_site, granularity = futures[future]
+        try:
+            df = future.result()
+            if not df.empty:
+                collected.append(df)
+        except requests.exceptions.RequestException as e:
+            print(f"Error fetching data for {project}, {access_site}, {granularity}: {e}")
+
+# Upsert into the local store (duplicates are resolved on the dataset key)
+if collected:
+    with profiler.stage("write"):
+        rows = local_store.upsert_dataset(dataset, pd.concat(collected, ignore_index=True))
+    print(f"Data collection completed. {rows} rows stored in {local_store.dataset_path(dataset)}")
+else:
+    print("Data collection completed. No data returned.")
+
+profiler.finish()
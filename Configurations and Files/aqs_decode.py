@@ -0,0 +1,73 @@
+import json
+from operator import itemgetter
+import numpy as np
+import pandas as pd
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Decoding of AQS responses straight into typed column arrays.
+#
+# The generic path, pd.DataFrame(list of dicts) followed by renames and a
+# reorder, makes pandas infer every column from the records and copy the frame
+# twice more. The response shapes are fixed, so each field here is pulled with
+# a C-level itemgetter into an array of known length and dtype:
+#
+#   data = loads(response.content)       # orjson when installed, else json
+#   n, columns = decode_columns(data, "top")
+#   columns["views"]                     # int64 array of length n
+#
+# Columns come out under the names the collectors store (editors-ceil ->
+# editors, page-title -> article, pageview-count -> views_ceil). A field that
+# is missing or null in any record falls back to a per-record read, giving NaN
+# for the gaps as pd.DataFrame(records, columns=...) did.
+
+# Shape of each response: (path to the record list, [(field, column, dtype)])
+SHAPES = {
+    "aggregate": (("items",), [("timestamp", "timestamp", object), ("views", "views", np.int64)]),
+    "unique_devices": (("items",), [("timestamp", "timestamp", object), ("devices", "devices", np.int64),
+                                    ("offset", "offset", np.int64), ("underestimate", "underestimate", np.int64)]),
+    "editors": (("items", 0, "results"), [("timestamp", "timestamp", object), ("editors", "editors", np.int64)]),
+    "editors_by_country": (("items", 0, "countries"), [("country", "country", object), ("editors-ceil", "editors", np.int64)]),
+    "top": (("items", 0, "articles"), [("article", "article", object), ("views", "views", np.int64),
+                                       ("rank", "rank", np.int64)]),
+    "top_by_country": (("items", 0, "articles"), [("article", "article", object), ("project", "project", object),
+                                                  ("views_ceil", "views_ceil", np.int64), ("rank", "rank", np.int64)]),
+    "commons_top": (("items",), [("page-title", "article", object), ("pageview-count", "views_ceil", np.int64),
+                                 ("rank", "rank", np.int64)]),
+}
+
+
+def loads(content):
+    return orjson.loads(content) if orjson is not None else json.loads(content)
+
+
+def records(data, path):
+    # Follow the shape's path; a missing level means no records
+    for step in path:
+        try:
+            data = data[step]
+        except (KeyError, IndexError, TypeError):
+            return []
+    return data or []
+
+
+def column(rows, field, dtype):
+    count = len(rows)
+    try:
+        return np.fromiter(map(itemgetter(field), rows), dtype=dtype, count=count)
+    except (KeyError, TypeError, ValueError):
+        values = np.fromiter((row.get(field) for row in rows), dtype=object, count=count)
+        return values if dtype is object else pd.to_numeric(values)
+
+
+def decode_columns(data, shape):
+    path, fields = SHAPES[shape]
+    rows = records(data, path)
+    return len(rows), {name: column(rows, field, dtype) for field, name, dtype in fields}
+
+
+def decode(content, shape):
+    return decode_columns(loads(content), shape)
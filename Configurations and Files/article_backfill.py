@@ -0,0 +1,343 @@
+import argparse
+import glob
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime, timedelta, timezone
+import pandas as pd
+import pyarrow.dataset as pads
+import requests
+import local_store
+import wikimedia_api as api
+from article_dictionary import ArticleDictionary, read_top_pages
+from file_lock import locked
+
+# Fan-out from the top-pages lists to full per-article daily histories:
+#
+#   1. derive the deduplicated (project, article) pairs that ever appeared in
+#      most_viewed_pages.csv / top_pages_by_country.csv (and the local store)
+#   2. compare each pair's stored coverage with the wanted date range and plan
+#      requests for the missing head and tail ranges only
+#   3. fetch them through the per-article endpoint with bounded concurrency and
+#      a global request rate, appending the rows to the per-article store
+#
+# The store lives under local_store/article_pageviews/project=<project>/bucket=<n>/
+# as Parquet parts sorted by article id (ids from the shared article dictionary,
+# bucket = id % BUCKETS), so one article's history is read from a single bucket.
+# A bucket's parts are compacted into one once COMPACT_PARTS have piled up, and
+# again at the end of a run; its row group statistics then skip every other article.
+#
+# Coverage has one row per pair in _coverage.parquet; each flush appends the pairs
+# it extended to _coverage/ and the log is folded back in at the end of the run.
+# Coverage is written after the data it describes, so an interrupted run simply
+# resumes: nothing fetched and flushed is requested again.
+#
+#   python article_backfill.py --start 2023-01-01
+#   python article_backfill.py --limit 100 --rate 10     # try it on a few pairs
+
+DATASET = "article_pageviews"
+COVERAGE_FILE = "_coverage.parquet"
+COVERAGE_LOG_DIR = "_coverage"
+BUCKETS = 64
+COMPACT_PARTS = 16
+ROW_GROUP_ROWS = 100_000
+# First day the per-article endpoint has data for
+HISTORY_START = "2015-07-01"
+FLUSH_EVERY = 200
+TOP_LIST_SOURCES = ["most_viewed_pages.csv", "top_pages_by_country.csv"]
+# Title prefixes that are not articles
+SKIP_PREFIXES = ("Special:", "-")
+
+
+class RateLimiter:
+    # At most `rate` acquisitions per second across all threads
+    def __init__(self, rate):
+        self.interval = 1.0 / rate
+        self.next_slot = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot)
+            self.next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+def normalize_project(project):
+    # top-per-country reports "en.wikipedia"; the other endpoints use "en.wikipedia.org"
+    project = str(project)
+    return project if project.endswith(".org") else project + ".org"
+
+
+def top_list_pairs(sources, dictionary):
+    frames = []
+    for path in sources:
+        if os.path.exists(path):
+            frames.append(read_top_pages(path, dictionary)[["project", "article_id"]])
+    for name in ("most_viewed_pages", "top_pages_by_country"):
+        stored = local_store.read_dataset(name, columns=["project", "article_id"])
+        if not stored.empty:
+            frames.append(stored)
+    if not frames:
+        return pd.DataFrame(columns=["project", "article_id"])
+    pairs = pd.concat(frames, ignore_index=True)
+    pairs["project"] = pairs["project"].map(normalize_project)
+    pairs["article_id"] = pairs["article_id"].astype("int32")
+    pairs = pairs.drop_duplicates().reset_index(drop=True)
+    titles = dictionary.decode(pairs["article_id"])
+    return pairs[~titles.str.startswith(SKIP_PREFIXES)].sort_values(by=["project", "article_id"]).reset_index(drop=True)
+
+
+def dataset_dir():
+    return os.path.join(local_store.STORE_DIR, DATASET)
+
+
+def coverage_path():
+    return os.path.join(dataset_dir(), COVERAGE_FILE)
+
+
+def coverage_log_files():
+    return sorted(glob.glob(os.path.join(dataset_dir(), COVERAGE_LOG_DIR, "*.parquet")))
+
+
+def coverage_frame(coverage):
+    rows = [(*key, first, last) for key, (first, last) in coverage.items()]
+    return pd.DataFrame(rows, columns=["project", "access", "agent", "article_id", "first", "last"])
+
+
+def load_coverage():
+    # (project, access, agent, article_id) -> (first day, last day) already fetched
+    coverage = {}
+    paths = ([coverage_path()] if os.path.exists(coverage_path()) else []) + coverage_log_files()
+    for path in paths:
+        for r in pd.read_parquet(path).itertuples(index=False):
+            extend_coverage(coverage, (r.project, r.access, r.agent, int(r.article_id)),
+                            pd.Timestamp(r.first), pd.Timestamp(r.last))
+    return coverage
+
+
+def append_coverage(coverage, keys):
+    # Log the current ranges of the pairs extended since the last flush
+    if not keys:
+        return
+    directory = os.path.join(dataset_dir(), COVERAGE_LOG_DIR)
+    os.makedirs(directory, exist_ok=True)
+    name = f"{time.time_ns()}.parquet"
+    tmp_path = os.path.join(directory, "." + name + ".tmp")
+    coverage_frame({key: coverage[key] for key in keys}).to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, os.path.join(directory, name))
+
+
+def save_coverage(coverage):
+    # Fold the log into _coverage.parquet; only log files read before the write are removed
+    logged = coverage_log_files()
+    os.makedirs(dataset_dir(), exist_ok=True)
+    tmp_path = coverage_path() + ".tmp"
+    coverage_frame(coverage).to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, coverage_path())
+    for path in logged:
+        os.remove(path)
+
+
+def missing_ranges(covered, start, end):
+    # Coverage is one contiguous range per pair, so at most a head and a tail are
+    # missing. A window that does not touch the covered range is widened up to it,
+    # so the coverage stays contiguous after these ranges are fetched
+    if covered is None:
+        return [(start, end)] if start <= end else []
+    first, last = covered
+    ranges = []
+    if start < first:
+        ranges.append((start, first - timedelta(days=1)))
+    if end > last:
+        ranges.append((last + timedelta(days=1), end))
+    return ranges
+
+
+def plan_tasks(pairs, coverage, access, agent, start, end):
+    tasks = []
+    for project, article_id in pairs.itertuples(index=False):
+        key = (project, access, agent, int(article_id))
+        for first, last in missing_ranges(coverage.get(key), start, end):
+            tasks.append((key, first, last))
+    return tasks
+
+
+def fetch_range(task, titles, limiter, session):
+    (project, access, agent, article_id), first, last = task
+    limiter.acquire()
+    try:
+        return api.fetch_article_pageviews(project, access, agent, titles[article_id], "daily",
+                                           first.strftime("%Y%m%d00"), last.strftime("%Y%m%d00"), session)
+    except requests.exceptions.HTTPError as e:
+        # 404: no views in the range (or the page does not exist); nothing to fetch again
+        if e.response is not None and e.response.status_code == 404:
+            return pd.DataFrame(columns=api.COLUMNS["article_pageviews"])
+        raise
+
+
+def extend_coverage(coverage, key, first, last):
+    covered = coverage.get(key)
+    coverage[key] = (first, last) if covered is None else (min(first, covered[0]), max(last, covered[1]))
+
+
+def bucket_partition(project, article_id):
+    return {"project": project, "bucket": int(article_id) % BUCKETS}
+
+
+def write_sorted_part(partition, rows, part):
+    rows = rows.sort_values(by=["article_id", "access", "agent", "timestamp"]).reset_index(drop=True)
+    directory = local_store.partition_path(DATASET, partition)
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"part-{part}.parquet")
+    tmp_path = os.path.join(directory, f".part-{part}.parquet.tmp")
+    rows.to_parquet(tmp_path, index=False, row_group_size=ROW_GROUP_ROWS)
+    os.replace(tmp_path, path)
+
+
+def write_buckets(project, df, part):
+    # df: rows of one project with article ids; returns the bucket directories written
+    buckets = df["article_id"].astype("int64") % BUCKETS
+    written = []
+    for bucket, rows in df.groupby(buckets):
+        partition = {"project": project, "bucket": int(bucket)}
+        write_sorted_part(partition, rows, part)
+        written.append(local_store.partition_path(DATASET, partition))
+    return written
+
+
+def compact_bucket(directory, min_parts=2):
+    # Merge a bucket's parts into one sorted part; an interrupted compaction only
+    # leaves duplicate rows, which readers drop
+    with locked(directory):
+        parts = glob.glob(os.path.join(directory, "*.parquet"))
+        if len(parts) < min_parts:
+            return
+        df = pd.concat([pd.read_parquet(path) for path in parts], ignore_index=True)
+        df = df.drop_duplicates(subset=["article_id", "access", "agent", "timestamp"], keep="last")
+        partition = dict(segment.split("=", 1) for segment in os.path.relpath(directory, dataset_dir()).split(os.sep))
+        write_sorted_part(partition, df, f"{time.time_ns()}")
+        for path in parts:
+            os.remove(path)
+
+
+def compact_all():
+    # Move parts written before bucketing (directly under project=<project>/) into
+    # their buckets, then compact every bucket
+    for project_dir in glob.glob(os.path.join(dataset_dir(), "project=*")):
+        project = os.path.basename(project_dir).split("=", 1)[1]
+        for path in glob.glob(os.path.join(project_dir, "*.parquet")):
+            write_buckets(project, pd.read_parquet(path), f"{time.time_ns()}")
+            os.remove(path)
+        for directory in filter(os.path.isdir, glob.glob(os.path.join(project_dir, "bucket=*"))):
+            compact_bucket(directory)
+
+
+def flush(pending, coverage, extended, dictionary):
+    frames = [df for df in pending if not df.empty]
+    if frames:
+        df = pd.concat(frames, ignore_index=True)
+        # encode() appends new ids to the dictionary file before returning, so they
+        # are on disk before any part or coverage refers to them
+        df["article_id"] = dictionary.encode(df.pop("article"))
+        part = f"{time.time_ns()}"
+        for project, rows in df.groupby("project"):
+            for directory in write_buckets(project, rows.drop(columns="project"), part):
+                compact_bucket(directory, COMPACT_PARTS)
+    # Dictionary and data first, then the coverage that describes them
+    append_coverage(coverage, extended)
+
+
+def run_backfill(sources, start, end, access="all-access", agent="user", workers=8, rate=25.0, limit=None):
+    dictionary = ArticleDictionary()
+    pairs = top_list_pairs(sources, dictionary)
+    if limit:
+        pairs = pairs.head(limit)
+    coverage = load_coverage()
+    tasks = plan_tasks(pairs, coverage, access, agent, start, end)
+    print(f"{len(pairs)} (project, article) pairs, {len(tasks)} missing ranges to fetch")
+
+    titles = dictionary.titles
+    limiter = RateLimiter(rate)
+    session = requests.Session()
+    pending, done, failed = [], 0, 0
+    # Pairs whose coverage changed since the last flush
+    extended = set()
+    task_iter = iter(tasks)
+    in_flight = {}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        # Keep a bounded window of submitted tasks instead of queueing all of them
+        while True:
+            while len(in_flight) < workers * 4:
+                task = next(task_iter, None)
+                if task is None:
+                    break
+                in_flight[executor.submit(fetch_range, task, titles, limiter, session)] = task
+            if not in_flight:
+                break
+            finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in finished:
+                key, first, last = in_flight.pop(future)
+                try:
+                    pending.append(future.result())
+                except requests.exceptions.RequestException as e:
+                    failed += 1
+                    print(f"Error fetching {key[0]} {titles[key[3]]} {first.date()}..{last.date()}: {e}")
+                    continue
+                extend_coverage(coverage, key, first, last)
+                extended.add(key)
+                done += 1
+                if done % FLUSH_EVERY == 0:
+                    flush(pending, coverage, extended, dictionary)
+                    pending = []
+                    extended = set()
+                    print(f"{done}/{len(tasks)} ranges fetched, {failed} failed")
+    flush(pending, coverage, extended, dictionary)
+    compact_all()
+    save_coverage(coverage)
+    print(f"Backfill finished: {done} ranges fetched, {failed} failed (rerun to retry)")
+    return done, failed
+
+
+def read_article_history(project, article, dictionary=None):
+    # Daily history of one article from the per-article store; pass a long-lived
+    # dictionary when calling this per query
+    empty = pd.DataFrame(columns=["access", "agent", "timestamp", "views"])
+    directory = local_store.partition_path(DATASET, {"project": project})
+    if not os.path.isdir(directory):
+        return empty
+    dictionary = dictionary if dictionary is not None else ArticleDictionary()
+    article_id = dictionary.lookup(article)
+    if article_id is None:
+        return empty
+    # The article's bucket, plus any parts from before bucketing not yet moved into one
+    paths = glob.glob(os.path.join(directory, "*.parquet"))
+    paths += glob.glob(os.path.join(local_store.partition_path(DATASET, bucket_partition(project, article_id)), "*.parquet"))
+    if not paths:
+        return empty
+    dataset = pads.dataset(paths, format="parquet")
+    df = dataset.to_table(filter=pads.field("article_id") == article_id).to_pandas()
+    keys = ["access", "agent", "timestamp"]
+    # An interrupted flush can leave rows whose coverage was never recorded; they
+    # are fetched again, so keep one copy
+    return df.drop(columns="article_id").drop_duplicates(subset=keys, keep="last").sort_values(by=keys).reset_index(drop=True)
+
+
+if __name__ == "__main__":
+    yesterday = (datetime.now(timezone.utc) - timedelta(days=1)).strftime("%Y-%m-%d")
+    parser = argparse.ArgumentParser(description="Backfill the daily history of every article in the top-pages lists.")
+    parser.add_argument("--sources", nargs="*", default=TOP_LIST_SOURCES, help="top-pages CSVs to take articles from")
+    parser.add_argument("--start", default=HISTORY_START, help="first day of history (YYYY-MM-DD)")
+    parser.add_argument("--end", default=yesterday, help="last day of history (YYYY-MM-DD)")
+    parser.add_argument("--access", default="all-access")
+    parser.add_argument("--agent", default="user")
+    parser.add_argument("--workers", type=int, default=8, help="concurrent requests")
+    parser.add_argument("--rate", type=float, default=25.0, help="maximum requests per second")
+    parser.add_argument("--limit", type=int, help="only backfill the first N pairs")
+    args = parser.parse_args()
+
+    run_backfill(args.sources, pd.Timestamp(args.start), pd.Timestamp(args.end), args.access, args.agent,
+                 args.workers, args.rate, args.limit)
@@ -0,0 +1,133 @@
+import io
+import os
+import threading
+import numpy as np
+import pandas as pd
+from file_lock import locked
+
+# Global article dictionary (title -> int32 id) shared by the top-pages datasets:
+# most_viewed_pages.csv, top_pages_by_country.csv and top_pages_by_category.csv
+# store an "article_id" column instead of repeating the full title on every row.
+# Ids are append-only, so an id never changes once it has been handed out.
+#
+# Several processes can add titles at once (collectors, refresh_daemon,
+# article_backfill, spark_pipeline). New ids are assigned under a file lock,
+# after reading the rows other processes appended, and are appended to the CSV
+# before the lock is released, so every id is on disk before it is used.
+# A loaded dictionary picks up other processes' ids when it meets one it does not
+# know, so one instance can be kept for the life of a server and shared by its
+# threads.
+
+# Set WIKI_ARTICLE_DICTIONARY to use another dictionary, e.g. a synthetic store's
+dictionary_csv = os.environ.get(
+    "WIKI_ARTICLE_DICTIONARY", os.path.join(os.path.dirname(os.path.abspath(__file__)), "article_dictionary.csv"))
+
+
+class ArticleDictionary:
+    def __init__(self, path=dictionary_csv):
+        self.path = path
+        self.titles = []
+        self.ids = {}
+        # Bytes of the file read so far; later rows were appended by other processes
+        self._offset = 0
+        self._read_lock = threading.Lock()
+        with locked(path, shared=True):
+            self._read_appended()
+
+    def __len__(self):
+        return len(self.titles)
+
+    def _read_appended(self):
+        if not os.path.exists(self.path):
+            return
+        with self._read_lock:
+            with open(self.path, "rb") as f:
+                f.seek(self._offset)
+                data = f.read()
+            if not data:
+                return
+            # keep_default_na=False so titles like "NaN" or "Null" stay strings
+            header = 0 if self._offset == 0 else None
+            df = pd.read_csv(io.BytesIO(data), header=header, names=["article_id", "article"],
+                             dtype={"article_id": "int32", "article": str}, keep_default_na=False)
+            df = df.sort_values(by="article_id")
+            first = len(self.titles)
+            if not np.array_equal(df["article_id"].to_numpy(), np.arange(first, first + len(df))):
+                raise ValueError(f"{self.path}: article ids are not contiguous from {first}")
+            titles = df["article"].tolist()
+            self.ids.update(zip(titles, range(first, first + len(titles))))
+            self.titles.extend(titles)
+            self._offset += len(data)
+
+    def _append(self, titles):
+        with locked(self.path):
+            self._read_appended()
+            titles = [title for title in dict.fromkeys(titles) if title not in self.ids]
+            if not titles:
+                return
+            first = len(self.titles)
+            df = pd.DataFrame({"article_id": np.arange(first, first + len(titles), dtype=np.int32), "article": titles})
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            with open(self.path, "a", newline="") as f:
+                df.to_csv(f, index=False, header=f.tell() == 0)
+                f.flush()
+                os.fsync(f.fileno())
+            self._read_appended()
+
+    def lookup(self, title):
+        # Id of one title, or None; rereads the file for titles added since loading
+        if title not in self.ids:
+            with locked(self.path, shared=True):
+                self._read_appended()
+        return self.ids.get(title)
+
+    def encode(self, titles):
+        # Factorize first so the Python-level loop only runs once per distinct title
+        codes, uniques = pd.factorize(pd.Series(titles, dtype=str), use_na_sentinel=False)
+        new = [title for title in uniques if title not in self.ids]
+        if new:
+            self._append(new)
+        unique_ids = np.fromiter((self.ids[title] for title in uniques), dtype=np.int32, count=len(uniques))
+        return pd.Series(unique_ids[codes], index=getattr(titles, "index", None), dtype="int32")
+
+    def decode(self, article_ids):
+        ids = np.asarray(article_ids, dtype=np.int64)
+        if len(ids) and ids.max() >= len(self.titles):
+            # Ids handed out by another process after this dictionary was loaded
+            with locked(self.path, shared=True):
+                self._read_appended()
+        lookup = np.asarray(self.titles, dtype=object)
+        values = lookup[ids]
+        return pd.Series(values, index=getattr(article_ids, "index", None), dtype=object)
+
+
+def encode_article_column(df, dictionary):
+    # Replace the "article" column with "article_id", keeping the column position
+    if "article" not in df.columns:
+        return df
+    df = df.copy()
+    df["article"] = dictionary.encode(df["article"])
+    return df.rename(columns={"article": "article_id"})
+
+
+def decode_article_column(df, dictionary):
+    # Inverse of encode_article_column, for readers that want titles back
+    if "article_id" not in df.columns:
+        return df
+    df = df.copy()
+    df["article_id"] = dictionary.decode(df["article_id"])
+    return df.rename(columns={"article_id": "article"})
+
+
+def read_top_pages(path, dictionary=None, decode=False):
+    # Read one of the top-pages CSVs with compact dtypes; older files that still
+    # carry full titles are converted to ids on the fly
+    df = pd.read_csv(path, dtype={"article_id": "int32"}, keep_default_na=False, na_values=[""])
+    if dictionary is None:
+        dictionary = ArticleDictionary()
+    if "article" in df.columns:
+        df["article"] = df["article"].astype(str)
+        df = encode_article_column(df, dictionary)
+    if decode:
+        df = decode_article_column(df, dictionary)
+    return df
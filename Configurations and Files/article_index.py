@@ -0,0 +1,97 @@
+import bisect
+from collections import defaultdict
+import numpy as np
+from article_dictionary import ArticleDictionary
+
+# Prefix + trigram index over every article title seen in the collected
+# top-pages datasets (via the shared article dictionary). Backs the article
+# autocomplete in the dashboard and normalizes titles before they are sent
+# to the per-article endpoint.
+
+
+def normalize_title(title):
+    # MediaWiki canonical form: trimmed, single underscores instead of
+    # spaces, first letter upper-cased
+    title = "_".join(str(title).replace("_", " ").split())
+    if not title:
+        return title
+    return title[0].upper() + title[1:]
+
+
+def _search_key(title):
+    return normalize_title(title).lower()
+
+
+def _trigrams(key):
+    padded = f"  {key} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class ArticleIndex:
+    def __init__(self, titles):
+        self.titles = list(dict.fromkeys(normalize_title(t) for t in titles if str(t).strip()))
+        keys = [t.lower() for t in self.titles]
+
+        # Sorted keys for prefix lookups with bisect
+        order = sorted(range(len(keys)), key=keys.__getitem__)
+        self._sorted_keys = [keys[i] for i in order]
+        self._sorted_ids = np.asarray(order, dtype=np.int32)
+
+        # Trigram -> title ids, for typo-tolerant matches
+        postings = defaultdict(list)
+        for title_id, key in enumerate(keys):
+            for gram in _trigrams(key):
+                postings[gram].append(title_id)
+        self._postings = {gram: np.asarray(ids, dtype=np.int32) for gram, ids in postings.items()}
+
+    def __len__(self):
+        return len(self.titles)
+
+    def __contains__(self, title):
+        key = _search_key(title)
+        i = bisect.bisect_left(self._sorted_keys, key)
+        return i < len(self._sorted_keys) and self._sorted_keys[i] == key
+
+    def prefix(self, query, limit=10):
+        key = _search_key(query)
+        if not key:
+            return []
+        start = bisect.bisect_left(self._sorted_keys, key)
+        # Every key that starts with `key` sorts before key + U+10FFFF
+        stop = bisect.bisect_left(self._sorted_keys, key + "\U0010ffff", lo=start)
+        ids = self._sorted_ids[start:stop]
+        # Shorter titles first: "Paris" before "Paris_Saint-Germain_F.C."
+        ids = sorted(ids, key=lambda i: (len(self.titles[i]), self.titles[i]))[:limit]
+        return [self.titles[i] for i in ids]
+
+    def fuzzy(self, query, limit=10, min_similarity=0.3):
+        key = _search_key(query)
+        grams = _trigrams(key)
+        lists = [self._postings[g] for g in grams if g in self._postings]
+        if not lists:
+            return []
+        ids, shared = np.unique(np.concatenate(lists), return_counts=True)
+        # Jaccard similarity between the query's and each title's trigram sets
+        sizes = np.fromiter((len(self.titles[i]) + 1 for i in ids), dtype=np.int32, count=len(ids))
+        similarity = shared / (len(grams) + sizes - shared)
+        keep = similarity >= min_similarity
+        ids, similarity = ids[keep], similarity[keep]
+        best = np.argsort(-similarity, kind="stable")[:limit]
+        return [self.titles[i] for i in ids[best]]
+
+    def suggest(self, query, limit=10):
+        # Prefix matches first, then fuzzy matches to fill the list
+        suggestions = self.prefix(query, limit)
+        if len(suggestions) < limit:
+            for title in self.fuzzy(query, limit):
+                if title not in suggestions:
+                    suggestions.append(title)
+                if len(suggestions) == limit:
+                    break
+        return suggestions
+
+
+def build_article_index(dictionary=None):
+    if dictionary is None:
+        dictionary = ArticleDictionary()
+    return ArticleIndex(dictionary.titles)
@@ -0,0 +1,157 @@
+import argparse
+import os
+from functools import lru_cache
+import numpy as np
+import pandas as pd
+from scipy import sparse
+import local_store
+from article_dictionary import ArticleDictionary, read_top_pages
+
+# GLAM impact index over top_pages_by_category: for every (scope, wiki, month) a
+# sparse category x article matrix of views_ceil, its article x category
+# transpose, and per-category totals, so
+#   - "which categories drive traffic to article X" is one CSR row of the transpose
+#   - "top categories on a wiki" is a sort of the precomputed totals
+#   - "top articles of a category" is one CSR row of the matrix
+# without scanning the long (category, scope, wiki, month, article) rows.
+#
+# Stored as local_store/category_index/<scope>/<wiki>/<YYYY-MM>.npz
+#
+#   python category_index.py                          # index every month in the CSV
+#   python category_index.py --months 2024-01 2024-02  # rebuild only these months
+
+INDEX_DIR = os.path.join(local_store.STORE_DIR, "category_index")
+
+
+def index_path(scope, wiki, month):
+    return os.path.join(INDEX_DIR, scope, wiki, f"{month}.npz")
+
+
+def month_keys(df):
+    return df["year"].astype(str) + "-" + df["month"].astype(str).str.zfill(2)
+
+
+def build_month_index(df):
+    # df: rows of one (scope, wiki, month); article_id encoded
+    categories, rows = np.unique(df["category"].to_numpy(dtype=str), return_inverse=True)
+    article_ids, columns = np.unique(df["article_id"].to_numpy(dtype=np.int32), return_inverse=True)
+    views = df["views_ceil"].to_numpy(dtype=np.int64)
+    by_category = sparse.csr_matrix((views, (rows, columns)), shape=(len(categories), len(article_ids)))
+    by_category.sum_duplicates()
+    return {
+        "categories": categories,
+        "article_ids": article_ids,
+        "by_category": by_category,
+        "by_article": by_category.T.tocsr(),
+        "totals": np.asarray(by_category.sum(axis=1)).ravel(),
+    }
+
+
+def save_month_index(path, index):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    arrays = {"categories": index["categories"], "article_ids": index["article_ids"], "totals": index["totals"]}
+    for name in ("by_category", "by_article"):
+        matrix = index[name]
+        arrays.update({f"{name}_data": matrix.data, f"{name}_indices": matrix.indices,
+                       f"{name}_indptr": matrix.indptr, f"{name}_shape": np.asarray(matrix.shape)})
+    tmp_path = path + ".tmp.npz"
+    np.savez_compressed(tmp_path, **arrays)
+    os.replace(tmp_path, path)
+
+
+def load_month_index(scope, wiki, month):
+    path = index_path(scope, wiki, month)
+    try:
+        modified = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+    # The file's mtime is part of the cache key, so a month rebuilt by another
+    # process (the refresh daemon) is read again instead of served stale
+    return read_month_index(path, modified)
+
+
+@lru_cache(maxsize=64)
+def read_month_index(path, modified):
+    with np.load(path) as data:
+        index = {"categories": data["categories"], "article_ids": data["article_ids"], "totals": data["totals"]}
+        for name in ("by_category", "by_article"):
+            index[name] = sparse.csr_matrix(
+                (data[f"{name}_data"], data[f"{name}_indices"], data[f"{name}_indptr"]),
+                shape=tuple(data[f"{name}_shape"]))
+    index["category_rows"] = {c: i for i, c in enumerate(index["categories"])}
+    return index
+
+
+def build_index(df, months=None):
+    # Rebuilds every (scope, wiki, month) present in df, or only the given months
+    df = df.assign(month_key=month_keys(df))
+    if months is not None:
+        df = df[df["month_key"].isin(months)]
+    built = 0
+    for (scope, wiki, month), part in df.groupby(["category_scope", "wiki", "month_key"]):
+        save_month_index(index_path(scope, wiki, month), build_month_index(part))
+        built += 1
+    read_month_index.cache_clear()
+    return built
+
+
+def update_index(months):
+    # Incremental entry point for the refresh daemon: rebuild the given months
+    # from the local store
+    df = local_store.read_dataset("top_pages_by_category")
+    return build_index(df, months) if not df.empty else 0
+
+
+def indexed_wikis(scope):
+    directory = os.path.join(INDEX_DIR, scope)
+    return sorted(os.listdir(directory)) if os.path.isdir(directory) else []
+
+
+def indexed_months(scope, wiki):
+    directory = os.path.join(INDEX_DIR, scope, wiki)
+    if not os.path.isdir(directory):
+        return []
+    return sorted((f[:-len(".npz")] for f in os.listdir(directory) if f.endswith(".npz")), reverse=True)
+
+
+def top_categories(scope, wiki, month, k=20):
+    index = load_month_index(scope, wiki, month)
+    if index is None:
+        return pd.DataFrame(columns=["category", "views"])
+    best = np.argsort(-index["totals"], kind="stable")[:k]
+    return pd.DataFrame({"category": index["categories"][best], "views": index["totals"][best]})
+
+
+def categories_for_article(scope, wiki, month, article_id, k=20):
+    # Categories whose files drove views to the article, by views
+    index = load_month_index(scope, wiki, month)
+    if index is None:
+        return pd.DataFrame(columns=["category", "views"])
+    column = np.searchsorted(index["article_ids"], article_id)
+    if column >= len(index["article_ids"]) or index["article_ids"][column] != article_id:
+        return pd.DataFrame(columns=["category", "views"])
+    row = index["by_article"].getrow(column)
+    best = np.argsort(-row.data, kind="stable")[:k]
+    return pd.DataFrame({"category": index["categories"][row.indices[best]], "views": row.data[best]})
+
+
+def top_articles(scope, wiki, month, category, k=20):
+    # (article_id, views) of the category's most viewed articles
+    index = load_month_index(scope, wiki, month)
+    if index is None or category not in index["category_rows"]:
+        return pd.DataFrame(columns=["article_id", "views"])
+    row = index["by_category"].getrow(index["category_rows"][category])
+    best = np.argsort(-row.data, kind="stable")[:k]
+    return pd.DataFrame({"article_id": index["article_ids"][row.indices[best]], "views": row.data[best]})
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the Commons category x article impact index.")
+    parser.add_argument("--csv", default="top_pages_by_category.csv", help="collector output to index")
+    parser.add_argument("--months", nargs="*", help="rebuild only these months (YYYY-MM)")
+    args = parser.parse_args()
+
+    dictionary = ArticleDictionary()
+    df = read_top_pages(args.csv, dictionary)
+    built = build_index(df, args.months)
+    print(f"Indexed {built} (scope, wiki, month) partitions into {INDEX_DIR}")
@@ -0,0 +1,187 @@
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter, defaultdict
+from contextlib import nullcontext
+from datetime import datetime
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Profiling for the Script_* collectors, enabled with their --profile flag:
+#
+#   python Script_pageviews.py --profile
+#
+# While it runs, three things are recorded:
+#   - per-stage timers: each `with profiler.stage("fetch"):` block adds to its
+#     stage's call count, wall time and memory (net and peak Python allocations)
+#   - a sampling CPU profile: a background thread records the stacks of the main
+#     thread and of any thread inside a stage every SAMPLE_INTERVAL seconds,
+#     rooted at the open stages
+#   - tracemalloc snapshots at start and finish, diffed by allocation site
+#
+# finish() prints a summary table and writes to profiles/:
+#   <collector>-<time>.collapsed    folded stacks ("a;b;c count") for
+#                                   flamegraph.pl, speedscope or inferno
+#   <collector>-<time>.memory.txt   top allocation sites still held at the end
+#   <collector>-<time>.summary.txt  the summary table
+#
+# Stage times are exclusive of the stages nested inside them. Stages run by
+# several threads at once add up their time, so their share can exceed 100%,
+# and their memory figures overlap. Samples are wall-clock, so time spent
+# waiting on the network shows up under "fetch". Worker processes (mediacounts,
+# dump parsing) are not sampled; their time appears as the parent waiting.
+# Without --profile, stage() returns a shared no-op context and nothing is recorded.
+
+PROFILE_DIR = "profiles"
+SAMPLE_INTERVAL = 0.005
+TRACEMALLOC_FRAMES = 25
+TOP_ALLOCATIONS = 25
+NO_STAGE = "(no stage)"
+
+_disabled_stage = nullcontext()
+
+
+def frame_label(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class StageTimer:
+    # Time and memory of one stage; a stage entered inside another is subtracted
+    # from its parent, so the table's times add up to the run
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.stack = self.profiler.stage_stack()
+        current, peak = tracemalloc.get_traced_memory()
+        if self.stack:
+            # reset_peak below would lose the parent's peak so far
+            self.stack[-1].peak = max(self.stack[-1].peak, peak)
+        tracemalloc.reset_peak()
+        self.memory_before = self.peak = current
+        self.child_seconds = 0.0
+        self.child_bytes = 0
+        self.stack.append(self)
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        seconds = time.perf_counter() - self.started
+        current, peak = tracemalloc.get_traced_memory()
+        self.peak = max(self.peak, peak)
+        self.stack.pop()
+        net_bytes = current - self.memory_before
+        with self.profiler.lock:
+            stats = self.profiler.stages[self.name]
+            stats["calls"] += 1
+            stats["seconds"] += seconds - self.child_seconds
+            stats["net_bytes"] += net_bytes - self.child_bytes
+            stats["peak_bytes"] = max(stats["peak_bytes"], self.peak - self.memory_before)
+        if self.stack:
+            parent = self.stack[-1]
+            parent.child_seconds += seconds
+            parent.child_bytes += net_bytes
+            parent.peak = max(parent.peak, self.peak)
+        return False
+
+
+class CollectorProfiler:
+    def __init__(self, name, enabled=False, output_dir=PROFILE_DIR):
+        self.name = name
+        self.enabled = enabled
+        self.output_dir = output_dir
+        self.stages = defaultdict(lambda: {"calls": 0, "seconds": 0.0, "net_bytes": 0, "peak_bytes": 0})
+        self.samples = Counter()
+        # Open stages of every thread, innermost last
+        self.stacks = {}
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        if enabled:
+            self.start()
+
+    def start(self):
+        tracemalloc.start(TRACEMALLOC_FRAMES)
+        self.first_snapshot = tracemalloc.take_snapshot()
+        self.started = time.perf_counter()
+        self.main_thread_id = threading.main_thread().ident
+        self.sampler = threading.Thread(target=self._sample, name="collector-profiler", daemon=True)
+        self.sampler.start()
+
+    def stage(self, name):
+        return StageTimer(self, name) if self.enabled else _disabled_stage
+
+    def stage_stack(self):
+        return self.stacks.setdefault(threading.get_ident(), [])
+
+    def _sample(self):
+        sampler_id = threading.get_ident()
+        while not self.stopped.wait(SAMPLE_INTERVAL):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                stages = [f"[{stage.name}]" for stage in list(self.stacks.get(thread_id, []))]
+                # Idle pool threads are skipped; the main thread is always sampled
+                if thread_id == sampler_id or (thread_id != self.main_thread_id and not stages):
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(frame_label(frame))
+                    frame = frame.f_back
+                root = stages or [f"[{NO_STAGE}]"]
+                if thread_id != self.main_thread_id:
+                    root.append(f"thread {names.get(thread_id, thread_id)}")
+                self.samples[";".join(root + stack[::-1])] += 1
+
+    def summary(self, total_seconds):
+        lines = [f"{'stage':<14}{'calls':>8}{'total s':>10}{'mean ms':>10}{'% run':>8}{'net MB':>10}{'peak MB':>10}"]
+        for name, stats in sorted(self.stages.items(), key=lambda item: -item[1]["seconds"]):
+            lines.append(f"{name:<14}{stats['calls']:>8}{stats['seconds']:>10.2f}"
+                         f"{stats['seconds'] / stats['calls'] * 1000:>10.1f}{stats['seconds'] / total_seconds * 100:>7.1f}%"
+                         f"{stats['net_bytes'] / 2**20:>10.1f}{stats['peak_bytes'] / 2**20:>10.1f}")
+        staged = sum(stats["seconds"] for stats in self.stages.values())
+        if staged <= total_seconds:
+            unstaged = total_seconds - staged
+            lines.append(f"{NO_STAGE:<14}{'':>8}{unstaged:>10.2f}{'':>10}{unstaged / total_seconds * 100:>7.1f}%")
+        else:
+            lines.append(f"stages ran in parallel threads: {staged / total_seconds:.1f}x the wall time")
+        current = tracemalloc.get_traced_memory()[0]
+        lines.append(f"run {total_seconds:.2f} s, {sum(self.samples.values())} CPU samples, "
+                     f"Python heap at the end {current / 2**20:.1f} MB"
+                     + (f", max RSS {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.1f} MB" if resource else ""))
+        return "\n".join(lines)
+
+    def finish(self):
+        if not self.enabled:
+            return None
+        total_seconds = time.perf_counter() - self.started
+        self.stopped.set()
+        self.sampler.join()
+        last_snapshot = tracemalloc.take_snapshot()
+        summary = self.summary(total_seconds)
+        tracemalloc.stop()
+
+        os.makedirs(self.output_dir, exist_ok=True)
+        prefix = os.path.join(self.output_dir, f"{self.name}-{datetime.now().strftime('%Y%m%d-%H%M%S')}")
+        with open(prefix + ".collapsed", "w") as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{stack} {count}\n")
+        ignore = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, "<frozen importlib._bootstrap*>")]
+        with open(prefix + ".memory.txt", "w") as f:
+            f.write(f"Allocations held at the end of the run, by site (top {TOP_ALLOCATIONS})\n\n")
+            diff = last_snapshot.filter_traces(ignore).compare_to(self.first_snapshot.filter_traces(ignore), "traceback")
+            for stat in diff[:TOP_ALLOCATIONS]:
+                f.write(f"{stat.size_diff / 2**20:+.2f} MB in {stat.count_diff:+d} blocks\n")
+                f.write("\n".join(f"    {line}" for line in stat.traceback.format(limit=8, most_recent_first=True)) + "\n\n")
+        with open(prefix + ".summary.txt", "w") as f:
+            f.write(summary + "\n")
+
+        print(f"\nProfile of {self.name}\n{summary}")
+        print(f"Flamegraph stacks: {prefix}.collapsed (e.g. flamegraph.pl {prefix}.collapsed > {self.name}.svg)")
+        print(f"Allocation sites: {prefix}.memory.txt")
+        return prefix
@@ -0,0 +1,147 @@
+import argparse
+import numpy as np
+import pandas as pd
+from scipy import sparse
+import local_store
+from article_dictionary import read_top_pages
+
+# Which countries read the same articles: for every day and every month, a sparse
+# country x article matrix (SciPy CSR) is built from top_pages_by_country and all
+# pairwise similarities come out of one sparse product M @ M.T:
+#   - jaccard: overlap of the top-article sets, |A & B| / |A | B|
+#   - cosine:  angle between the views_ceil vectors
+#
+# Articles are (project, article) pairs, so en "Taylor_Swift" and de
+# "Taylor_Swift" are different columns, and only the lists for one access method
+# (ACCESS) are used: all-access already contains the desktop and mobile views, so
+# summing across access methods would count the same views twice.
+#
+# Results are materialized in the local store as "country_similarity" (both
+# orders of every pair, so "countries most like X" is a single filter). Updates
+# are incremental: only the given days, and the months they fall in, are
+# recomputed.
+#
+#   python country_similarity.py                  # days not yet materialized
+#   python country_similarity.py --full           # recompute everything
+#   python country_similarity.py --days 2024-01-05 2024-01-06
+
+DATASET = "country_similarity"
+# The access method the collectors and the refresh daemon fetch top pages for
+ACCESS = "desktop"
+
+
+def with_periods(df):
+    day = df["day"].astype(str).str.zfill(2) if "day" in df.columns else "01"
+    month = df["year"].astype(str) + "-" + df["month"].astype(str).str.zfill(2)
+    return df.assign(period_month=month, period_day=month + "-" + day)
+
+
+def country_article_matrix(df, weight_column="views_ceil"):
+    # Rows: countries (sorted), columns: (project, article) pairs present in df;
+    # duplicate (country, pair) entries, e.g. over the days of a month, are summed
+    countries, rows = np.unique(df["country"].to_numpy(dtype=str), return_inverse=True)
+    columns = df.groupby(["project", "article_id"], sort=False).ngroup().to_numpy()
+    weights = df[weight_column].to_numpy(dtype=np.float64)
+    matrix = sparse.csr_matrix((weights, (rows, columns)), shape=(len(countries), columns.max() + 1))
+    matrix.sum_duplicates()
+    return countries, matrix
+
+
+def pairwise_similarity(matrix):
+    # One product per measure; the country axis is small, so results are dense
+    binary = (matrix > 0).astype(np.float64)
+    overlap = (binary @ binary.T).toarray()
+    sizes = np.diag(overlap)
+    union = sizes[:, None] + sizes[None, :] - overlap
+    jaccard = np.divide(overlap, union, out=np.zeros_like(overlap), where=union > 0)
+
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    inverse = np.divide(1.0, norms, out=np.zeros_like(norms), where=norms > 0)
+    normalized = sparse.diags(inverse) @ matrix
+    cosine = (normalized @ normalized.T).toarray()
+    return overlap, jaccard, cosine
+
+
+def similarity_frame(df, granularity, period):
+    countries, matrix = country_article_matrix(df)
+    overlap, jaccard, cosine = pairwise_similarity(matrix)
+    a, b = np.nonzero(~np.eye(len(countries), dtype=bool))
+    return pd.DataFrame({
+        "granularity": granularity,
+        "period": period,
+        "country_a": countries[a],
+        "country_b": countries[b],
+        "shared_articles": overlap[a, b].astype(np.int64),
+        "jaccard": jaccard[a, b],
+        "cosine": cosine[a, b],
+    })
+
+
+def compute_similarity(source, days=None):
+    # source: top_pages_by_country rows (article_id encoded). days: "YYYY-MM-DD"
+    # strings to recompute, with their months; None recomputes every period
+    source = with_periods(source[source["access"] == ACCESS])
+    if days is None:
+        days = source["period_day"].unique()
+    days = sorted(set(days))
+    months = sorted({day[:7] for day in days})
+
+    frames = []
+    for day, part in source[source["period_day"].isin(days)].groupby("period_day"):
+        frames.append(similarity_frame(part, "daily", day))
+    for month, part in source[source["period_month"].isin(months)].groupby("period_month"):
+        frames.append(similarity_frame(part, "monthly", month))
+    if not frames:
+        return pd.DataFrame(columns=local_store.DATASET_KEYS[DATASET] + ["shared_articles", "jaccard", "cosine"])
+    return pd.concat(frames, ignore_index=True)
+
+
+def materialized_days():
+    stored = local_store.read_dataset(DATASET, columns=["granularity", "period"], filters=[("granularity", "==", "daily")])
+    return set(stored["period"]) if not stored.empty else set()
+
+
+def update_similarity(days=None, source=None):
+    # Incremental entry point, also used by the refresh daemon after it stores new
+    # top-pages rows. Defaults to the rows in the local store.
+    if source is None:
+        source = local_store.read_dataset("top_pages_by_country", filters=[("access", "==", ACCESS)])
+    if source.empty:
+        return 0
+    result = compute_similarity(source, days)
+    local_store.upsert_dataset(DATASET, result)
+    return len(result)
+
+
+def read_similarity(granularity, period, country=None):
+    filters = [("granularity", "==", granularity), ("period", "==", period)]
+    if country is not None:
+        filters.append(("country_a", "==", country))
+    return local_store.read_dataset(DATASET, filters=filters)
+
+
+def list_periods(granularity):
+    stored = local_store.read_dataset(DATASET, columns=["granularity", "period"], filters=[("granularity", "==", granularity)])
+    return sorted(stored["period"].unique(), reverse=True) if not stored.empty else []
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Materialize cross-country top-pages similarity.")
+    parser.add_argument("--csv", help="read top_pages_by_country.csv instead of the local store")
+    parser.add_argument("--days", nargs="*", help="recompute these days (YYYY-MM-DD) and their months")
+    parser.add_argument("--full", action="store_true", help="recompute every day and month")
+    args = parser.parse_args()
+
+    if args.csv:
+        source = read_top_pages(args.csv)
+        source = source[source["access"] == ACCESS]
+    else:
+        source = local_store.read_dataset("top_pages_by_country", filters=[("access", "==", ACCESS)])
+    if args.full:
+        days = None
+    elif args.days:
+        days = args.days
+    else:
+        days = sorted(set(with_periods(source)["period_day"]) - materialized_days()) if not source.empty else []
+    rows = update_similarity(days, source)
+    print(f"Stored {rows} similarity rows")
@@ -0,0 +1,65 @@
+import json
+import os
+
+# Static lookup tables for the dashboards (countries and project lists), built
+# once from pycountry and shipped as dashboard_lookups.json, so a Streamlit rerun
+# neither imports pycountry nor walks its country list.
+#
+#   python dashboard_lookups.py    # regenerate the JSON after a pycountry upgrade
+
+LOOKUPS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "dashboard_lookups.json")
+
+PROJECTS = {
+    "pageviews": [
+        "all-projects",
+        "en.wikipedia.org",
+        "de.wikipedia.org",
+        "fr.wikipedia.org",
+        "es.wikipedia.org",
+        "hi.wikipedia.org",
+        "commons.wikimedia.org",
+        "meta.wikimedia.org",
+    ],
+    "editors": [
+        "en.wikipedia.org",
+        "de.wikipedia.org",
+        "fr.wikipedia.org",
+        "es.wikipedia.org",
+        "hi.wikipedia.org",
+        "commons.wikimedia.org",
+        "meta.wikimedia.org",
+    ],
+    "editors_by_country": ["en.wikipedia.org", "de.wikipedia.org", "fr.wikipedia.org"],
+}
+
+
+def build_lookups():
+    import pycountry
+    countries = [
+        {"alpha_2": c.alpha_2, "alpha_3": c.alpha_3, "name": c.name}
+        for c in sorted(pycountry.countries, key=lambda c: c.alpha_2)
+    ]
+    return {"countries": countries, "projects": PROJECTS}
+
+
+def write_lookups(path=LOOKUPS_PATH):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(build_lookups(), f, indent=1, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def load_lookups(path=LOOKUPS_PATH):
+    if not os.path.exists(path):
+        write_lookups(path)
+    with open(path) as f:
+        lookups = json.load(f)
+    # Derived views the dashboards index into
+    lookups["country_names"] = {c["alpha_2"]: c["name"] for c in lookups["countries"]}
+    lookups["alpha_3"] = {c["alpha_2"]: c["alpha_3"] for c in lookups["countries"]}
+    return lookups
+
+
+if __name__ == "__main__":
+    write_lookups()
+    print(f"Wrote {LOOKUPS_PATH}")
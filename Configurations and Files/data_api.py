@@ -0,0 +1,296 @@
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlencode, urlsplit
+import pandas as pd
+import pyarrow.parquet as pq
+import granularity_planner
+import local_store
+import sqlite_store
+
+# Read-only HTTP API over the local store, so other teams can read the collected
+# data without opening our files or calling the upstream API. Paths mirror the
+# Wikimedia REST paths the collectors fetch, under /metrics/:
+#
+#   /metrics/pageviews/aggregate/{project}/{access}/{agent}/{granularity}/{start}/{end}
+#   /metrics/unique-devices/{project}/{access-site}/{granularity}/{start}/{end}
+#   /metrics/editors/aggregate/{project}/{editor-type}/{page-type}/{activity-level}/{granularity}/{start}/{end}
+#   /metrics/editors/by-country/{project}/{activity-level}/{year}/{month}
+#   /metrics/pageviews/top/{project}/{access}/{year}/{month}/{day}
+#   /metrics/pageviews/top-per-country/{country}/{access}/{year}/{month}/{day}
+#   /metrics/commons-analytics/top-pages-per-category-monthly/{category}/{scope}/{wiki}/{year}/{month}
+#   /datasets                                  (stored datasets and row counts)
+#
+# Responses are JSON {"items": [...], "total", "offset", "limit", "next"}, paged
+# with ?offset=&limit=, gzip-compressed when the client accepts it. Queries over
+# closed periods carry an ETag and long Cache-Control, and answer
+# If-None-Match with 304. Rendered pages are kept in an in-process LRU shared by
+# all request threads and invalidated when the dataset file changes.
+#
+#   python data_api.py --port 8050
+
+DEFAULT_LIMIT = 1000
+MAX_LIMIT = 10_000
+MAX_CACHE_ENTRIES = 512
+# Bodies smaller than this are sent uncompressed
+GZIP_MIN_BYTES = 1024
+
+# path template, dataset, and how the period segments filter rows:
+# "range" = {start}/{end} (end exclusive for editors, as upstream), "period" = year/month[/day]
+ROUTES = [
+    ("pageviews/aggregate/{project}/{access}/{agent}/{granularity}/{start}/{end}", "pageviews", "range"),
+    ("unique-devices/{project}/{access_site}/{granularity}/{start}/{end}", "unique_devices", "range"),
+    ("editors/aggregate/{project}/{editor_type}/{page_type}/{activity_level}/{granularity}/{start}/{end}", "editors_data", "range_exclusive"),
+    ("editors/by-country/{project}/{activity_level}/{year}/{month}", "editors_by_country", "period"),
+    ("pageviews/top/{project}/{access}/{year}/{month}/{day}", "most_viewed_pages", "period"),
+    ("pageviews/top-per-country/{country}/{access}/{year}/{month}/{day}", "top_pages_by_country", "period"),
+    ("commons-analytics/top-pages-per-category-monthly/{category}/{category_scope}/{wiki}/{year}/{month}", "top_pages_by_category", "period"),
+]
+
+# Datasets stored at one granularity only (the granularity segment is checked, not
+# filtered on); coarser granularities of additive datasets are summed from it
+STORED_GRANULARITY = {"pageviews": "daily", "editors_data": "daily"}
+
+
+def _compile(template):
+    pattern = re.sub(r"\{(\w+)\}", r"(?P<\1>[^/]+)", template)
+    return re.compile(f"^/metrics/{pattern}/?$")
+
+
+COMPILED_ROUTES = [(_compile(template), dataset, mode) for template, dataset, mode in ROUTES]
+
+
+class ApiError(Exception):
+    def __init__(self, status, detail):
+        super().__init__(detail)
+        self.status = status
+        self.detail = detail
+
+
+def parse_day(value):
+    # "YYYYMMDD" or "YYYYMMDDHH", as in the upstream paths
+    try:
+        return pd.Timestamp(datetime.strptime(value[:8], "%Y%m%d"))
+    except ValueError:
+        raise ApiError(400, f"invalid date {value!r}, expected YYYYMMDD")
+
+
+def parse_period(params):
+    # First day of a year/month[/day] path
+    try:
+        return pd.Timestamp(int(params["year"]), int(params["month"]), int(params.get("day", 1)))
+    except (ValueError, OverflowError):
+        segments = "/".join(params[k] for k in ("year", "month", "day") if k in params)
+        raise ApiError(400, f"invalid period {segments!r}, expected YYYY/MM" + ("/DD" if "day" in params else ""))
+
+
+def period_end(mode, params):
+    # Last day the query covers, to decide whether it is closed
+    if mode == "range":
+        return parse_day(params["end"])
+    if mode == "range_exclusive":
+        return parse_day(params["end"]) - pd.Timedelta(days=1)
+    if "day" in params:
+        return parse_period(params)
+    return parse_period(params) + pd.offsets.MonthEnd(0)
+
+
+def is_closed(mode, params):
+    today = pd.Timestamp(datetime.now(timezone.utc).date())
+    return period_end(mode, params) < today - timedelta(days=local_store.SETTLE_DAYS)
+
+
+def dataset_version(name):
+    return local_store.dataset_version(name)
+
+
+def derive_rows(df, name, granularity, start, end):
+    # Only periods whose every day is stored are served, so sums are never partial
+    time_column, value_column = granularity_planner.ADDITIVE[name]
+    series_columns = [c for c in local_store.DATASET_KEYS[name] if c != time_column]
+    frames = []
+    for key, rows in df.groupby(series_columns):
+        derived, _ = granularity_planner.derive(rows, granularity, start, end, time_column, value_column)
+        frames.append(derived.assign(**dict(zip(series_columns, key))))
+    return pd.concat(frames, ignore_index=True)[list(df.columns)] if frames else df.iloc[0:0]
+
+
+def query_rows(name, mode, params):
+    granularity = params.pop("granularity", None)
+    if name in STORED_GRANULARITY:
+        if granularity != STORED_GRANULARITY[name] and not granularity_planner.is_derivable(name, granularity):
+            raise ApiError(404, f"{name} is stored at {STORED_GRANULARITY[name]} granularity only")
+    elif granularity is not None:
+        params["granularity"] = granularity
+
+    period = {k: params.pop(k) for k in ("start", "end", "year", "month", "day") if k in params}
+    # Dimension filters are pushed down to the Parquet reader
+    filters = [(column, "==", value) for column, value in params.items()]
+    df = local_store.read_dataset(name, filters=filters or None, decode_articles=True)
+    if df.empty:
+        return df
+
+    if mode.startswith("range"):
+        days = local_store.period_column(df)
+        start, end = parse_day(period["start"]), parse_day(period["end"])
+        df = df[(days >= start) & ((days < end) if mode == "range_exclusive" else (days <= end))]
+        if name in STORED_GRANULARITY and granularity != STORED_GRANULARITY[name]:
+            df = derive_rows(df, name, granularity, start, end)
+    else:
+        for column in ("year", "month", "day"):
+            if column in period:
+                width = 4 if column == "year" else 2
+                df = df[df[column].astype(str).str.zfill(width) == period[column].zfill(width)]
+    sort = [c for c in ("timestamp", "date", "rank") if c in df.columns]
+    return df.sort_values(by=sort).reset_index(drop=True) if sort else df.reset_index(drop=True)
+
+
+def to_records(df):
+    df = df.copy()
+    for column in df.columns:
+        if pd.api.types.is_datetime64_any_dtype(df[column]):
+            df[column] = df[column].dt.strftime("%Y-%m-%d")
+        elif df[column].dtype == object:
+            df[column] = df[column].map(lambda v: v.isoformat() if hasattr(v, "isoformat") else v)
+    return json.loads(df.to_json(orient="records"))
+
+
+class ResponseCache:
+    # LRU of rendered pages, shared by all request threads
+    def __init__(self, max_entries=MAX_CACHE_ENTRIES):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+            return entry
+
+    def put(self, key, entry):
+        with self.lock:
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return entry
+
+
+cache = ResponseCache()
+
+
+def render_page(path, query):
+    # (body bytes, etag or None, closed) for a /metrics/ path
+    for pattern, name, mode in COMPILED_ROUTES:
+        match = pattern.match(path)
+        if match:
+            break
+    else:
+        raise ApiError(404, f"unknown path {path}")
+    params = {k: unquote(v) for k, v in match.groupdict().items()}
+
+    try:
+        offset = int(query.get("offset", ["0"])[0])
+        limit = min(int(query.get("limit", [str(DEFAULT_LIMIT)])[0]), MAX_LIMIT)
+    except ValueError:
+        raise ApiError(400, "offset and limit must be integers")
+    if offset < 0 or limit <= 0:
+        raise ApiError(400, "offset must be >= 0 and limit > 0")
+
+    closed = is_closed(mode, params)
+    key = (path, offset, limit, dataset_version(name))
+    entry = cache.get(key)
+    if entry is None:
+        df = query_rows(name, mode, dict(params))
+        page = df.iloc[offset:offset + limit]
+        next_url = f"{path}?{urlencode({'offset': offset + limit, 'limit': limit})}" if offset + limit < len(df) else None
+        body = json.dumps({"items": to_records(page), "total": len(df), "offset": offset,
+                           "limit": limit, "next": next_url}).encode("utf-8")
+        etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+        entry = cache.put(key, (body, etag))
+    body, etag = entry
+    return body, (etag if closed else None), closed
+
+
+def list_datasets():
+    datasets = {}
+    if local_store.BACKEND == "sqlite":
+        counts = sqlite_store.list_tables()
+        for name in local_store.DATASET_KEYS:
+            if name in counts:
+                datasets[name] = {"rows": counts[name], "key": local_store.DATASET_KEYS[name]}
+        return json.dumps({"datasets": datasets}).encode("utf-8")
+    for name in local_store.DATASET_KEYS:
+        path = local_store.dataset_path(name)
+        if os.path.exists(path):
+            datasets[name] = {"rows": pq.ParquetFile(path).metadata.num_rows, "key": local_store.DATASET_KEYS[name]}
+    return json.dumps({"datasets": datasets}).encode("utf-8")
+
+
+class DataApiHandler(BaseHTTPRequestHandler):
+    server_version = "WikimediaLocalData/1.0"
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        try:
+            if url.path.rstrip("/") == "/datasets":
+                self.send_body(200, list_datasets(), cache_control="no-cache")
+                return
+            body, etag, closed = render_page(url.path, parse_qs(url.query))
+        except ApiError as e:
+            self.send_body(e.status, json.dumps({"status": e.status, "detail": e.detail}).encode("utf-8"), cache_control="no-store")
+            return
+
+        # The gzip and identity representations differ byte for byte, so each gets its own ETag
+        if etag is not None and self.uses_gzip(body):
+            etag = etag[:-1] + '-gzip"'
+        if etag is not None and etag in [t.strip() for t in self.headers.get("If-None-Match", "").split(",")]:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Vary", "Accept-Encoding")
+            self.end_headers()
+            return
+        # Closed periods never change upstream; open ones must be revalidated
+        self.send_body(200, body, etag=etag, cache_control="public, max-age=86400" if closed else "no-cache")
+
+    def uses_gzip(self, body):
+        return len(body) >= GZIP_MIN_BYTES and "gzip" in self.headers.get("Accept-Encoding", "")
+
+    def send_body(self, status, body, etag=None, cache_control=None):
+        if self.uses_gzip(body):
+            body = gzip.compress(body, compresslevel=5)
+            encoding = "gzip"
+        else:
+            encoding = None
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Vary", "Accept-Encoding")
+        if encoding:
+            self.send_header("Content-Encoding", encoding)
+        if etag:
+            self.send_header("ETag", etag)
+        if cache_control:
+            self.send_header("Cache-Control", cache_control)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve the local datasets over a read-only HTTP API.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8050)
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer((args.host, args.port), DataApiHandler)
+    print(f"Serving {local_store.STORE_DIR} on http://{args.host}:{args.port}/metrics/")
+    server.serve_forever()
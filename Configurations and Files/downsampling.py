@@ -0,0 +1,83 @@
+import numpy as np
+import pandas as pd
+
+# Server-side downsampling of long time series before they are handed to Plotly.
+# A chart cannot show more than about one point per horizontal pixel, so series
+# longer than that are reduced with LTTB (line charts) or min/max bucketing
+# (keeps both extremes of every bucket). Shorter series are returned untouched,
+# so the dashboards switch between raw and downsampled data automatically as the
+# selected date range grows or shrinks.
+
+# Plot area width the dashboards render at with use_container_width on a wide layout
+DEFAULT_CHART_WIDTH_PX = 1200
+
+
+def lttb_indices(x, y, n_out):
+    # Largest-Triangle-Three-Buckets: keeps the first and last points and, per
+    # bucket, the point forming the largest triangle with its neighbours
+    n = len(y)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+    prev = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        # Average of the next bucket (or the last point for the final bucket)
+        next_hi = edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = x[hi:next_hi].mean()
+        avg_y = np.nanmean(y[hi:next_hi]) if np.any(~np.isnan(y[hi:next_hi])) else 0.0
+        area = np.abs((x[prev] - avg_x) * (y[lo:hi] - y[prev]) - (x[prev] - x[lo:hi]) * (avg_y - y[prev]))
+        prev = lo + int(np.nanargmax(area)) if np.any(~np.isnan(area)) else lo
+        selected[i + 1] = prev
+    return selected
+
+
+def minmax_indices(y, n_out):
+    # Min/max bucketing: two points per bucket, so every peak and trough survives
+    n = len(y)
+    n_buckets = n_out // 2
+    if n_out >= n or n_buckets < 1:
+        return np.arange(n)
+    y = np.asarray(y, dtype=np.float64)
+    filled = np.where(np.isnan(y), np.nanmean(y) if np.any(~np.isnan(y)) else 0.0, y)
+    edges = np.linspace(0, n, n_buckets + 1).astype(np.int64)
+    selected = []
+    for lo, hi in zip(edges[:-1], edges[1:]):
+        if hi <= lo:
+            continue
+        bucket = filled[lo:hi]
+        selected.extend(sorted({lo + int(bucket.argmin()), lo + int(bucket.argmax())}))
+    return np.asarray(selected, dtype=np.int64)
+
+
+def _x_as_float(x):
+    if pd.api.types.is_datetime64_any_dtype(x):
+        return x.astype("int64").to_numpy(dtype=np.float64)
+    return pd.to_numeric(x, errors="coerce").to_numpy(dtype=np.float64)
+
+
+def downsample(df, x, y, width_px=DEFAULT_CHART_WIDTH_PX, method="lttb", color=None):
+    # df is plotted as px.line/px.bar(df, x=x, y=y[, color=color]). With several y
+    # columns the rows are picked once (on their sum) so stacked bars stay aligned;
+    # with a color column every series is reduced on its own
+    if color is not None:
+        parts = [downsample(part, x, y, width_px, method) for _, part in df.groupby(color, sort=False)]
+        return pd.concat(parts) if parts else df
+    y_columns = [y] if isinstance(y, str) else list(y)
+    n_out = width_px if method == "lttb" else 2 * width_px
+    if len(df) <= n_out:
+        return df
+    df = df.sort_values(by=x)
+    values = df[y_columns].sum(axis=1, min_count=1).to_numpy(dtype=np.float64)
+    if method == "lttb":
+        rows = lttb_indices(_x_as_float(df[x]), values, n_out)
+    elif method == "minmax":
+        rows = minmax_indices(values, n_out)
+    else:
+        raise ValueError(f"Unknown downsampling method: {method}")
+    return df.iloc[rows]
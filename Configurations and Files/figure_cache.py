@@ -0,0 +1,123 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+import local_store
+
+# Cache of rendered Plotly figures, stored as figure JSON and keyed by
+# (view, query parameters, data version). A hit skips the fetch, the pandas
+# processing and the figure construction; only plotly.io.from_json runs.
+#
+# The data version is what invalidates an entry: closed periods of the API never
+# change, so queries that end well in the past are "final"; anything touching the
+# last few days is versioned by today's date; views over local files use the
+# files' modification times.
+#
+# Entries live in an in-process LRU and, to survive server restarts, as JSON
+# files under local_store/figure_cache/. One instance is shared by every session
+# of the server, so the LRU is guarded by a lock.
+
+FIGURE_CACHE_DIR = os.path.join(local_store.STORE_DIR, "figure_cache")
+MAX_MEMORY_ENTRIES = 256
+MAX_DISK_ENTRIES = 2000
+
+
+def api_data_version(end):
+    # end: date, datetime or "YYYYMMDD[HH]" string of the last requested period
+    if isinstance(end, str):
+        end = datetime.strptime(end[:8], "%Y%m%d").date()
+    elif isinstance(end, datetime):
+        end = end.date()
+    today = datetime.now(timezone.utc).date()
+    return "final" if end < today - timedelta(days=local_store.SETTLE_DAYS) else today.isoformat()
+
+
+def file_version(*paths):
+    # Changes whenever any of the files (or directories) is rewritten
+    stamps = []
+    for path in paths:
+        if os.path.isdir(path):
+            stamps.extend(os.stat(os.path.join(root, f)).st_mtime_ns for root, _, files in os.walk(path) for f in files)
+        elif os.path.exists(path):
+            stamps.append(os.stat(path).st_mtime_ns)
+    return str(max(stamps, default=0))
+
+
+def cache_key(view, params, data_version):
+    payload = json.dumps([view, params, data_version], sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+class FigureCache:
+    def __init__(self, directory=FIGURE_CACHE_DIR, max_entries=MAX_MEMORY_ENTRIES):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.json") if self.directory else None
+
+    def get(self, view, params, data_version):
+        # List of figures stored for the query, or None
+        key = cache_key(view, params, data_version)
+        with self.lock:
+            payload = self.entries.get(key)
+            if payload is not None:
+                self.entries.move_to_end(key)
+        if payload is None and self.directory:
+            try:
+                with open(self._path(key)) as f:
+                    payload = json.load(f)
+            except FileNotFoundError:
+                pass
+            else:
+                self._remember(key, payload)
+        with self.lock:
+            if payload is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        import plotly.io as pio
+        return [pio.from_json(figure) for figure in payload]
+
+    def put(self, view, params, data_version, figures):
+        key = cache_key(view, params, data_version)
+        payload = [figure.to_json() for figure in figures]
+        self._remember(key, payload)
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+            tmp_path = "%s.%d.%d.tmp" % (self._path(key), os.getpid(), threading.get_ident())
+            with open(tmp_path, "w") as f:
+                json.dump(payload, f)
+            os.replace(tmp_path, self._path(key))
+            self._prune_disk()
+        return figures
+
+    def _remember(self, key, payload):
+        with self.lock:
+            self.entries[key] = payload
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def _prune_disk(self):
+        files = [os.path.join(self.directory, f) for f in os.listdir(self.directory) if f.endswith(".json")]
+        if len(files) <= MAX_DISK_ENTRIES:
+            return
+        stamps = {}
+        for path in files:
+            try:
+                stamps[path] = os.path.getmtime(path)
+            except FileNotFoundError:
+                # Pruned by another session's put
+                pass
+        for path in sorted(stamps, key=stamps.get)[:len(stamps) - MAX_DISK_ENTRIES]:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
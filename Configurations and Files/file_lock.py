@@ -0,0 +1,37 @@
+import os
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# Advisory lock between processes (and threads) that update the same file: the
+# collectors, the refresh daemon, article_backfill and spark_pipeline can all run
+# at once. The lock is taken on a "<path>.lock" sidecar so the file itself can
+# still be replaced atomically while it is held.
+#
+#   with locked(path):
+#       ...read, merge and write path...
+
+
+@contextmanager
+def locked(path, shared=False):
+    lock_path = path + ".lock"
+    os.makedirs(os.path.dirname(os.path.abspath(lock_path)), exist_ok=True)
+    with open(lock_path, "a+") as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        else:
+            # msvcrt has no shared mode; readers take the exclusive lock too
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
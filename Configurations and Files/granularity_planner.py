@@ -0,0 +1,120 @@
+import pandas as pd
+import local_store
+
+# Answers coarser-granularity queries (weekly, monthly, yearly) from daily data
+# we already hold, instead of asking the API for them again.
+#
+# Only additive measures can be derived: monthly pageviews are exactly the sum
+# of the month's daily pageviews. Editor counts are not (an editor active on
+# several days counts once per month, in every activity level), and neither are
+# unique devices, so those always go to the API at the requested granularity.
+#
+#   df, source = resolve("pageviews", "monthly",
+#                        {"project": "en.wikipedia.org", "access": "all-access", "agent": "user"},
+#                        start, end, fetch)
+#
+# fetch(granularity, start, end) is the caller's API call for the same series,
+# returning a frame with the same time/value columns; it is only called for the
+# span of periods the store cannot complete. source says where the rows came
+# from: "local", "api", "local+api", or "api-daily" (daily rows fetched and
+# summed, for granularities the API does not offer).
+
+# Pandas period frequency of each granularity; weeks run Monday to Sunday
+PERIOD_FREQ = {"daily": "D", "weekly": "W-SUN", "monthly": "M", "yearly": "Y"}
+
+# Datasets whose values are exact sums of their daily values: (time column, value column)
+ADDITIVE = {
+    "pageviews": ("timestamp", "views"),
+    "article_pageviews": ("timestamp", "views"),
+}
+
+# Granularities the upstream endpoints serve
+API_GRANULARITIES = {
+    "pageviews": {"daily", "monthly"},
+    "article_pageviews": {"daily", "monthly"},
+    "editors_data": {"daily", "monthly"},
+    "unique_devices": {"daily", "monthly"},
+}
+
+
+def is_derivable(name, granularity):
+    return name in ADDITIVE and granularity in PERIOD_FREQ
+
+
+def widen_end(granularity, end):
+    # Last day of the period holding end: like the API, a query includes the
+    # period whose start timestamp is its end date
+    return pd.Period(pd.Timestamp(end), freq=PERIOD_FREQ[granularity]).end_time.normalize()
+
+
+def complete_periods(granularity, start, end):
+    # Periods that start inside [start, end], as the API returns them; the last
+    # one may run past end
+    freq = PERIOD_FREQ[granularity]
+    start, end = pd.Timestamp(start).normalize(), widen_end(granularity, end)
+    periods = pd.period_range(start, end, freq=freq)
+    return periods[(periods.start_time >= start) & (periods.end_time.normalize() <= end)]
+
+
+def derive(daily, granularity, start, end, time_column="timestamp", value_column="views"):
+    # Sum one series' daily rows into periods; returns (frame, periods with missing days)
+    periods = complete_periods(granularity, start, end)
+    freq = PERIOD_FREQ[granularity]
+    days = pd.to_datetime(daily[time_column]).dt.normalize()
+    daily = pd.DataFrame({"day": days, "value": daily[value_column].to_numpy()}).drop_duplicates(subset="day", keep="last")
+    daily["period"] = daily["day"].dt.to_period(freq)
+    daily = daily[daily["period"].isin(periods)]
+
+    grouped = daily.groupby("period")
+    present = grouped["day"].count().reindex(periods, fill_value=0)
+    expected = (periods.end_time.normalize() - periods.start_time).days + 1
+    complete = periods[present.to_numpy() == expected]
+    sums = grouped["value"].sum().reindex(complete)
+    df = pd.DataFrame({time_column: complete.start_time, value_column: sums.to_numpy().astype("int64")})
+    return df, list(periods[present.to_numpy() != expected])
+
+
+def local_daily(name, series, start, end, dictionary=None):
+    # Stored daily rows of one series between start and end; dictionary is the
+    # caller's ArticleDictionary for article series
+    if name == "pageviews":
+        filters = [(column, "==", value) for column, value in series.items()]
+        df = local_store.read_dataset(name, columns=["timestamp", "views"], filters=filters)
+    elif name == "article_pageviews":
+        # Filled by article_backfill.py; imported here so other datasets never load it
+        from article_backfill import read_article_history
+        df = read_article_history(series["project"], series["article"], dictionary)
+        df = df[(df["access"] == series["access"]) & (df["agent"] == series["agent"])]
+    else:
+        raise ValueError(f"no local daily store for {name}")
+    if df.empty:
+        return df
+    days = pd.to_datetime(df["timestamp"])
+    return df[(days >= pd.Timestamp(start)) & (days <= pd.Timestamp(end))]
+
+
+def resolve(name, granularity, series, start, end, fetch, dictionary=None):
+    if not is_derivable(name, granularity):
+        if granularity not in API_GRANULARITIES.get(name, ()):
+            raise ValueError(f"{name} cannot be derived at {granularity} granularity and the API does not serve it")
+        return fetch(granularity, pd.Timestamp(start), pd.Timestamp(end)), "api"
+
+    time_column, value_column = ADDITIVE[name]
+    end = widen_end(granularity, end)
+    derived, missing = derive(local_daily(name, series, start, end, dictionary), granularity, start, end, time_column, value_column)
+    if not missing:
+        return derived, "local"
+
+    # One request covering the periods the store could not complete
+    gap_start, gap_end = missing[0].start_time, missing[-1].end_time.normalize()
+    if granularity in API_GRANULARITIES[name]:
+        fetched, source = fetch(granularity, gap_start, gap_end), "api"
+        fetched = fetched[pd.to_datetime(fetched[time_column]).dt.to_period(PERIOD_FREQ[granularity]).isin(missing)]
+    else:
+        # Weekly and yearly are not served upstream: sum the API's daily rows instead
+        fetched, _ = derive(fetch("daily", gap_start, gap_end), granularity, gap_start, gap_end, time_column, value_column)
+        source = "api-daily"
+    if derived.empty:
+        return fetched.reset_index(drop=True), source
+    df = pd.concat([derived, fetched[[time_column, value_column]]], ignore_index=True)
+    return df.sort_values(by=time_column).reset_index(drop=True), "local+api"
@@ -0,0 +1,147 @@
+import os
+import pandas as pd
+from article_dictionary import ArticleDictionary, encode_article_column, decode_article_column
+from file_lock import locked
+
+# Local columnar store: one Parquet file per dataset under STORE_DIR.
+# Writes are upserts on the dataset's primary key, serialized across processes
+# by a lock on the dataset file, and replace the file atomically, so readers see
+# either the old or the new version.
+#
+# With WIKI_STORE_BACKEND=sqlite the same reads and upserts go to the SQLite WAL
+# database of sqlite_store instead, which the collectors' --sqlite option writes
+# to as well: writers queue on one transactional store and every read is a
+# consistent snapshot.
+
+STORE_DIR = os.environ.get("WIKI_LOCAL_STORE", "local_store")
+BACKEND = os.environ.get("WIKI_STORE_BACKEND", "parquet")
+
+# Primary key of every dataset; the remaining columns are values
+DATASET_KEYS = {
+    "pageviews": ["project", "access", "agent", "timestamp"],
+    "unique_devices": ["project", "access_site", "granularity", "timestamp"],
+    "editors_data": ["project", "editor_type", "page_type", "activity_level", "date"],
+    "editors_by_country": ["project", "activity_level", "year", "month", "country"],
+    "most_viewed_pages": ["project", "access", "year", "month", "day", "rank"],
+    "top_pages_by_country": ["country", "access", "year", "month", "day", "rank"],
+    "top_pages_by_category": ["category", "category_scope", "wiki", "year", "month", "rank"],
+    "mediacounts_by_category": ["category", "date"],
+    "country_similarity": ["granularity", "period", "country_a", "country_b"],
+}
+
+# Datasets that store article ids from the shared article dictionary
+ARTICLE_DATASETS = {"most_viewed_pages", "top_pages_by_country", "top_pages_by_category"}
+
+# Upstream data for a day can still be revised this long after it closes
+SETTLE_DAYS = 2
+
+
+def dataset_path(name):
+    return os.path.join(STORE_DIR, f"{name}.parquet")
+
+
+def dataset_version(name):
+    # Changes whenever the dataset is rewritten (with SQLite, on any commit)
+    if BACKEND == "sqlite":
+        import sqlite_store
+        paths = [sqlite_store.DB_PATH, sqlite_store.DB_PATH + "-wal"]
+    else:
+        paths = [dataset_path(name)]
+    return max((os.stat(path).st_mtime_ns for path in paths if os.path.exists(path)), default=0)
+
+
+def read_sqlite_dataset(name, columns=None, decode_articles=False, filters=None):
+    # sqlite_store imports this module, so it is only loaded for this backend
+    import sqlite_store
+    where, params = sqlite_store.where_clause(filters)
+    df = sqlite_store.read_dataset(name, columns=columns, where=where, params=params, decode_articles=decode_articles)
+    # Dates are stored as ISO text and partition columns as integers; return them
+    # in the form the Parquet store holds
+    for column, width in (("year", 4), ("month", 2), ("day", 2)):
+        if column in df.columns:
+            df[column] = df[column].astype(str).str.zfill(width)
+    if "timestamp" in df.columns:
+        df["timestamp"] = pd.to_datetime(df["timestamp"])
+    if "date" in df.columns:
+        df["date"] = pd.to_datetime(df["date"]).dt.date
+    return df
+
+
+def read_dataset(name, columns=None, decode_articles=False, filters=None):
+    # filters use the pyarrow form, e.g. [("project", "==", "en.wikipedia.org")]
+    if BACKEND == "sqlite":
+        return read_sqlite_dataset(name, columns, decode_articles, filters)
+    path = dataset_path(name)
+    if not os.path.exists(path):
+        return pd.DataFrame(columns=columns)
+    df = pd.read_parquet(path, columns=columns, filters=filters)
+    if decode_articles and name in ARTICLE_DATASETS:
+        df = decode_article_column(df, ArticleDictionary())
+    return df
+
+
+def upsert_dataset(name, df, dictionary=None):
+    # Merge new rows into the stored dataset; new rows win on key collisions
+    if df.empty:
+        return 0
+    if BACKEND == "sqlite":
+        import sqlite_store
+        return sqlite_store.upsert_dataset(name, df, dictionary)
+    keys = DATASET_KEYS[name]
+    if name in ARTICLE_DATASETS and "article" in df.columns:
+        df = encode_article_column(df, dictionary if dictionary is not None else ArticleDictionary())
+    # The read-merge-write must not interleave with another writer's, or one
+    # writer's rows would be lost
+    with locked(dataset_path(name)):
+        stored = read_dataset(name)
+        if not stored.empty:
+            df = pd.concat([stored, df], ignore_index=True)
+        df = df.drop_duplicates(subset=keys, keep="last").sort_values(by=keys).reset_index(drop=True)
+
+        os.makedirs(STORE_DIR, exist_ok=True)
+        tmp_path = dataset_path(name) + ".tmp"
+        df.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, dataset_path(name))
+    return len(df)
+
+
+def period_column(df):
+    # Day (or month) each row belongs to, whatever date columns the dataset uses
+    if "timestamp" in df.columns:
+        return pd.to_datetime(df["timestamp"]).dt.normalize()
+    if "date" in df.columns:
+        return pd.to_datetime(df["date"])
+    day = df["day"].astype(str).str.zfill(2) if "day" in df.columns else "01"
+    return pd.to_datetime(df["year"].astype(str) + "-" + df["month"].astype(str).str.zfill(2) + "-" + day)
+
+
+def stored_periods(name, series_columns):
+    # Distinct stored periods per series, e.g. per (project, access, agent), as a sorted DatetimeIndex
+    df = read_dataset(name)
+    if df.empty:
+        return {}
+    df = df[series_columns].assign(_period=period_column(df)).drop_duplicates()
+    return {
+        key if isinstance(key, tuple) else (key,): pd.DatetimeIndex(group["_period"]).sort_values()
+        for key, group in df.groupby(series_columns)
+    }
+
+
+# Large datasets (e.g. the hourly dump ingestion) are stored as a directory of
+# Parquet parts under STORE_DIR/<name>/<key>=<value>/ instead of a single file,
+# so a partition can be rewritten without touching the rest of the dataset.
+
+def partition_path(name, partition):
+    parts = [f"{key}={value}" for key, value in partition.items()]
+    return os.path.join(STORE_DIR, name, *parts)
+
+
+def write_partition_part(name, partition, df, part):
+    directory = partition_path(name, partition)
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"part-{part}.parquet")
+    # Hidden temp name so dataset readers never pick up a half-written part
+    tmp_path = os.path.join(directory, f".part-{part}.parquet.tmp")
+    df.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, path)
+    return path
@@ -0,0 +1,160 @@
+import json
+import os
+import shutil
+import pandas as pd
+import local_store
+
+# Hive-style partitioned copies of the collector outputs:
+#
+#   local_store/partitioned/<dataset>/year=2023/month=01/part-0000.parquet
+#   local_store/partitioned/<dataset>/_metadata.json
+#
+# _metadata.json lists every partition with its values and row count, so a
+# reader can prune partitions from a filter without listing directories or
+# opening files. Readers exist for pandas and for (local-mode) PySpark.
+
+PARTITIONED_DIR = os.path.join(local_store.STORE_DIR, "partitioned")
+METADATA_FILE = "_metadata.json"
+
+
+def dataset_dir(name):
+    return os.path.join(PARTITIONED_DIR, name)
+
+
+def with_year_month(df, date_column=None):
+    # Normalized string year/month partition columns ("2023", "01"), whether the
+    # frame has a date column or year/month columns read back from CSV as ints
+    df = df.copy()
+    if date_column is not None:
+        # Formatted once per distinct date rather than once per row
+        codes, dates = pd.factorize(pd.to_datetime(df[date_column]), use_na_sentinel=False)
+        df["year"] = dates.strftime("%Y").to_numpy(dtype=object)[codes]
+        df["month"] = dates.strftime("%m").to_numpy(dtype=object)[codes]
+    else:
+        df["year"] = df["year"].astype(str)
+        df["month"] = df["month"].astype(str).str.zfill(2)
+    return df
+
+
+def read_metadata(name):
+    path = os.path.join(dataset_dir(name), METADATA_FILE)
+    if not os.path.exists(path):
+        return {"partition_columns": [], "columns": [], "partitions": []}
+    with open(path) as f:
+        return json.load(f)
+
+
+def write_metadata(name, metadata):
+    path = os.path.join(dataset_dir(name), METADATA_FILE)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(metadata, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def write_partitioned(df, name, partition_columns):
+    # Rewrites every partition present in df; partitions not in df are kept
+    metadata = read_metadata(name)
+    if metadata["partition_columns"] and metadata["partition_columns"] != list(partition_columns):
+        raise ValueError(f"{name} is partitioned by {metadata['partition_columns']}, not {list(partition_columns)}")
+    partitions = {p["path"]: p for p in metadata["partitions"]}
+    value_columns = [c for c in df.columns if c not in partition_columns]
+
+    for values, part in df.groupby(list(partition_columns), sort=True):
+        values = values if isinstance(values, tuple) else (values,)
+        partition = dict(zip(partition_columns, (str(v) for v in values)))
+        relative = os.path.join(*(f"{k}={v}" for k, v in partition.items()))
+        directory = os.path.join(dataset_dir(name), relative)
+        shutil.rmtree(directory, ignore_errors=True)
+        os.makedirs(directory)
+        # Partition values live in the path only, as Hive and Spark expect
+        part[value_columns].to_parquet(os.path.join(directory, "part-0000.parquet"), index=False)
+        partitions[relative] = {"path": relative, "values": partition, "rows": len(part)}
+
+    write_metadata(name, {
+        "partition_columns": list(partition_columns),
+        "columns": value_columns,
+        "partitions": sorted(partitions.values(), key=lambda p: p["path"]),
+    })
+    return len(partitions)
+
+
+def append_partitioned(df, name, partition_columns):
+    # Adds df as new part files next to the existing ones, for datasets written
+    # in chunks (e.g. synthetic_data.py); rows are not deduplicated
+    metadata = read_metadata(name)
+    if metadata["partition_columns"] and metadata["partition_columns"] != list(partition_columns):
+        raise ValueError(f"{name} is partitioned by {metadata['partition_columns']}, not {list(partition_columns)}")
+    partitions = {p["path"]: p for p in metadata["partitions"]}
+    value_columns = [c for c in df.columns if c not in partition_columns]
+
+    for values, part in df.groupby(list(partition_columns), sort=True):
+        values = values if isinstance(values, tuple) else (values,)
+        partition = dict(zip(partition_columns, (str(v) for v in values)))
+        relative = os.path.join(*(f"{k}={v}" for k, v in partition.items()))
+        directory = os.path.join(dataset_dir(name), relative)
+        os.makedirs(directory, exist_ok=True)
+        number = len([f for f in os.listdir(directory) if f.endswith(".parquet")])
+        part[value_columns].to_parquet(os.path.join(directory, f"part-{number:04d}.parquet"), index=False)
+        rows = partitions.get(relative, {}).get("rows", 0) + len(part)
+        partitions[relative] = {"path": relative, "values": partition, "rows": rows}
+
+    write_metadata(name, {
+        "partition_columns": list(partition_columns),
+        "columns": value_columns,
+        "partitions": sorted(partitions.values(), key=lambda p: p["path"]),
+    })
+    return len(partitions)
+
+
+def _matches(value, condition):
+    if callable(condition):
+        return condition(value)
+    if isinstance(condition, (list, tuple, set)):
+        return value in {str(c) for c in condition}
+    return value == str(condition)
+
+
+def prune_partitions(name, filters=None):
+    # filters: {column: value | [values] | callable(value) -> bool} on partition
+    # columns, e.g. {"year": "2024", "month": ["01", "02"]}
+    metadata = read_metadata(name)
+    filters = filters or {}
+    unknown = set(filters) - set(metadata["partition_columns"])
+    if unknown:
+        raise ValueError(f"{name} cannot be pruned on non-partition columns: {sorted(unknown)}")
+    return [
+        p for p in metadata["partitions"]
+        if all(_matches(p["values"][column], condition) for column, condition in filters.items())
+    ]
+
+
+def count_rows(name, filters=None):
+    # Answered from the metadata alone
+    return sum(p["rows"] for p in prune_partitions(name, filters))
+
+
+def read_partitioned(name, filters=None, columns=None):
+    partitions = prune_partitions(name, filters)
+    frames = []
+    for p in partitions:
+        directory = os.path.join(dataset_dir(name), p["path"])
+        for file_name in sorted(os.listdir(directory)):
+            if not file_name.endswith(".parquet"):
+                continue
+            part = pd.read_parquet(os.path.join(directory, file_name), columns=columns)
+            frames.append(part.assign(**p["values"]))
+    if not frames:
+        metadata = read_metadata(name)
+        return pd.DataFrame(columns=(columns or metadata["columns"]) + metadata["partition_columns"])
+    return pd.concat(frames, ignore_index=True)
+
+
+def spark_read_partitioned(spark, name, filters=None):
+    # Hands Spark only the pruned partition directories; basePath keeps the
+    # partition columns in the resulting DataFrame. None when nothing matches.
+    base = os.path.abspath(dataset_dir(name))
+    paths = [os.path.join(base, p["path"]) for p in prune_partitions(name, filters)]
+    if not paths:
+        return None
+    return spark.read.option("basePath", base).parquet(*paths)
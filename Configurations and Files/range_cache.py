@@ -0,0 +1,119 @@
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+import pandas as pd
+from granularity_planner import PERIOD_FREQ, complete_periods
+from local_store import SETTLE_DAYS
+
+# Cache of time series by date range, for views whose users keep sliding or
+# widening the window. Each series keeps a sorted list of non-overlapping day
+# segments [start, end] with the rows fetched for them; a query is answered by
+# stitching the cached segments and fetching only the uncovered gaps, one
+# request per gap:
+#
+#   cached:  |----- A -----|            |--- B ---|
+#   query:         |===============================|
+#   fetched:               |---- gap ---|         |gap|
+#
+#   ranges = RangeCache()
+#   df = ranges.get(("pageviews", project, access, agent, "daily"), start, end,
+#                   lambda gap_start, gap_end: fetch(gap_start, gap_end))
+#
+# fetch(start, end) takes inclusive days and returns a frame with a time column.
+# Gaps of coarser granularities are widened to whole periods so a month is never
+# split across two requests. Days that can still change upstream are returned
+# but not cached, so they are fetched again on the next query.
+
+MAX_SERIES = 512
+
+
+def settled_until():
+    return pd.Timestamp(datetime.now(timezone.utc).date() - timedelta(days=SETTLE_DAYS + 1))
+
+
+def align(start, end, granularity):
+    # Widen [start, end] to whole periods of the granularity
+    freq = PERIOD_FREQ[granularity]
+    return pd.Period(start, freq=freq).start_time, pd.Period(end, freq=freq).end_time.normalize()
+
+
+def missing_ranges(segments, start, end):
+    # Uncovered sub-ranges of [start, end], given sorted (start, end, rows) segments
+    gaps = []
+    cursor = start
+    for seg_start, seg_end, _ in segments:
+        if seg_end < cursor:
+            continue
+        if seg_start > end:
+            break
+        if seg_start > cursor:
+            gaps.append((cursor, seg_start - timedelta(days=1)))
+        cursor = max(cursor, seg_end + timedelta(days=1))
+    if cursor <= end:
+        gaps.append((cursor, end))
+    return gaps
+
+
+class RangeCache:
+    def __init__(self, max_series=MAX_SERIES):
+        self.max_series = max_series
+        self.series = OrderedDict()
+        self.lock = threading.Lock()
+        self.fetched_days = 0
+        self.served_days = 0
+
+    def segments(self, key):
+        with self.lock:
+            return list(self.series.get(key, []))
+
+    def insert(self, key, start, end, rows, time_column="timestamp"):
+        # Merge [start, end] with every segment it overlaps or touches
+        end = min(end, settled_until())
+        if end < start:
+            return
+        with self.lock:
+            merged_start, merged_end, frames = start, end, [rows]
+            kept = []
+            for seg_start, seg_end, seg_rows in self.series.get(key, []):
+                if seg_end < start - timedelta(days=1) or seg_start > end + timedelta(days=1):
+                    kept.append((seg_start, seg_end, seg_rows))
+                else:
+                    merged_start, merged_end = min(merged_start, seg_start), max(merged_end, seg_end)
+                    frames.insert(0, seg_rows)
+            frames = [f for f in frames if not f.empty]
+            merged = pd.concat(frames, ignore_index=True) if frames else rows.iloc[0:0]
+            if not merged.empty:
+                days = pd.to_datetime(merged[time_column])
+                merged = merged[days <= merged_end].drop_duplicates(subset=time_column, keep="last")
+                merged = merged.sort_values(by=time_column).reset_index(drop=True)
+            kept.append((merged_start, merged_end, merged))
+            self.series[key] = sorted(kept, key=lambda segment: segment[0])
+            self.series.move_to_end(key)
+            while len(self.series) > self.max_series:
+                self.series.popitem(last=False)
+
+    def get(self, key, start, end, fetch, granularity="daily", time_column="timestamp"):
+        start, end = pd.Timestamp(start).normalize(), pd.Timestamp(end).normalize()
+        query_start, query_end = align(start, end, granularity)
+        fresh = []
+        for gap_start, gap_end in missing_ranges(self.segments(key), query_start, query_end):
+            gap_start, gap_end = align(gap_start, gap_end, granularity)
+            rows = fetch(gap_start, gap_end)
+            self.insert(key, gap_start, gap_end, rows, time_column)
+            fresh.append(rows)
+            self.fetched_days += (gap_end - gap_start).days + 1
+
+        frames = [rows for seg_start, seg_end, rows in self.segments(key)
+                  if seg_end >= query_start and seg_start <= query_end]
+        # Unsettled rows are not cached, so take them from this query's fetches
+        frames = [f for f in frames + fresh if not f.empty]
+        if not frames:
+            return fresh[0] if fresh else pd.DataFrame(columns=[time_column])
+        df = pd.concat(frames, ignore_index=True).drop_duplicates(subset=time_column, keep="last")
+        days = pd.to_datetime(df[time_column])
+        if granularity == "daily":
+            df = df[(days >= start) & (days <= end)]
+        else:
+            df = df[days.dt.to_period(PERIOD_FREQ[granularity]).isin(complete_periods(granularity, start, end))]
+        self.served_days += (end - start).days + 1
+        return df.sort_values(by=time_column).reset_index(drop=True)
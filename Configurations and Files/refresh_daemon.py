@@ -0,0 +1,416 @@
+import argparse
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta, timezone
+import pandas as pd
+import requests
+import category_index
+import country_similarity
+import local_store
+import sketches
+import wikimedia_api as api
+from article_dictionary import ArticleDictionary
+from file_lock import locked
+
+# Long-running scheduler that keeps the local store current. Each dataset knows
+# when Wikimedia publishes it (daily pageviews and top pages, monthly editors and
+# commons metrics); on every run only the periods missing from the store are
+# requested, with per-dataset and global concurrency limits and jitter.
+#
+#   python refresh_daemon.py            # run forever
+#   python refresh_daemon.py --once     # refresh everything that is due, then exit
+#   python refresh_daemon.py --status   # print the last recorded status
+#
+# Periods the API has no data for (a 404 or an empty list, e.g. a category with
+# no views or a day before a series started) are recorded under EMPTY_DIR and not
+# requested again, so they never count as failures.
+
+STATUS_PATH = os.path.join(local_store.STORE_DIR, "_refresh_status.json")
+EMPTY_DIR = os.path.join(local_store.STORE_DIR, "_empty_periods")
+
+# Global cap on in-flight API requests across all datasets
+MAX_CONCURRENT_REQUESTS = 8
+# Random delay before each request and each scheduled run, in seconds
+REQUEST_JITTER = 0.5
+SCHEDULE_JITTER = 15 * 60
+# Retry a run that had failures after this long instead of waiting for the next publish
+RETRY_AFTER = timedelta(hours=1)
+# Periods this recent are requested again on each publish even if they came back
+# empty, in case upstream published them late
+RECHECK_EMPTY = timedelta(days=31)
+# Fetched rows are buffered across responses and upserted once either limit is
+# reached; every upsert rewrites the dataset file, so flushes must stay rare
+FLUSH_ROWS = 250_000
+FLUSH_SECONDS = 10 * 60
+
+# Parameter space, as in the Script_*.py collectors
+projects = ["en.wikipedia.org", "de.wikipedia.org", "fr.wikipedia.org", "es.wikipedia.org"]
+access_methods = ["desktop", "mobile-app", "mobile-web"]
+agents = ["user", "spider", "automated"]
+editor_projects = projects + ["commons.wikimedia.org", "meta.wikimedia.org", "wikidata.org"]
+editor_types = ["anonymous", "group-bot", "name-bot", "user"]
+page_types = ["content", "non-content"]
+activity_levels = ["1..4-edits", "5..24-edits", "25..99-edits", "100..-edits"]
+country_activity_levels = ["5..99-edits", "100..-edits"]
+countries = [
+    "US","GB","IN","CA","AU","DE","PH","ID","BR","IT",
+    "FR","NL","IE","MY","ES","BD","GR","JP","NZ","PL",
+    "SE","HK","MX","NG","IL","KR","CH","BE","AR","PT",
+    "NO","RO","ZA","TW","FI","CZ","RS","BG","UA","DK",
+    "HU","NP","AT","CL","HR","LK","PE","CO","KE","LT"
+]
+commons_scopes = ["shallow", "deep"]
+commons_wikis = ["en.wikipedia", "de.wikipedia", "fr.wikipedia", "es.wikipedia", "hi.wikipedia"]
+
+
+def load_categories(path="commons_category_allow_list.tsv"):
+    if not os.path.exists(path):
+        return []
+    return pd.read_csv(path, sep='\t', header=None)[0].tolist()
+
+
+def _ymd(day):
+    return day.strftime("%Y"), day.strftime("%m"), day.strftime("%d")
+
+
+def fetch_pageviews_range(params, first, last, session):
+    project, access, agent = params
+    return api.fetch_pageviews(project, access, agent, "daily", first.strftime("%Y%m%d00"), last.strftime("%Y%m%d00"), session)
+
+
+def fetch_editors_range(params, first, last, session):
+    project, editor_type, page_type, activity_level = params
+    # The editors end date is exclusive
+    end = (last + timedelta(days=1)).strftime("%Y%m%d")
+    return api.fetch_editors(project, editor_type, page_type, activity_level, "daily", first.strftime("%Y%m%d"), end, session)
+
+
+def fetch_top_pages_day(params, day, _, session):
+    project, access = params
+    return api.fetch_top_pages(project, access, *_ymd(day), session)
+
+
+def fetch_top_pages_by_country_day(params, day, _, session):
+    country, access = params
+    return api.fetch_top_pages_by_country(country, access, *_ymd(day), session)
+
+
+def fetch_editors_by_country_month(params, month, _, session):
+    project, activity_level = params
+    return api.fetch_editors_by_country(project, activity_level, *_ymd(month)[:2], session)
+
+
+def fetch_top_pages_by_category_month(params, month, _, session):
+    category, category_scope, wiki = params
+    return api.fetch_top_pages_by_category(category, category_scope, wiki, *_ymd(month)[:2], session)
+
+
+def build_datasets():
+    # publish: how often new data appears; lag: delay after the period closes;
+    # step: "range" = one request for all missing days of a series,
+    # "day"/"month" = one request per missing period
+    return {
+        "pageviews": {
+            "publish": "daily", "lag": timedelta(hours=6), "step": "range",
+            "series_columns": ["project", "access", "agent"],
+            "series": [(p, a, g) for p in projects for a in access_methods for g in agents],
+            "fetch": fetch_pageviews_range, "backfill_start": "2018-01-01", "max_workers": 4,
+        },
+        "most_viewed_pages": {
+            "publish": "daily", "lag": timedelta(hours=12), "step": "day",
+            "series_columns": ["project", "access"],
+            "series": [(p, "desktop") for p in projects],
+            "fetch": fetch_top_pages_day, "backfill_start": "2023-01-01", "max_workers": 4,
+        },
+        "top_pages_by_country": {
+            "publish": "daily", "lag": timedelta(hours=12), "step": "day",
+            "series_columns": ["country", "access"],
+            "series": [(c, "desktop") for c in countries],
+            "fetch": fetch_top_pages_by_country_day, "backfill_start": "2023-01-01", "max_workers": 4,
+        },
+        "editors_data": {
+            "publish": "monthly", "lag": timedelta(days=5), "step": "range",
+            "series_columns": ["project", "editor_type", "page_type", "activity_level"],
+            "series": [(p, e, t, a) for p in editor_projects for e in editor_types for t in page_types for a in activity_levels],
+            "fetch": fetch_editors_range, "backfill_start": "2018-01-01", "max_workers": 4,
+        },
+        "editors_by_country": {
+            "publish": "monthly", "lag": timedelta(days=5), "step": "month",
+            "series_columns": ["project", "activity_level"],
+            "series": [(p, a) for p in projects for a in country_activity_levels],
+            "fetch": fetch_editors_by_country_month, "backfill_start": "2018-01-01", "max_workers": 2,
+        },
+        "top_pages_by_category": {
+            "publish": "monthly", "lag": timedelta(days=5), "step": "month",
+            "series_columns": ["category", "category_scope", "wiki"],
+            "series": [(c, s, w) for c in load_categories() for s in commons_scopes for w in commons_wikis],
+            "fetch": fetch_top_pages_by_category_month, "backfill_start": "2023-01-01", "max_workers": 4,
+        },
+    }
+
+
+def _month_start(ts):
+    return pd.Timestamp(ts.year, ts.month, 1)
+
+
+def last_published(spec, now):
+    # Last complete period that should be available upstream at `now` (UTC, naive)
+    available = pd.Timestamp(now - spec["lag"])
+    if spec["publish"] == "daily":
+        return available.normalize() - pd.Timedelta(days=1)
+    last_day = _month_start(available) - pd.Timedelta(days=1)
+    return _month_start(last_day) if spec["step"] == "month" else last_day
+
+
+def next_publish(spec, now):
+    now = pd.Timestamp(now)
+    if spec["publish"] == "daily":
+        candidate = now.normalize() + spec["lag"]
+        step = pd.DateOffset(days=1)
+    else:
+        candidate = _month_start(now) + spec["lag"]
+        step = pd.DateOffset(months=1)
+    while candidate <= now:
+        candidate += step
+    return candidate.to_pydatetime()
+
+
+def empty_periods_path(name):
+    return os.path.join(EMPTY_DIR, f"{name}.parquet")
+
+
+def load_empty_periods(name, series_columns):
+    # Periods recorded as having no data upstream, per series, as a sorted DatetimeIndex
+    path = empty_periods_path(name)
+    if not os.path.exists(path):
+        return {}
+    df = pd.read_parquet(path)
+    return {
+        key if isinstance(key, tuple) else (key,): pd.DatetimeIndex(group["period"]).sort_values()
+        for key, group in df.groupby(series_columns)
+    }
+
+
+def record_empty_periods(name, series_columns, empty):
+    # empty: [(params, DatetimeIndex of periods without data)]
+    frames = [pd.DataFrame({**dict(zip(series_columns, params)), "period": periods})
+              for params, periods in empty if len(periods)]
+    if not frames:
+        return
+    path = empty_periods_path(name)
+    os.makedirs(EMPTY_DIR, exist_ok=True)
+    with locked(path):
+        if os.path.exists(path):
+            frames.insert(0, pd.read_parquet(path))
+        df = pd.concat(frames, ignore_index=True).drop_duplicates(subset=series_columns + ["period"])
+        tmp_path = path + ".tmp"
+        df.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, path)
+
+
+def plan_tasks(name, spec, now):
+    # Plan from the periods each series is missing rather than from its latest
+    # one: tasks finish out of order, so a failed day can sit before stored ones
+    last = last_published(spec, now)
+    stored = local_store.stored_periods(name, spec["series_columns"])
+    # Empty periods are skipped once they are old enough not to be published late
+    empty = load_empty_periods(name, spec["series_columns"])
+    settled = pd.Timestamp(now) - RECHECK_EMPTY
+    freq = "MS" if spec["step"] == "month" else "D"
+    tasks = []
+    for params in spec["series"]:
+        periods = stored.get(tuple(params))
+        no_data = empty.get(tuple(params))
+        first = pd.Timestamp(spec["backfill_start"])
+        if spec["step"] == "range" and periods is not None:
+            # A range series is fetched from its first missing day, so nothing before its
+            # first stored day was ever available upstream
+            first = max(first, periods[0])
+        missing = pd.date_range(first, last, freq=freq)
+        if periods is not None:
+            missing = missing.difference(periods)
+        if no_data is not None:
+            missing = missing.difference(no_data[no_data < settled])
+        if missing.empty:
+            continue
+        if spec["step"] == "range":
+            # One request from the earliest missing day; stored days in between are upserted again
+            tasks.append((params, missing[0], last))
+        else:
+            tasks.extend((params, period, period) for period in missing)
+    return tasks
+
+
+class RefreshDaemon:
+    def __init__(self, datasets=None):
+        self.datasets = build_datasets()
+        if datasets:
+            self.datasets = {name: spec for name, spec in self.datasets.items() if name in datasets}
+        self.request_slots = threading.BoundedSemaphore(MAX_CONCURRENT_REQUESTS)
+        self.session = requests.Session()
+        self.status = self.load_status()
+        self.next_run = {name: datetime.now(timezone.utc).replace(tzinfo=None) for name in self.datasets}
+
+    @staticmethod
+    def load_status():
+        if os.path.exists(STATUS_PATH):
+            with open(STATUS_PATH) as f:
+                return json.load(f)
+        return {}
+
+    def save_status(self):
+        os.makedirs(local_store.STORE_DIR, exist_ok=True)
+        tmp_path = STATUS_PATH + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.status, f, indent=2, default=str)
+        os.replace(tmp_path, STATUS_PATH)
+
+    def fetch_task(self, spec, task):
+        # Rows for the task, or None when the API has no data for it (404)
+        params, first, last = task
+        time.sleep(random.uniform(0, REQUEST_JITTER))
+        with self.request_slots:
+            try:
+                df = spec["fetch"](params, first, last, self.session)
+            except requests.exceptions.HTTPError as e:
+                if e.response is not None and e.response.status_code == 404:
+                    return None
+                raise
+        # Range endpoints may return days past the requested window
+        if spec["step"] == "range" and not df.empty:
+            df = df[local_store.period_column(df) <= last]
+        return df
+
+    @staticmethod
+    def empty_periods(spec, task, df):
+        # Periods of the task the response had no rows for
+        _, first, last = task
+        if spec["step"] != "range":
+            return pd.DatetimeIndex([first]) if df is None or df.empty else pd.DatetimeIndex([])
+        window = pd.date_range(first, last, freq="D")
+        if df is None or df.empty:
+            return window
+        return window.difference(local_store.period_column(df).unique())
+
+    def refresh(self, name, now):
+        spec = self.datasets[name]
+        state = self.status.setdefault(name, {})
+        state["last_run_started"] = now.isoformat()
+        tasks = plan_tasks(name, spec, now)
+        failed = 0
+        # Failures worth retrying soon: transport errors, 5xx and rate limiting
+        transient = 0
+        rows = 0
+        pending = []
+        pending_rows = 0
+        pending_empty = []
+        empty_periods = 0
+        last_flush = time.monotonic()
+        # Days (or months) written this run, for the derived indexes
+        changed = set()
+        dictionary = ArticleDictionary() if name in local_store.ARTICLE_DATASETS else None
+
+        def flush():
+            nonlocal rows, pending, pending_rows, pending_empty, last_flush
+            last_flush = time.monotonic()
+            record_empty_periods(name, spec["series_columns"], pending_empty)
+            pending_empty = []
+            if pending:
+                batch = pd.concat(pending, ignore_index=True)
+                local_store.upsert_dataset(name, batch, dictionary)
+                if name == "top_pages_by_country":
+                    changed.update(country_similarity.with_periods(batch)["period_day"].unique())
+                elif name == "top_pages_by_category":
+                    changed.update(category_index.month_keys(batch))
+                rows += len(batch)
+                pending = []
+                pending_rows = 0
+
+        with ThreadPoolExecutor(max_workers=spec["max_workers"]) as executor:
+            futures = {executor.submit(self.fetch_task, spec, task): task for task in tasks}
+            for future in as_completed(futures):
+                params, first, _ = futures[future]
+                try:
+                    df = future.result()
+                except requests.exceptions.RequestException as e:
+                    failed += 1
+                    status = e.response.status_code if e.response is not None else None
+                    if status is None or status >= 500 or status == 429:
+                        transient += 1
+                    print(f"Error fetching {name} for {params}, {first.date()}: {e}")
+                    continue
+                except Exception as e:
+                    # A malformed response (bad JSON, unexpected shape) fails its task only
+                    failed += 1
+                    print(f"Error decoding {name} for {params}, {first.date()}: {type(e).__name__}: {e}")
+                    continue
+                empty = self.empty_periods(spec, futures[future], df)
+                if len(empty):
+                    pending_empty.append((params, empty))
+                    empty_periods += len(empty)
+                if df is not None and not df.empty:
+                    pending.append(df)
+                    pending_rows += len(df)
+                if pending_rows >= FLUSH_ROWS or time.monotonic() - last_flush >= FLUSH_SECONDS:
+                    flush()
+        flush()
+
+        # Derived indexes are rebuilt once per run, after the last flush
+        if changed and name == "top_pages_by_country":
+            # Recompute similarity for the days (and months) that changed, and their
+            # distinct-article / heavy-hitter sketches from the rows now stored
+            country_similarity.update_similarity(sorted(changed))
+            sketches.update_top_pages_days(changed)
+        elif changed and name == "top_pages_by_category":
+            category_index.update_index(changed)
+
+        finished = datetime.now(timezone.utc).replace(tzinfo=None)
+        state.update({
+            "last_run_finished": finished.isoformat(),
+            "tasks": len(tasks),
+            "failed": failed,
+            "empty_periods": empty_periods,
+            "rows_written": rows,
+            "published_through": str(last_published(spec, now).date()),
+        })
+        if failed == 0:
+            state["last_success"] = finished.isoformat()
+        # Permanent errors (4xx, malformed responses) would fail the same way within the hour
+        next_run = next_publish(spec, finished) if transient == 0 else finished + RETRY_AFTER
+        self.next_run[name] = next_run + timedelta(seconds=random.uniform(0, SCHEDULE_JITTER))
+        state["next_run"] = self.next_run[name].isoformat()
+        self.save_status()
+        print(f"{name}: {len(tasks)} requests, {failed} failed, {rows} rows stored; next run {state['next_run']}")
+
+    def run_due(self):
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        for name in self.datasets:
+            if self.next_run[name] <= now:
+                self.refresh(name, now)
+
+    def run_forever(self):
+        while True:
+            self.run_due()
+            wake = min(self.next_run.values())
+            time.sleep(max(1.0, (wake - datetime.now(timezone.utc).replace(tzinfo=None)).total_seconds()))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Keep the local Wikimedia store current.")
+    parser.add_argument("--once", action="store_true", help="refresh every due dataset once and exit")
+    parser.add_argument("--status", action="store_true", help="print the last recorded status and exit")
+    parser.add_argument("--datasets", nargs="*", help="limit the daemon to these datasets")
+    args = parser.parse_args()
+
+    if args.status:
+        print(json.dumps(RefreshDaemon.load_status(), indent=2))
+    else:
+        daemon = RefreshDaemon(args.datasets)
+        if args.once:
+            daemon.run_due()
+        else:
+            daemon.run_forever()
@@ -0,0 +1,31 @@
+import os
+import time
+
+# Per-rerun timing for the Streamlit dashboards. Each mark() closes the section
+# that started at the previous mark; report() prints one line per rerun, e.g.
+#
+#   [wiki_dash_v4] rerun 18.2 ms | setup 2.1 | lookups 0.3 | Pageviews 15.8
+#
+# Enabled with WIKI_DASH_PROFILE=1; otherwise marks cost one perf_counter call.
+
+PROFILE_ENABLED = os.environ.get("WIKI_DASH_PROFILE", "") not in ("", "0")
+
+
+class RerunProfiler:
+    def __init__(self, name, enabled=PROFILE_ENABLED):
+        self.name = name
+        self.enabled = enabled
+        self.started = self.last = time.perf_counter()
+        self.sections = []
+
+    def mark(self, section):
+        now = time.perf_counter()
+        self.sections.append((section, (now - self.last) * 1000))
+        self.last = now
+
+    def report(self):
+        total = (time.perf_counter() - self.started) * 1000
+        if self.enabled:
+            parts = " | ".join(f"{section} {ms:.1f}" for section, ms in self.sections)
+            print(f"[{self.name}] rerun {total:.1f} ms | {parts}", flush=True)
+        return total, self.sections
@@ -0,0 +1,276 @@
+import argparse
+import json
+import math
+import os
+import numpy as np
+import pandas as pd
+import local_store
+
+# Mergeable approximate sketches per (country or project, month):
+#   - HyperLogLog for distinct-article counts
+#     (relative standard error 1.04 / sqrt(2 ** HLL_PRECISION), about 0.8%)
+#   - Count-Min for per-article counts
+#     (overestimates by at most CMS_EPSILON * total with probability 1 - CMS_DELTA)
+#   - a bounded candidate list of the heaviest articles, re-ranked from the Count-Min
+#
+# Sketches from different partitions or shards merge exactly (register max / table
+# sum), so they can be built wherever data lands and combined afterwards. Every
+# query runs in memory proportional to the sketch size, not the data size.
+#
+# Stored under local_store/sketches/<family>/<key>/<YYYY-MM>.npz, where family is
+# the source dataset (top_pages_by_country keyed by country, dump_pageviews keyed
+# by project). Each month sketch is the merge of that key's day sketches in
+# <key>/days/<YYYY-MM-DD>.npz.
+
+SKETCH_DIR = os.path.join(local_store.STORE_DIR, "sketches")
+
+HLL_PRECISION = 14
+CMS_EPSILON = 0.001
+CMS_DELTA = 0.01
+TOP_CANDIDATES = 200
+
+
+def hash64(values):
+    # Stable 64-bit hashes (same in every process, unlike hash())
+    return pd.util.hash_pandas_object(pd.Series(values, dtype=str), index=False).to_numpy(dtype=np.uint64)
+
+
+def _bit_length(x):
+    x = x.copy()
+    n = np.zeros(x.shape, dtype=np.int64)
+    for shift in (32, 16, 8, 4, 2, 1):
+        big = x >= (np.uint64(1) << np.uint64(shift))
+        n[big] += shift
+        x[big] >>= np.uint64(shift)
+    return n + (x > 0)
+
+
+class HyperLogLog:
+    def __init__(self, precision=HLL_PRECISION, registers=None):
+        self.precision = precision
+        self.m = 1 << precision
+        self.registers = np.zeros(self.m, dtype=np.uint8) if registers is None else registers
+
+    def add_hashes(self, hashes):
+        p = np.uint64(self.precision)
+        index = (hashes >> (np.uint64(64) - p)).astype(np.int64)
+        rest = hashes & ((np.uint64(1) << (np.uint64(64) - p)) - np.uint64(1))
+        # Position of the leftmost 1-bit in the remaining 64 - p bits
+        rank = (64 - self.precision) - _bit_length(rest) + 1
+        np.maximum.at(self.registers, index, rank.astype(np.uint8))
+
+    def merge(self, other):
+        if other.precision != self.precision:
+            raise ValueError("Cannot merge HyperLogLog sketches of different precision")
+        np.maximum(self.registers, other.registers, out=self.registers)
+
+    def count(self):
+        alpha = 0.7213 / (1 + 1.079 / self.m)
+        estimate = alpha * self.m ** 2 / np.sum(np.power(2.0, -self.registers.astype(np.float64)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if estimate <= 2.5 * self.m and zeros:
+            # Linear counting is more accurate for small cardinalities
+            estimate = self.m * math.log(self.m / zeros)
+        return int(round(estimate))
+
+    @property
+    def relative_error(self):
+        return 1.04 / math.sqrt(self.m)
+
+
+class CountMinSketch:
+    def __init__(self, epsilon=CMS_EPSILON, delta=CMS_DELTA, table=None):
+        self.width = math.ceil(math.e / epsilon)
+        self.depth = math.ceil(math.log(1 / delta))
+        self.epsilon = epsilon
+        self.delta = delta
+        self.table = np.zeros((self.depth, self.width), dtype=np.int64) if table is None else table
+
+    def _columns(self, hashes):
+        # Kirsch-Mitzenmacher: row i uses h1 + i * h2
+        h1 = (hashes & np.uint64(0xFFFFFFFF)).astype(np.int64)
+        h2 = (hashes >> np.uint64(32)).astype(np.int64) | 1
+        return [(h1 + i * h2) % self.width for i in range(self.depth)]
+
+    def add_hashes(self, hashes, counts):
+        counts = np.asarray(counts, dtype=np.int64)
+        for row, columns in enumerate(self._columns(hashes)):
+            np.add.at(self.table[row], columns, counts)
+
+    def estimate_hashes(self, hashes):
+        return np.min([self.table[row][columns] for row, columns in enumerate(self._columns(hashes))], axis=0)
+
+    def estimate(self, items):
+        return self.estimate_hashes(hash64(items))
+
+    @property
+    def total(self):
+        return int(self.table[0].sum())
+
+    def merge(self, other):
+        if other.table.shape != self.table.shape:
+            raise ValueError("Cannot merge Count-Min sketches of different dimensions")
+        self.table += other.table
+
+    def error_bound(self):
+        # Estimates exceed the true count by at most this, with probability 1 - delta
+        return self.epsilon * self.total
+
+
+class ArticleSketch:
+    # HLL + Count-Min + heavy-hitter candidates for one (key, month)
+    def __init__(self):
+        self.hll = HyperLogLog()
+        self.cms = CountMinSketch()
+        self.candidates = {}
+
+    def update(self, articles, counts=None):
+        articles = pd.Series(articles, dtype=str)
+        counts = np.ones(len(articles), dtype=np.int64) if counts is None else np.asarray(counts, dtype=np.int64)
+        if len(articles) == 0:
+            return
+        hashes = hash64(articles)
+        self.hll.add_hashes(hashes)
+        self.cms.add_hashes(hashes, counts)
+        self._refresh_candidates(articles.unique())
+
+    def _refresh_candidates(self, new_articles):
+        pool = list(dict.fromkeys(list(self.candidates) + list(new_articles)))
+        estimates = self.cms.estimate(pool)
+        best = np.argsort(-estimates, kind="stable")[:TOP_CANDIDATES]
+        self.candidates = {pool[i]: int(estimates[i]) for i in best}
+
+    def merge(self, other):
+        self.hll.merge(other.hll)
+        self.cms.merge(other.cms)
+        self._refresh_candidates(list(other.candidates))
+
+    def top(self, k=10):
+        return sorted(self.candidates.items(), key=lambda item: -item[1])[:k]
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + ".tmp.npz"
+        np.savez_compressed(tmp_path, registers=self.hll.registers, table=self.cms.table,
+                            candidates=np.asarray(json.dumps(self.candidates)))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        sketch = cls()
+        if os.path.exists(path):
+            with np.load(path) as data:
+                sketch.hll.registers = data["registers"]
+                sketch.cms.table = data["table"]
+                sketch.candidates = json.loads(str(data["candidates"]))
+        return sketch
+
+
+def sketch_path(family, key, month):
+    return os.path.join(SKETCH_DIR, family, str(key), f"{month}.npz")
+
+
+def day_sketch_path(family, key, day):
+    return os.path.join(SKETCH_DIR, family, str(key), "days", f"{day}.npz")
+
+
+def replace_day_sketches(family, day_sketches):
+    # day_sketches: {(key, "YYYY-MM-DD"): ArticleSketch} built from all of that
+    # day's rows. A day's sketch replaces any earlier one, and each month sketch is
+    # re-merged from its day sketches, so ingesting a day again never counts twice
+    months = set()
+    for (key, day), sketch in day_sketches.items():
+        sketch.save(day_sketch_path(family, key, day))
+        months.add((key, day[:7]))
+    for key, month in months:
+        days_dir = os.path.join(SKETCH_DIR, family, str(key), "days")
+        merged = ArticleSketch()
+        for name in sorted(os.listdir(days_dir)):
+            if name.startswith(month) and name.endswith(".npz"):
+                merged.merge(ArticleSketch.load(os.path.join(days_dir, name)))
+        merged.save(sketch_path(family, key, month))
+
+
+def update_from_top_pages(df):
+    # Rows of top_pages_by_country (article titles, one row per country/day
+    # list), holding every row of each (country, day) they cover: counts are the
+    # number of daily lists an article made
+    day = df["year"].astype(str) + "-" + df["month"].astype(str).str.zfill(2) + "-" + df["day"].astype(str).str.zfill(2)
+    day_sketches = {}
+    for (country, day_key), part in df.groupby([df["country"], day]):
+        sketch = ArticleSketch()
+        sketch.update(part["article"])
+        day_sketches[(country, day_key)] = sketch
+    replace_day_sketches("top_pages_by_country", day_sketches)
+
+
+def update_top_pages_days(days):
+    # Re-sketch the given "YYYY-MM-DD" days from the stored top_pages_by_country
+    # rows; run after those rows are written. Only those days are read, one
+    # filtered read per month
+    by_month = {}
+    for day in sorted(set(days)):
+        year, month, day_of_month = day.split("-")
+        by_month.setdefault((year, month), []).append(day_of_month)
+    frames = [
+        local_store.read_dataset("top_pages_by_country", decode_articles=True,
+                                 filters=[("year", "==", year), ("month", "==", month), ("day", "in", day_list)])
+        for (year, month), day_list in by_month.items()
+    ]
+    frames = [df for df in frames if not df.empty]
+    if frames:
+        update_from_top_pages(pd.concat(frames, ignore_index=True))
+
+
+def load_sketch(family, key, months):
+    # One merged sketch for a key over several months
+    merged = ArticleSketch()
+    for month in months:
+        merged.merge(ArticleSketch.load(sketch_path(family, key, month)))
+    return merged
+
+
+def stored_keys(family):
+    directory = os.path.join(SKETCH_DIR, family)
+    return sorted(os.listdir(directory)) if os.path.isdir(directory) else []
+
+
+def distinct_articles(family, key, months):
+    # (estimate, relative standard error)
+    sketch = load_sketch(family, key, months)
+    return sketch.hll.count(), sketch.hll.relative_error
+
+
+def most_widespread(family, month, k=10, min_count=1):
+    # Articles that reached the most keys (e.g. countries) in a month. A key counts
+    # when its Count-Min estimate minus error_bound() is still >= min_count (true
+    # with probability 1 - CMS_DELTA), or, for min_count=1, when the article is
+    # among the key's candidates, which are only ever articles it saw. A saturated
+    # sketch therefore adds no false hits; an article that is rare in a key and
+    # not one of its candidates can be missed there
+    sketches = {key: ArticleSketch.load(sketch_path(family, key, month)) for key in stored_keys(family)}
+    candidates = list(dict.fromkeys(a for s in sketches.values() for a in s.candidates))
+    if not candidates:
+        return []
+    hashes = hash64(candidates)
+    reach = np.zeros(len(candidates), dtype=np.int64)
+    for sketch in sketches.values():
+        hit = sketch.cms.estimate_hashes(hashes) - sketch.cms.error_bound() >= min_count
+        if min_count <= 1:
+            hit |= np.fromiter((article in sketch.candidates for article in candidates), dtype=bool, count=len(candidates))
+        reach += hit
+    best = np.argsort(-reach, kind="stable")[:k]
+    return [(candidates[i], int(reach[i])) for i in best]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild the top-pages sketches from the collector output.")
+    parser.add_argument("--top-pages-csv", default="top_pages_by_country.csv", help="top_pages_by_country output to sketch")
+    args = parser.parse_args()
+
+    from article_dictionary import read_top_pages
+    import shutil
+    shutil.rmtree(os.path.join(SKETCH_DIR, "top_pages_by_country"), ignore_errors=True)
+    df = read_top_pages(args.top_pages_csv, decode=True)
+    update_from_top_pages(df)
+    print(f"Sketched {len(df)} rows into {os.path.join(SKETCH_DIR, 'top_pages_by_country')}")
@@ -0,0 +1,197 @@
+import glob
+import json
+import os
+import shutil
+import pandas as pd
+from article_dictionary import ArticleDictionary
+import partitioned_store
+
+# PySpark equivalents of the post-processing at the bottom of each Script_*.py
+# (flatten the response, rename editors-ceil / page-title / pageview-count, drop
+# country "--", dedupe, sort). With --engine spark a collector appends every raw
+# response to raw_responses/<dataset>/ as JSON lines and this module runs the
+# transformations in local[*] mode, or on a cluster via --spark-master.
+#
+# Output matches the pandas path: same columns, same rows, same order. Ties on
+# the sort columns keep arrival order, like pandas' stable multi-column sort.
+
+RAW_DIR = "raw_responses"
+
+# Per dataset: where the records sit in the response, column renames, the
+# final column order and the sort columns used by the pandas collector
+DATASETS = {
+    "pageviews": {
+        "records": "items",
+        "renames": {},
+        "columns": ["project", "access", "agent", "timestamp", "views"],
+        "sort": ["project", "access", "agent", "timestamp"],
+    },
+    "editors_data": {
+        "records": "items[0].results",
+        "renames": {},
+        "columns": ["project", "editor_type", "page_type", "activity_level", "date", "editors"],
+        "sort": ["project", "editor_type", "page_type", "activity_level", "date"],
+    },
+    "editors_by_country": {
+        "records": "items[0].countries",
+        "renames": {"editors-ceil": "editors"},
+        "columns": ["project", "activity_level", "year", "month", "country", "editors"],
+        "sort": ["project", "activity_level", "year", "month"],
+    },
+    "most_viewed_pages": {
+        "records": "items[0].articles",
+        "renames": {},
+        "columns": ["project", "access", "year", "month", "day", "article_id", "views", "rank"],
+        "sort": ["project", "access", "year", "month", "day", "rank"],
+    },
+    "top_pages_by_country": {
+        "records": "items[0].articles",
+        "renames": {},
+        "columns": ["country", "access", "year", "month", "day", "project", "article_id", "views_ceil", "rank"],
+        "sort": ["country", "access", "year", "month", "day", "rank"],
+    },
+    "top_pages_by_category": {
+        "records": "items",
+        "renames": {"page-title": "article", "pageview-count": "views_ceil"},
+        "columns": ["category", "category_scope", "wiki", "year", "month", "article_id", "views_ceil", "rank"],
+        "sort": ["category", "category_scope", "wiki", "year", "month", "rank"],
+    },
+}
+
+
+class RawBatchWriter:
+    # Appends (request parameters, raw response) pairs as JSON lines, so the
+    # collector never holds more than one response in memory
+    def __init__(self, dataset, raw_dir=RAW_DIR, lines_per_file=10_000):
+        self.directory = os.path.join(raw_dir, dataset)
+        shutil.rmtree(self.directory, ignore_errors=True)
+        os.makedirs(self.directory)
+        self.lines_per_file = lines_per_file
+        self.seq = 0
+        self.file = None
+
+    def append(self, params, response):
+        if self.seq % self.lines_per_file == 0:
+            self.close()
+            self.file = open(os.path.join(self.directory, f"batch-{self.seq // self.lines_per_file:06d}.jsonl"), "w")
+        self.file.write(json.dumps({"seq": self.seq, "params": params, "response": response}) + "\n")
+        self.seq += 1
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+def get_spark(master="local[*]", app_name="WikimediaETL"):
+    from pyspark.sql import SparkSession
+    return SparkSession.builder.master(master).appName(app_name).getOrCreate()
+
+
+def flatten_raw(spark, dataset, raw_dir=RAW_DIR):
+    from pyspark.sql import functions as F
+    spec = DATASETS[dataset]
+    raw = spark.read.json(os.path.join(raw_dir, dataset))
+    records = F.expr(f"response.{spec['records']}")
+    df = raw.select("seq", "params", F.posexplode_outer(records).alias("item_pos", "item"))
+    df = df.where(F.col("item").isNotNull())
+    # Request parameters override same-named response fields (e.g. "project"),
+    # as the pandas collectors overwrite those columns
+    param_fields = raw.schema["params"].dataType.fieldNames()
+    item_fields = [f for f in df.schema["item"].dataType.fieldNames() if f not in param_fields]
+    return df.select("seq", "item_pos", "params.*", *[F.col("item").getField(f).alias(f) for f in item_fields])
+
+
+def encode_articles(spark, df, dictionary):
+    # Title -> id through the shared article dictionary: only the distinct titles
+    # come back to the driver, the mapping goes out as a broadcast join
+    from pyspark.sql import functions as F
+    titles = df.select("article").distinct().toPandas()["article"]
+    mapping = pd.DataFrame({"article": titles, "article_id": dictionary.encode(titles).to_numpy()})
+    mapping_df = spark.createDataFrame(mapping)
+    return df.join(F.broadcast(mapping_df), on="article", how="left")
+
+
+def postprocess(spark, dataset, existing_csv=None, raw_dir=RAW_DIR, dictionary=None):
+    from pyspark.sql import functions as F
+    spec = DATASETS[dataset]
+    df = flatten_raw(spark, dataset, raw_dir)
+    for old, new in spec["renames"].items():
+        df = df.withColumnRenamed(old, new)
+
+    if dataset == "pageviews":
+        df = df.withColumn("timestamp", F.to_date(F.to_timestamp("timestamp", "yyyyMMddHH")))
+    elif dataset == "editors_data":
+        df = df.withColumn("date", F.to_date(F.to_timestamp("timestamp")))
+    elif dataset == "editors_by_country":
+        # Exclude rows where country is "--"
+        df = df.where(F.col("country") != "--")
+
+    if "article_id" in spec["columns"]:
+        df = encode_articles(spark, df, dictionary)
+
+    # Rows already in the CSV come first, like the pandas concat order
+    order = [F.lit(1).alias("_source"), "seq", "item_pos"]
+    df = df.select(*order, *spec["columns"])
+    if existing_csv and os.path.exists(existing_csv):
+        existing = spark.read.csv(existing_csv, header=True, inferSchema=True)
+        # Bring the CSV's inferred types in line with freshly fetched rows
+        for column in ("timestamp", "date"):
+            if column in spec["columns"]:
+                existing = existing.withColumn(column, F.to_date(column))
+        for column in ("year", "month", "day"):
+            if column in spec["columns"]:
+                width = 4 if column == "year" else 2
+                existing = existing.withColumn(column, F.lpad(F.col(column).cast("string"), width, "0"))
+        existing = existing.withColumn("seq", F.monotonically_increasing_id()).withColumn("item_pos", F.lit(0))
+        df = existing.select(F.lit(0).alias("_source"), "seq", "item_pos", *spec["columns"]).unionByName(df, allowMissingColumns=False)
+
+    # drop_duplicates(): keep the first arrival of every identical row
+    first = df.groupBy(*spec["columns"]).agg(F.min(F.struct("_source", "seq", "item_pos")).alias("_first"))
+    return first.orderBy(*spec["sort"], "_first").select(*spec["columns"])
+
+
+def write_single_csv(df, output_csv):
+    # One CSV with a header, like DataFrame.to_csv(index=False)
+    tmp_dir = output_csv + ".spark"
+    df.coalesce(1).write.mode("overwrite").option("header", True).csv(tmp_dir)
+    part = glob.glob(os.path.join(tmp_dir, "part-*.csv"))[0]
+    os.replace(part, output_csv)
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def write_partitioned(df, name):
+    # Spark-side counterpart of partitioned_store.write_partitioned: year=/month=
+    # directories plus the same _metadata.json the pandas reader prunes with
+    from pyspark.sql import functions as F
+    date_column = next((c for c in ("timestamp", "date") if c in df.columns), None)
+    if date_column is not None:
+        df = df.withColumn("year", F.date_format(date_column, "yyyy")).withColumn("month", F.date_format(date_column, "MM"))
+    else:
+        df = df.withColumn("year", F.col("year").cast("string")).withColumn("month", F.lpad(F.col("month").cast("string"), 2, "0"))
+    directory = os.path.abspath(partitioned_store.dataset_dir(name))
+    df.write.mode("overwrite").partitionBy("year", "month").parquet(directory)
+    counts = df.groupBy("year", "month").count().orderBy("year", "month").collect()
+    partitioned_store.write_metadata(name, {
+        "partition_columns": ["year", "month"],
+        "columns": [c for c in df.columns if c not in ("year", "month")],
+        "partitions": [
+            {"path": os.path.join(f"year={r['year']}", f"month={r['month']}"),
+             "values": {"year": r["year"], "month": r["month"]}, "rows": r["count"]}
+            for r in counts
+        ],
+    })
+
+
+def run_collector_postprocess(dataset, output_csv, partitioned_name=None, master="local[*]"):
+    # Entry point used by the collectors' --engine spark path
+    spark = get_spark(master)
+    dictionary = ArticleDictionary() if "article_id" in DATASETS[dataset]["columns"] else None
+    df = postprocess(spark, dataset, existing_csv=output_csv, dictionary=dictionary).cache()
+    # Materialize before output_csv, which is also an input, gets replaced
+    rows = df.count()
+    write_single_csv(df, output_csv)
+    if partitioned_name:
+        write_partitioned(df, partitioned_name)
+    spark.stop()
+    return rows
@@ -0,0 +1,261 @@
+import argparse
+import os
+import sqlite3
+from contextlib import contextmanager
+from datetime import date
+import pandas as pd
+import local_store
+from article_dictionary import ArticleDictionary, decode_article_column, encode_article_column
+
+# Transactional store shared by several processes: one SQLite database in WAL
+# mode with a table per dataset, keyed on the dataset's primary key
+# (local_store.DATASET_KEYS).
+#
+#   - writers upsert in one transaction per call (batched executemany), so a
+#     reader never sees half of a collector run; concurrent writers queue on
+#     SQLite's write lock for up to BUSY_TIMEOUT seconds instead of clobbering
+#     each other's files
+#   - readers never block writers (WAL); every read, or every query inside
+#     snapshot(), sees one consistent version of the database
+#   - the top-pages tables store "article_id" from the shared article dictionary,
+#     the same ids as the Parquet store, which assigns new ids under its own lock
+#
+# The collectors write here with --sqlite, and local_store reads and writes here
+# when WIKI_STORE_BACKEND=sqlite, which points the dashboards and data_api at it.
+#
+#   python sqlite_store.py --import pageviews pageviews_daily_all_params.csv
+#   python sqlite_store.py --tables
+
+DB_PATH = os.environ.get("WIKI_SQLITE_DB", os.path.join(local_store.STORE_DIR, "wikimedia.db"))
+
+BUSY_TIMEOUT = 120
+BATCH_ROWS = 10_000
+
+# Partition columns are compared as integers whatever form they arrive in ("01" or 1)
+INTEGER_COLUMNS = {"year", "month", "day", "rank", "article_id"}
+
+# pyarrow filter operators (as local_store takes them) -> SQL
+FILTER_OPERATORS = {"==": "=", "=": "=", "!=": "!=", "<": "<", "<=": "<=", ">": ">", ">=": ">="}
+
+
+def connect(path=None):
+    path = path or DB_PATH
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    # Autocommit mode: transactions are opened explicitly below
+    conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT * 1000}")
+    migrate_articles(conn)
+    return conn
+
+
+@contextmanager
+def write_transaction(conn):
+    # IMMEDIATE takes the write lock up front, so two writers never both read
+    # and then fail to upgrade
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+
+
+@contextmanager
+def snapshot(conn):
+    # Every query inside sees the database as of the first read
+    conn.execute("BEGIN")
+    try:
+        yield conn
+    finally:
+        conn.execute("COMMIT")
+
+
+def _quote(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _sql_type(column, dtype):
+    if column in INTEGER_COLUMNS or pd.api.types.is_integer_dtype(dtype) or pd.api.types.is_bool_dtype(dtype):
+        return "INTEGER"
+    if pd.api.types.is_float_dtype(dtype):
+        return "REAL"
+    return "TEXT"
+
+
+def table_columns(conn, name):
+    return [row[1] for row in conn.execute(f"PRAGMA table_info({_quote(name)})")]
+
+
+def ensure_table(conn, name, df):
+    keys = local_store.DATASET_KEYS[name]
+    existing = table_columns(conn, name)
+    if not existing:
+        columns = ", ".join(f"{_quote(c)} {_sql_type(c, df[c].dtype)}" for c in df.columns)
+        primary_key = ", ".join(_quote(c) for c in keys)
+        conn.execute(f"CREATE TABLE {_quote(name)} ({columns}, PRIMARY KEY ({primary_key})) WITHOUT ROWID")
+        return
+    for column in df.columns:
+        if column not in existing:
+            conn.execute(f"ALTER TABLE {_quote(name)} ADD COLUMN {_quote(column)} {_sql_type(column, df[column].dtype)}")
+
+
+def _has_table(conn, name):
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (name,)).fetchone() is not None
+
+
+def migrate_articles(conn):
+    # Databases written when SQLite assigned its own article ids (an "articles"
+    # table): move their rows onto the shared dictionary's ids, once
+    if not _has_table(conn, "articles"):
+        return
+    with write_transaction(conn):
+        if not _has_table(conn, "articles"):
+            return
+        titles = pd.read_sql_query("SELECT article_id, article FROM articles", conn)
+        ids = ArticleDictionary().encode(titles["article"].astype(str)) if len(titles) else []
+        conn.execute("CREATE TEMP TABLE article_ids (old INTEGER PRIMARY KEY, new INTEGER NOT NULL)")
+        conn.executemany("INSERT INTO temp.article_ids VALUES (?, ?)",
+                         zip(titles["article_id"].astype(int).tolist(), [int(i) for i in ids]))
+        for name in sorted(local_store.ARTICLE_DATASETS):
+            if _has_table(conn, name):
+                conn.execute(f"UPDATE {_quote(name)} SET article_id = "
+                             f"(SELECT new FROM temp.article_ids WHERE old = {_quote(name)}.article_id)")
+        conn.execute("DROP TABLE temp.article_ids")
+        conn.execute("DROP TABLE articles")
+
+
+def _prepare(df):
+    df = df.copy()
+    for column in df.columns:
+        if pd.api.types.is_datetime64_any_dtype(df[column]):
+            df[column] = df[column].dt.strftime("%Y-%m-%d")
+        elif column in INTEGER_COLUMNS:
+            df[column] = pd.to_numeric(df[column]).astype("int64")
+    return df
+
+
+def _sql_value(column, value):
+    if isinstance(value, (pd.Timestamp, date)):
+        return value.strftime("%Y-%m-%d")
+    return int(value) if column in INTEGER_COLUMNS else value
+
+
+def where_clause(filters):
+    # pyarrow-form filters, e.g. [("project", "==", "en.wikipedia.org")], as a
+    # condition on read_dataset's table alias and its parameters
+    if not filters:
+        return None, ()
+    conditions, params = [], []
+    for column, operator, value in filters:
+        if operator == "in":
+            values = [_sql_value(column, v) for v in value]
+            conditions.append(f"t.{_quote(column)} IN ({', '.join('?' * len(values))})")
+            params.extend(values)
+        else:
+            conditions.append(f"t.{_quote(column)} {FILTER_OPERATORS[operator]} ?")
+            params.append(_sql_value(column, value))
+    return " AND ".join(conditions), tuple(params)
+
+
+def _upsert_rows(conn, name, df):
+    keys = local_store.DATASET_KEYS[name]
+    columns = ", ".join(_quote(c) for c in df.columns)
+    placeholders = ", ".join("?" * len(df.columns))
+    updates = ", ".join(f"{_quote(c)} = excluded.{_quote(c)}" for c in df.columns if c not in keys)
+    conflict = f"DO UPDATE SET {updates}" if updates else "DO NOTHING"
+    sql = (f"INSERT INTO {_quote(name)} ({columns}) VALUES ({placeholders}) "
+           f"ON CONFLICT ({', '.join(_quote(k) for k in keys)}) {conflict}")
+    values = df.astype(object).where(df.notna(), None).itertuples(index=False, name=None)
+    batch = []
+    for row in values:
+        batch.append(row)
+        if len(batch) >= BATCH_ROWS:
+            conn.executemany(sql, batch)
+            batch = []
+    if batch:
+        conn.executemany(sql, batch)
+
+
+def upsert_dataset(name, frames, dictionary=None, conn=None):
+    # frames: one DataFrame or an iterable of them (e.g. CSV chunks), all written
+    # in a single transaction; new rows win on key collisions. Frames of the
+    # top-pages datasets may carry titles ("article") or ids from the shared
+    # article dictionary ("article_id").
+    if isinstance(frames, pd.DataFrame):
+        frames = [frames]
+    if name in local_store.ARTICLE_DATASETS:
+        # Same ids as the Parquet store; the dictionary's lock is never held while
+        # waiting on SQLite, so encoding inside the transaction cannot deadlock
+        dictionary = dictionary if dictionary is not None else ArticleDictionary()
+        frames = (encode_article_column(df, dictionary) for df in frames)
+    own_conn = conn is None
+    conn = conn or connect()
+    rows = 0
+    try:
+        with write_transaction(conn):
+            for df in frames:
+                if df.empty:
+                    continue
+                df = _prepare(df)
+                ensure_table(conn, name, df)
+                _upsert_rows(conn, name, df)
+                rows += len(df)
+    finally:
+        if own_conn:
+            conn.close()
+    return rows
+
+
+def upsert_csv(name, path, dictionary=None):
+    # Loads an existing collector CSV (see --import below)
+    chunks = pd.read_csv(path, chunksize=BATCH_ROWS, keep_default_na=False, na_values=[""])
+    return upsert_dataset(name, chunks, dictionary)
+
+
+def read_dataset(name, columns=None, where=None, params=(), decode_articles=True, conn=None, dictionary=None):
+    # where: SQL condition with ? placeholders on the table alias t, e.g.
+    # "t.project = ? AND t.timestamp >= ?"
+    own_conn = conn is None
+    conn = conn or connect()
+    try:
+        if not table_columns(conn, name):
+            return pd.DataFrame(columns=columns)
+        selected = ", ".join(f"t.{_quote(c)}" for c in columns) if columns else "t.*"
+        sql = f"SELECT {selected} FROM {_quote(name)} t"
+        if where:
+            sql += f" WHERE {where}"
+        df = pd.read_sql_query(sql, conn, params=params)
+    finally:
+        if own_conn:
+            conn.close()
+    if decode_articles and name in local_store.ARTICLE_DATASETS:
+        df = decode_article_column(df, dictionary if dictionary is not None else ArticleDictionary())
+    return df
+
+
+def list_tables(conn=None):
+    own_conn = conn is None
+    conn = conn or connect()
+    try:
+        names = [row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table' ORDER BY name")]
+        return {n: conn.execute(f"SELECT COUNT(*) FROM {_quote(n)}").fetchone()[0] for n in names}
+    finally:
+        if own_conn:
+            conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load collector CSVs into the shared SQLite store.")
+    parser.add_argument("--import", dest="import_csv", nargs=2, metavar=("DATASET", "CSV"), help="upsert a CSV into a dataset table")
+    parser.add_argument("--tables", action="store_true", help="list tables and row counts")
+    args = parser.parse_args()
+
+    if args.import_csv:
+        name, path = args.import_csv
+        print(f"Upserted {upsert_csv(name, path)} rows from {path} into {name} ({DB_PATH})")
+    if args.tables:
+        for table, count in list_tables().items():
+            print(f"{table}: {count} rows")
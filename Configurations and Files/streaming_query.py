@@ -0,0 +1,76 @@
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+# Runs the upstream calls of one dashboard query in parallel and hands results
+# back as they arrive, so a view can draw its first chart after one request's
+# latency instead of after the slowest one.
+#
+#   with StreamingQuery({"overall": fetch_a, "desktop": fetch_b}, timeout=30) as query:
+#       for key, result, error in query.results():
+#           ...
+#
+# Each task yields exactly one (key, result, error) triple: error is the
+# exception the task raised, or QueryTimeout for tasks still running when the
+# query's deadline passes. cancel() (also called when the with-block exits, e.g.
+# because Streamlit interrupted the script after an input changed) drops the
+# tasks that have not started; tasks already in flight finish in the background
+# and their results are discarded.
+
+QUERY_TIMEOUT = 30
+MAX_WORKERS = 16
+# How often results() checks for cancellation while waiting
+POLL_INTERVAL = 0.1
+
+
+class QueryTimeout(TimeoutError):
+    pass
+
+
+class QueryCancelled(Exception):
+    pass
+
+
+class StreamingQuery:
+    def __init__(self, tasks, timeout=QUERY_TIMEOUT, max_workers=MAX_WORKERS):
+        # tasks: {key: zero-argument callable}
+        self.timeout = timeout
+        self.cancelled = threading.Event()
+        self.executor = ThreadPoolExecutor(max_workers=max(1, min(len(tasks), max_workers)))
+        self.futures = {self.executor.submit(self._run, task): key for key, task in tasks.items()}
+
+    def _run(self, task):
+        if self.cancelled.is_set():
+            raise QueryCancelled()
+        return task()
+
+    def results(self):
+        deadline = time.monotonic() + self.timeout
+        pending = set(self.futures)
+        try:
+            while pending and not self.cancelled.is_set():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                done, pending = wait(pending, timeout=min(POLL_INTERVAL, remaining), return_when=FIRST_COMPLETED)
+                for future in done:
+                    try:
+                        yield self.futures[future], future.result(), None
+                    except Exception as e:
+                        yield self.futures[future], None, e
+            if not self.cancelled.is_set():
+                for future in pending:
+                    yield self.futures[future], None, QueryTimeout(f"no response within {self.timeout}s")
+        finally:
+            self.cancel()
+
+    def cancel(self):
+        self.cancelled.set()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.cancel()
+        return False
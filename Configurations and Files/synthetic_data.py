@@ -0,0 +1,429 @@
+import argparse
+import math
+import os
+import shutil
+import time
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+import local_store
+from dashboard_lookups import load_lookups
+from partitioned_store import append_partitioned, dataset_dir, with_year_month
+from wikimedia_api import COLUMNS
+
+# Synthetic datasets in every collector schema, at production scale, for
+# benchmarking storage, queries, rollups and the dashboards offline:
+#
+#   pageviews              daily series per project/access/agent, with weekly and
+#                          yearly seasonality, growth and heavy-tailed spikes
+#   unique_devices         daily series per project/access site
+#   editors_data           daily series per project/editor type/page type/activity level
+#   editors_by_country     monthly per project/activity level, Zipfian over countries
+#   most_viewed_pages      daily top-1000 per project/access
+#   top_pages_by_country   daily top-1000 per country/access
+#   top_pages_by_category  monthly top-100 per Commons category/scope/wiki
+#
+# Top lists draw articles from a shared vocabulary with Zipfian popularity: each
+# day's list is the top of (popularity x noise) over the most popular
+# candidates plus a few trending tail articles, so lists churn realistically
+# while the head stays stable. Every project sees its own ordering of the
+# vocabulary.
+#
+# Output goes to the configured store (WIKI_LOCAL_STORE) in its native formats:
+# <store>/<dataset>.parquet as local_store reads it, the year=/month= layout of
+# partitioned_store, and optionally the collectors' CSVs under <store>/csv/.
+# Article ids refer to <store>/article_dictionary.csv; point readers that decode
+# titles at it with WIKI_ARTICLE_DICTIONARY. Data is generated and written one chunk at a
+# time, so memory stays flat whatever the row count.
+#
+#   WIKI_LOCAL_STORE=/data/synthetic python synthetic_data.py --rows 100000000
+#   WIKI_LOCAL_STORE=/data/synthetic python synthetic_data.py --datasets pageviews --rows 1000000000 --formats partitioned
+
+# Rows per generated chunk (one Parquet row group)
+CHUNK_ROWS = 2_000_000
+DEFAULT_START = "2016-01-01"
+DEFAULT_END = "2024-12-31"
+ZIPF_EXPONENT = 1.1
+# Candidates scored for each top list, and the share of them drawn from the tail
+CANDIDATES = 3000
+TRENDING_SHARE = 0.05
+
+PAGEVIEW_ACCESS = ["desktop", "mobile-app", "mobile-web"]
+PAGEVIEW_AGENTS = ["user", "spider", "automated"]
+ACCESS_SITES = ["all-sites", "desktop-site", "mobile-site"]
+EDITOR_TYPES = ["anonymous", "group-bot", "name-bot", "user", "all-editor-types"]
+PAGE_TYPES = ["content", "non-content", "all-page-types"]
+ACTIVITY_LEVELS = ["1..4-edits", "5..24-edits", "25..99-edits", "100..-edits", "all-activity-levels"]
+COUNTRY_ACTIVITY_LEVELS = ["5..99-edits", "100..-edits"]
+TOP_ACCESS = ["all-access", "desktop", "mobile-app", "mobile-web"]
+CATEGORY_SCOPES = ["shallow", "deep"]
+CATEGORY_WIKIS = ["commons.wikimedia.org", "en.wikipedia.org", "de.wikipedia.org", "fr.wikipedia.org", "es.wikipedia.org"]
+LANGUAGES = ["en", "de", "fr", "es", "hi", "ja", "ru", "it", "pt", "zh", "ar", "pl", "nl", "sv", "ko", "tr"]
+
+# File names the collectors write their CSVs under
+COLLECTOR_CSV = {
+    "pageviews": "pageviews_daily_all_params.csv",
+    "editors_data": "editors_data.csv",
+    "editors_by_country": "editors_by_country.csv",
+    "most_viewed_pages": "most_viewed_pages.csv",
+    "top_pages_by_country": "top_pages_by_country.csv",
+    "top_pages_by_category": "top_pages_by_category.csv",
+}
+
+
+def project_names(count):
+    # Real project names first, then synthetic ones in the same shape
+    names = [p for p in load_lookups()["projects"]["pageviews"] if p != "all-projects"]
+    names += [f"{LANGUAGES[i % len(LANGUAGES)]}{i:05d}.wikipedia.org" for i in range(count)]
+    return names[:count]
+
+
+def country_codes():
+    return [c["alpha_2"] for c in load_lookups()["countries"]]
+
+
+def category_names(count):
+    names = pd.read_csv("commons_category_allow_list.tsv", sep="\t", header=None)[0].tolist()
+    names += [f"Synthetic_category_{i:07d}" for i in range(count)]
+    return names[:count]
+
+
+def key_grid(count, *dimensions):
+    # First `count` combinations of the dimensions, one column array per dimension
+    grids = np.meshgrid(*[np.arange(len(d)) for d in dimensions], indexing="ij")
+    return [np.asarray(d, dtype=object)[g.ravel()[:count]] for d, g in zip(dimensions, grids)]
+
+
+def month_chunks(days):
+    # Days grouped by calendar month
+    months = days.to_period("M")
+    for month in months.unique():
+        yield days[months == month]
+
+
+def series_blocks(series_count, chunk_days):
+    step = max(1, CHUNK_ROWS // max(1, chunk_days))
+    for lo in range(0, series_count, step):
+        yield slice(lo, min(series_count, lo + step))
+
+
+def daily_values(rng, level, growth, phase, days):
+    # series x days matrix: level, yearly growth, weekly and yearly cycles, noise, rare spikes
+    t = ((days - pd.Timestamp(DEFAULT_START)).days.to_numpy() / 365.25)[None, :]
+    weekly = 1 + 0.08 * np.sin(2 * np.pi * days.dayofweek.to_numpy()[None, :] / 7 + phase[:, None])
+    yearly = 1 + 0.15 * np.sin(2 * np.pi * days.dayofyear.to_numpy()[None, :] / 365.25 + phase[:, None])
+    noise = rng.lognormal(0, 0.1, (len(level), len(days)))
+    spikes = np.where(rng.random((len(level), len(days))) < 0.002, 1 + rng.pareto(1.5, (len(level), len(days))), 1)
+    return level[:, None] * np.exp(growth[:, None] * t) * weekly * yearly * noise * spikes
+
+
+def timeseries_chunks(rng, days, keys, level_mean, level_sigma):
+    # (chunk days, series slice, values) for daily series over every key combination
+    n = len(keys[0])
+    level = rng.lognormal(level_mean, level_sigma, n)
+    growth = rng.normal(0.02, 0.1, n)
+    phase = rng.uniform(0, 2 * np.pi, n)
+    for chunk_days in month_chunks(days):
+        for block in series_blocks(n, len(chunk_days)):
+            values = daily_values(rng, level[block], growth[block], phase[block], chunk_days)
+            yield chunk_days, block, values
+
+
+def series_frame(keys, columns, block, chunk_days, time_column):
+    m = len(chunk_days)
+    df = pd.DataFrame({column: np.repeat(key[block], m) for column, key in zip(columns, keys)})
+    df[time_column] = np.tile(chunk_days.to_numpy(), block.stop - block.start)
+    return df
+
+
+def generate_pageviews(rows, days, rng, vocabulary):
+    series = math.ceil(rows / len(days))
+    projects = project_names(math.ceil(series / (len(PAGEVIEW_ACCESS) * len(PAGEVIEW_AGENTS))))
+    keys = key_grid(series, projects, PAGEVIEW_ACCESS, PAGEVIEW_AGENTS)
+    for chunk_days, block, values in timeseries_chunks(rng, days, keys, 11, 2.5):
+        df = series_frame(keys, ["project", "access", "agent"], block, chunk_days, "timestamp")
+        df["views"] = values.ravel().astype("int64")
+        yield df[COLUMNS["pageviews"]]
+
+
+def generate_unique_devices(rows, days, rng, vocabulary):
+    series = math.ceil(rows / len(days))
+    projects = project_names(math.ceil(series / len(ACCESS_SITES)))
+    keys = key_grid(series, projects, ACCESS_SITES)
+    for chunk_days, block, values in timeseries_chunks(rng, days, keys, 10, 2.5):
+        df = series_frame(keys, ["project", "access_site"], block, chunk_days, "timestamp")
+        devices = values.ravel().astype("int64")
+        df["granularity"] = "daily"
+        df["devices"] = devices
+        df["offset"] = (devices * rng.uniform(0.05, 0.2, len(devices))).astype("int64")
+        df["underestimate"] = devices - df["offset"].to_numpy()
+        yield df[COLUMNS["unique_devices"]]
+
+
+def generate_editors_data(rows, days, rng, vocabulary):
+    series = math.ceil(rows / len(days))
+    projects = project_names(math.ceil(series / (len(EDITOR_TYPES) * len(PAGE_TYPES) * len(ACTIVITY_LEVELS))))
+    keys = key_grid(series, projects, EDITOR_TYPES, PAGE_TYPES, ACTIVITY_LEVELS)
+    for chunk_days, block, values in timeseries_chunks(rng, days, keys, 4, 2):
+        df = series_frame(keys, ["project", "editor_type", "page_type", "activity_level"], block, chunk_days, "date")
+        df["editors"] = values.ravel().astype("int64")
+        yield df[COLUMNS["editors_data"]]
+
+
+def generate_editors_by_country(rows, days, rng, vocabulary):
+    countries = np.asarray(country_codes(), dtype=object)
+    months = days.to_period("M").unique()
+    # Between a quarter and all of the countries report editors in a month
+    per_project = len(COUNTRY_ACTIVITY_LEVELS) * len(months) * len(countries) * 0.625
+    projects = project_names(math.ceil(rows / per_project))
+    weights = 1 / np.arange(1, len(countries) + 1) ** ZIPF_EXPONENT
+    # Each project's editors come from a stable ranking of countries
+    rankings = {project: rng.permutation(len(countries)) for project in projects}
+    frames, buffered = [], 0
+    for month in months:
+        for project in projects:
+            for level_name, level in zip(COUNTRY_ACTIVITY_LEVELS, (5000, 500)):
+                present = int(rng.integers(len(countries) // 4, len(countries) + 1))
+                order = rankings[project][:present]
+                editors = level * weights[:present] * rng.lognormal(0, 0.2, present)
+                # The API reports editor counts rounded up to a multiple of 10
+                editors = (np.ceil(editors / 10) * 10).astype("int64")
+                frames.append(pd.DataFrame({"project": project, "activity_level": level_name,
+                                            "year": f"{month.year}", "month": f"{month.month:02d}",
+                                            "country": countries[order], "editors": editors}))
+                buffered += present
+        if buffered >= CHUNK_ROWS:
+            yield pd.concat(frames, ignore_index=True)[COLUMNS["editors_by_country"]]
+            frames, buffered = [], 0
+    if frames:
+        yield pd.concat(frames, ignore_index=True)[COLUMNS["editors_by_country"]]
+
+
+class Vocabulary:
+    # Article ids 0..size-1, ranked by global popularity (id 0 is the most popular)
+    def __init__(self, size, rng):
+        self.size = size
+        self.rng = rng
+
+    def project_mapping(self):
+        # Affine permutation of the vocabulary, so each project ranks articles differently
+        a = int(self.rng.integers(1, self.size))
+        while math.gcd(a, self.size) != 1:
+            a += 1
+        return a, int(self.rng.integers(0, self.size))
+
+    def top_lists(self, lists, k, mappings):
+        # lists x k article ids and scores: top-k of popularity x noise among the
+        # most popular candidates and a few trending tail articles
+        candidates = min(CANDIDATES, self.size)
+        ranks = np.broadcast_to(np.arange(candidates), (lists, candidates)).copy()
+        trending = self.rng.random((lists, candidates)) < TRENDING_SHARE
+        ranks[trending] = self.rng.integers(candidates, max(candidates + 1, self.size), trending.sum())
+        scores = (ranks + 1.0) ** -ZIPF_EXPONENT * self.rng.lognormal(0, 0.8, (lists, candidates))
+        scores[trending] *= self.rng.lognormal(4, 1, trending.sum())
+        k = min(k, candidates)
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1)
+        top = np.take_along_axis(top, order, axis=1)
+        top_scores = np.take_along_axis(top_scores, order, axis=1)
+        top_ranks = np.take_along_axis(ranks, top, axis=1)
+        a, b = mappings[:, :1], mappings[:, 1:]
+        ids = (a * top_ranks + b) % self.size
+        return ids.astype("int32"), top_scores / top_scores[:, :1]
+
+    def save_dictionary(self, path):
+        ids = np.arange(self.size, dtype=np.int32)
+        titles = pd.Series(ids).map("Synthetic_article_{:08d}".format)
+        pd.DataFrame({"article_id": ids, "article": titles}).to_csv(path, index=False)
+
+
+def top_list_chunks(rng, vocabulary, list_keys, periods, k, total_mean):
+    # (key indices, period, ids, views) for every list on every period
+    mappings = np.array([vocabulary.project_mapping() for _ in range(len(list_keys[0]))], dtype=np.int64)
+    totals = rng.lognormal(total_mean, 1.5, len(list_keys[0]))
+    step = max(1, CHUNK_ROWS // k)
+    for period in periods:
+        for lo in range(0, len(list_keys[0]), step):
+            block = slice(lo, min(len(list_keys[0]), lo + step))
+            ids, shares = vocabulary.top_lists(block.stop - block.start, k, mappings[block])
+            views = (totals[block, None] * shares * rng.lognormal(0, 0.1, (block.stop - block.start, 1))).astype("int64")
+            yield block, period, dedupe_ids(ids, vocabulary.size), views
+
+
+def dedupe_ids(ids, size):
+    # A trending article can be drawn twice in one list; later entries move to the
+    # next free id so every list names an article once
+    for row in np.flatnonzero([len(np.unique(r)) < len(r) for r in ids]):
+        seen = set()
+        for j, article_id in enumerate(ids[row]):
+            while article_id in seen:
+                article_id = (article_id + 1) % size
+            seen.add(article_id)
+            ids[row, j] = article_id
+    return ids
+
+
+def list_frame(list_keys, columns, block, ids, views, values_column, period_columns):
+    lists, k = ids.shape
+    df = pd.DataFrame({column: np.repeat(key[block], k) for column, key in zip(columns, list_keys)})
+    for column, value in period_columns.items():
+        df[column] = value
+    df["article_id"] = ids.ravel()
+    df[values_column] = views.ravel()
+    df["rank"] = np.tile(np.arange(1, k + 1, dtype="int64"), lists)
+    return df
+
+
+def generate_most_viewed_pages(rows, days, rng, vocabulary):
+    k = 1000
+    lists = math.ceil(rows / len(days) / k)
+    projects = project_names(math.ceil(lists / len(PAGEVIEW_ACCESS)))
+    keys = key_grid(lists, projects, PAGEVIEW_ACCESS)
+    columns = ["project", "access", "year", "month", "day", "article_id", "views", "rank"]
+    for block, day, ids, views in top_list_chunks(rng, vocabulary, keys, days, k, 13):
+        period = {"year": f"{day.year}", "month": f"{day.month:02d}", "day": f"{day.day:02d}"}
+        yield list_frame(keys, ["project", "access"], block, ids, views, "views", period)[columns]
+
+
+def generate_top_pages_by_country(rows, days, rng, vocabulary):
+    k = 1000
+    countries = country_codes()
+    # Capped at every country/access pair (about 1B rows over the default range)
+    lists = min(len(countries) * len(TOP_ACCESS), math.ceil(rows / len(days) / k))
+    keys = key_grid(lists, countries, TOP_ACCESS)
+    # Each country mostly reads its own language's Wikipedia, with some English
+    home = np.asarray([f"{LANGUAGES[i % len(LANGUAGES)]}.wikipedia" for i in range(len(countries))], dtype=object)
+    home_by_key = home[np.repeat(np.arange(len(countries)), len(TOP_ACCESS))[:lists]]
+    columns = ["country", "access", "year", "month", "day", "project", "article_id", "views_ceil", "rank"]
+    for block, day, ids, views in top_list_chunks(rng, vocabulary, keys, days, k, 10):
+        period = {"year": f"{day.year}", "month": f"{day.month:02d}", "day": f"{day.day:02d}"}
+        df = list_frame(keys, ["country", "access"], block, ids, views, "views_ceil", period)
+        project = np.repeat(home_by_key[block], k)
+        project[rng.random(len(project)) < 0.1] = "en.wikipedia"
+        df["project"] = project
+        # Per-country views are published rounded up to a multiple of 100
+        df["views_ceil"] = (np.ceil(df["views_ceil"].to_numpy() / 100) * 100).astype("int64")
+        yield df[columns]
+
+
+def generate_top_pages_by_category(rows, days, rng, vocabulary):
+    k = 100
+    months = days.to_period("M").unique()
+    lists = math.ceil(rows / len(months) / k)
+    categories = category_names(math.ceil(lists / (len(CATEGORY_SCOPES) * len(CATEGORY_WIKIS))))
+    keys = key_grid(lists, categories, CATEGORY_SCOPES, CATEGORY_WIKIS)
+    columns = ["category", "category_scope", "wiki", "year", "month", "article_id", "views_ceil", "rank"]
+    for block, month, ids, views in top_list_chunks(rng, vocabulary, keys, months, k, 9):
+        period = {"year": f"{month.year}", "month": f"{month.month:02d}"}
+        yield list_frame(keys, ["category", "category_scope", "wiki"], block, ids, views, "views_ceil", period)[columns]
+
+
+GENERATORS = {
+    "pageviews": generate_pageviews,
+    "unique_devices": generate_unique_devices,
+    "editors_data": generate_editors_data,
+    "editors_by_country": generate_editors_by_country,
+    "most_viewed_pages": generate_most_viewed_pages,
+    "top_pages_by_country": generate_top_pages_by_country,
+    "top_pages_by_category": generate_top_pages_by_category,
+}
+
+# Column of a daily dataset to partition by; the others carry year/month columns
+DATE_COLUMNS = {"pageviews": "timestamp", "unique_devices": "timestamp", "editors_data": "date"}
+
+
+class DatasetWriter:
+    # Appends generated chunks to every requested output format, in batches of
+    # about CHUNK_ROWS rows (generators of small lists yield much smaller chunks)
+    def __init__(self, name, formats):
+        if "partitioned" in formats:
+            # Chunks are appended as parts, so start from an empty dataset
+            shutil.rmtree(dataset_dir(name), ignore_errors=True)
+        self.name = name
+        self.formats = formats
+        self.writer = None
+        self.csv_written = False
+        self.pending = []
+        self.pending_rows = 0
+        self.rows = 0
+
+    def write(self, df):
+        self.pending.append(df)
+        self.pending_rows += len(df)
+        if self.pending_rows >= CHUNK_ROWS:
+            self.flush()
+
+    def flush(self):
+        if not self.pending:
+            return
+        df = pd.concat(self.pending, ignore_index=True) if len(self.pending) > 1 else self.pending[0]
+        self.pending, self.pending_rows = [], 0
+        if "parquet" in self.formats:
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            if self.name == "editors_data":
+                # editors_frame stores calendar dates, not timestamps
+                table = table.set_column(table.schema.get_field_index("date"), "date", pc.cast(table["date"], pa.date32()))
+            if self.writer is None:
+                os.makedirs(local_store.STORE_DIR, exist_ok=True)
+                self.writer = pq.ParquetWriter(local_store.dataset_path(self.name) + ".tmp", table.schema)
+            self.writer.write_table(table.cast(self.writer.schema))
+        if "partitioned" in self.formats:
+            append_partitioned(with_year_month(df, DATE_COLUMNS.get(self.name)), self.name, ["year", "month"])
+        if "csv" in self.formats:
+            csv_dir = os.path.join(local_store.STORE_DIR, "csv")
+            os.makedirs(csv_dir, exist_ok=True)
+            path = os.path.join(csv_dir, COLLECTOR_CSV.get(self.name, f"{self.name}.csv"))
+            df.to_csv(path, index=False, mode="a" if self.csv_written else "w", header=not self.csv_written)
+            self.csv_written = True
+        self.rows += len(df)
+
+    def close(self):
+        self.flush()
+        if self.writer is not None:
+            self.writer.close()
+            os.replace(local_store.dataset_path(self.name) + ".tmp", local_store.dataset_path(self.name))
+        return self.rows
+
+
+def generate(datasets, rows, start, end, formats, articles, seed=0):
+    rng = np.random.default_rng(seed)
+    days = pd.date_range(start, end, freq="D")
+    vocabulary = Vocabulary(articles, rng)
+    if set(datasets) & set(local_store.ARTICLE_DATASETS):
+        os.makedirs(local_store.STORE_DIR, exist_ok=True)
+        vocabulary.save_dictionary(os.path.join(local_store.STORE_DIR, "article_dictionary.csv"))
+    summary = []
+    for name in datasets:
+        started = time.perf_counter()
+        writer = DatasetWriter(name, formats)
+        for chunk in GENERATORS[name](rows, days, rng, vocabulary):
+            writer.write(chunk)
+        written = writer.close()
+        seconds = time.perf_counter() - started
+        summary.append((name, written, seconds))
+        print(f"{name}: {written:,} rows in {seconds:.1f}s ({written / max(seconds, 1e-9):,.0f} rows/s)")
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate synthetic datasets in every collector schema.")
+    parser.add_argument("--datasets", nargs="*", default=list(GENERATORS), choices=list(GENERATORS))
+    parser.add_argument("--rows", type=int, default=10_000_000, help="approximate rows per dataset")
+    parser.add_argument("--start", default=DEFAULT_START)
+    parser.add_argument("--end", default=DEFAULT_END)
+    parser.add_argument("--formats", nargs="*", default=["parquet", "partitioned"], choices=["parquet", "partitioned", "csv"])
+    parser.add_argument("--articles", type=int, default=1_000_000, help="article vocabulary size")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--overwrite", action="store_true", help="replace datasets already in the store")
+    args = parser.parse_args()
+
+    # Never mix synthetic rows into a store that holds collected data
+    existing = [name for name in args.datasets
+                if os.path.exists(local_store.dataset_path(name)) or os.path.isdir(os.path.join(local_store.STORE_DIR, "partitioned", name))]
+    if existing and not args.overwrite:
+        parser.error(f"{local_store.STORE_DIR} already has {', '.join(existing)}; set WIKI_LOCAL_STORE to an empty directory or pass --overwrite")
+
+    generate(args.datasets, args.rows, args.start, args.end, args.formats, args.articles, args.seed)
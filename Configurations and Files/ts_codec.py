@@ -0,0 +1,216 @@
+import argparse
+import json
+import os
+import struct
+import zlib
+import numpy as np
+import pandas as pd
+import local_store
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Compressed on-disk encoding for daily count series (views, editors, devices).
+#
+# Every series is cut into blocks of at most BLOCK_DAYS consecutive days (a gap
+# in the data starts a new block). A block stores its values as zigzag varints
+# of either the first value + deltas or the first value + first delta +
+# delta-of-deltas, whichever is smaller, optionally zstd-compressed. The footer
+# indexes every block by (series, first day, day count, offset), so a date-range
+# read seeks to and decodes only the blocks that overlap it.
+#
+# File layout: MAGIC | block bytes ... | zlib(JSON index) | index length (u64) | MAGIC
+
+MAGIC = b"WTS1"
+BLOCK_DAYS = 256
+
+MODE_DELTA = 0
+MODE_DELTA_OF_DELTA = 1
+
+# Series layout of the store datasets: (series key columns, day column, value column)
+SERIES_DATASETS = {
+    "pageviews": (["project", "access", "agent"], "timestamp", "views"),
+    "editors_data": (["project", "editor_type", "page_type", "activity_level"], "date", "editors"),
+    "unique_devices": (["project", "access_site", "granularity"], "timestamp", "devices"),
+}
+
+
+def zigzag_encode(values):
+    values = values.astype(np.int64)
+    return ((values << 1) ^ (values >> 63)).astype(np.uint64)
+
+
+def zigzag_decode(values):
+    values = values.astype(np.uint64)
+    return ((values >> np.uint64(1)).astype(np.int64)) ^ -((values & np.uint64(1)).astype(np.int64))
+
+
+def varint_encode(values):
+    # Vectorized LEB128: 7 bits per byte, high bit set on all but the last byte
+    values = np.asarray(values, dtype=np.uint64)
+    if len(values) == 0:
+        return b""
+    lengths = np.ones(len(values), dtype=np.int64)
+    for k in range(1, 10):
+        lengths += values >= (np.uint64(1) << np.uint64(7 * k))
+    offsets = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+    out = np.zeros(int(lengths.sum()), dtype=np.uint8)
+    for k in range(int(lengths.max())):
+        has = lengths > k
+        byte = ((values[has] >> np.uint64(7 * k)) & np.uint64(0x7F)).astype(np.uint8)
+        byte |= np.where(lengths[has] > k + 1, 0x80, 0).astype(np.uint8)
+        out[offsets[has] + k] = byte
+    return out.tobytes()
+
+
+def varint_decode(data):
+    data = np.frombuffer(data, dtype=np.uint8)
+    if len(data) == 0:
+        return np.zeros(0, dtype=np.uint64)
+    ends = np.flatnonzero(data < 0x80)
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    position = np.arange(len(data)) - np.repeat(starts, ends - starts + 1)
+    parts = (data & 0x7F).astype(np.uint64) << (np.uint64(7) * position.astype(np.uint64))
+    return np.add.reduceat(parts, starts)
+
+
+def encode_block(values, compression=None):
+    values = np.asarray(values, dtype=np.int64)
+    deltas = np.diff(values)
+    candidates = {
+        MODE_DELTA: np.concatenate((values[:1], deltas)),
+        MODE_DELTA_OF_DELTA: np.concatenate((values[:1], deltas[:1], np.diff(deltas))),
+    }
+    encoded = {mode: varint_encode(zigzag_encode(v)) for mode, v in candidates.items()}
+    mode = min(encoded, key=lambda m: len(encoded[m]))
+    body = encoded[mode]
+    if compression == "zstd":
+        body = zstandard.ZstdCompressor(level=9).compress(body)
+    return mode, body
+
+
+def decode_block(mode, body, compression=None):
+    if compression == "zstd":
+        body = zstandard.ZstdDecompressor().decompress(body)
+    stream = zigzag_decode(varint_decode(body))
+    if mode == MODE_DELTA_OF_DELTA and len(stream) > 2:
+        stream = np.concatenate((stream[:2], np.cumsum(stream[2:]) + stream[1]))
+    return np.cumsum(stream)
+
+
+def write_series_file(df, path, key_columns, day_column, value_column, block_days=BLOCK_DAYS, compression=None):
+    if compression == "zstd" and zstandard is None:
+        raise ImportError("zstd compression needs the 'zstandard' package")
+    df = df.dropna(subset=[value_column])
+    days = pd.to_datetime(df[day_column]).dt.normalize()
+    df = df.assign(_day=(days - pd.Timestamp("1970-01-01")).dt.days.astype(np.int64))
+    df = df.sort_values(by=key_columns + ["_day"])
+
+    index = {"key_columns": key_columns, "day_column": day_column, "value_column": value_column,
+             "compression": compression, "series": []}
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(MAGIC)
+        for key, series in df.groupby(key_columns, sort=False):
+            key = key if isinstance(key, tuple) else (key,)
+            day = series["_day"].to_numpy()
+            values = series[value_column].to_numpy(dtype=np.int64)
+            # Block boundaries: every gap in the days, and every block_days days
+            breaks = np.flatnonzero(np.diff(day) != 1) + 1
+            blocks = []
+            for run_start, run_stop in zip(np.concatenate(([0], breaks)), np.concatenate((breaks, [len(day)]))):
+                for lo in range(run_start, run_stop, block_days):
+                    hi = min(lo + block_days, run_stop)
+                    mode, body = encode_block(values[lo:hi], compression)
+                    blocks.append([int(day[lo]), int(hi - lo), f.tell(), len(body), mode])
+                    f.write(body)
+            index["series"].append({"key": [str(k) for k in key], "blocks": blocks})
+        footer = zlib.compress(json.dumps(index).encode("utf-8"))
+        f.write(footer)
+        f.write(struct.pack("<Q", len(footer)))
+        f.write(MAGIC)
+    os.replace(tmp_path, path)
+    return path
+
+
+class SeriesFile:
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            if f.read(4) != MAGIC:
+                raise ValueError(f"{path} is not a time-series file")
+            f.seek(-12, os.SEEK_END)
+            footer_length = struct.unpack("<Q", f.read(8))[0]
+            f.seek(-12 - footer_length, os.SEEK_END)
+            self.index = json.loads(zlib.decompress(f.read(footer_length)))
+        self.key_columns = self.index["key_columns"]
+        self.series = {tuple(s["key"]): s["blocks"] for s in self.index["series"]}
+
+    def keys(self):
+        return list(self.series)
+
+    def read(self, key, start=None, end=None):
+        # Values of one series between start and end (inclusive), decoding only
+        # the blocks that overlap the range
+        epoch = pd.Timestamp("1970-01-01")
+        first = (pd.Timestamp(start) - epoch).days if start is not None else -(1 << 62)
+        last = (pd.Timestamp(end) - epoch).days if end is not None else 1 << 62
+        day_parts, value_parts = [], []
+        with open(self.path, "rb") as f:
+            for block_day, n, offset, length, mode in self.series.get(tuple(str(k) for k in key), []):
+                if block_day > last or block_day + n - 1 < first:
+                    continue
+                f.seek(offset)
+                values = decode_block(mode, f.read(length), self.index["compression"])
+                days = np.arange(block_day, block_day + n)
+                keep = (days >= first) & (days <= last)
+                day_parts.append(days[keep])
+                value_parts.append(values[keep])
+        days = np.concatenate(day_parts) if day_parts else np.zeros(0, dtype=np.int64)
+        values = np.concatenate(value_parts) if value_parts else np.zeros(0, dtype=np.int64)
+        return pd.DataFrame({
+            self.index["day_column"]: epoch + pd.to_timedelta(days, unit="D"),
+            self.index["value_column"]: values,
+        })
+
+    def read_frame(self, start=None, end=None, keys=None):
+        frames = []
+        for key in keys or self.keys():
+            df = self.read(key, start, end)
+            for column, value in zip(self.key_columns, key):
+                df[column] = value
+            frames.append(df)
+        columns = self.key_columns + [self.index["day_column"], self.index["value_column"]]
+        if not frames:
+            return pd.DataFrame(columns=columns)
+        return pd.concat(frames, ignore_index=True)[columns]
+
+
+# Store integration: local_store/<dataset>.wts next to the Parquet files
+
+def series_path(name):
+    return os.path.join(local_store.STORE_DIR, f"{name}.wts")
+
+
+def write_series_dataset(name, df, compression=None):
+    key_columns, day_column, value_column = SERIES_DATASETS[name]
+    os.makedirs(local_store.STORE_DIR, exist_ok=True)
+    return write_series_file(df, series_path(name), key_columns, day_column, value_column, compression=compression)
+
+
+def read_series_dataset(name, key, start=None, end=None):
+    return SeriesFile(series_path(name)).read(key, start, end)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Encode a daily-count CSV into the compressed series format.")
+    parser.add_argument("csv", help="e.g. pageviews_daily_all_params.csv")
+    parser.add_argument("dataset", choices=sorted(SERIES_DATASETS), help="series layout of the CSV")
+    parser.add_argument("--zstd", action="store_true", help="zstd-compress each block")
+    args = parser.parse_args()
+
+    df = pd.read_csv(args.csv)
+    path = write_series_dataset(args.dataset, df, compression="zstd" if args.zstd else None)
+    print(f"{args.csv}: {os.path.getsize(args.csv):,} bytes -> {path}: {os.path.getsize(path):,} bytes")
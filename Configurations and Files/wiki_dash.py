@@ -3,6 +3,21 @@ import requests
 import pandas as pd
 import plotly.express as px
 from datetime import date
+import local_store
+
+# Unique devices rows for a date range, read from the local store. Returns an
+# empty frame unless every day of the range is stored.
+def load_local_unique_devices(project, start_date, end_date):
+    df = local_store.read_dataset(
+        "unique_devices",
+        filters=[("project", "==", project), ("access_site", "==", "all-sites"), ("granularity", "==", "daily")]
+    )
+    if df.empty:
+        return df
+    df = df[(df["timestamp"] >= pd.Timestamp(start_date)) & (df["timestamp"] <= pd.Timestamp(end_date))]
+    if df["timestamp"].nunique() < (end_date - start_date).days + 1:
+        return df.iloc[0:0]
+    return df.sort_values(by="timestamp")
 
 # Set page configuration for wide view
 st.set_page_config(page_title="Wikimedia Dashboard", layout="wide")
@@ -109,18 +124,22 @@ with tab2:
 
     # Fetch and display unique devices data
     if st.button("Fetch Unique Devices Data", key="fetch_unique_devices"):
-        api_url = f"https://wikimedia.org/api/rest_v1/metrics/unique-devices/{project_devices}/all-sites/daily/{start_devices}/{end_devices}"
-
         try:
-            response = requests.get(api_url, headers=headers)
-            response.raise_for_status()
-            data = response.json()
+            # Historical ranges come from the local store (Script_unique_devices.py);
+            # only ranges it does not cover go to the API
+            df = load_local_unique_devices(project_devices, start_date_devices, end_date_devices)
+            if df.empty:
+                api_url = f"https://wikimedia.org/api/rest_v1/metrics/unique-devices/{project_devices}/all-sites/daily/{start_devices}/{end_devices}"
+                response = requests.get(api_url, headers=headers)
+                response.raise_for_status()
+                data = response.json()
 
-            items = data.get("items", [])
-            if items:
+                items = data.get("items", [])
                 df = pd.DataFrame(items)
-                df["timestamp"] = pd.to_datetime(df["timestamp"], format="%Y%m%d")
+                if items:
+                    df["timestamp"] = pd.to_datetime(df["timestamp"], format="%Y%m%d")
 
+            if not df.empty:
                 # Plot unique devices data
                 st.write("### Unique Devices Chart")
                 fig = px.area(
@@ -1,9 +1,23 @@
+from rerun_profiler import RerunProfiler
+profiler = RerunProfiler("wiki_dash_v4")
+
 import streamlit as st
 import requests
 import pandas as pd
-import plotly.express as px
 from datetime import date
-import pycountry
+from urllib.parse import quote
+# plotly and the scipy-backed indexes (country_similarity, category_index) are
+# imported in the views that use them, so other reruns never load them
+from article_dictionary import ArticleDictionary
+from article_index import build_article_index, normalize_title
+from dashboard_lookups import load_lookups
+from figure_cache import FigureCache, api_data_version
+import granularity_planner
+from range_cache import RangeCache
+from streaming_query import QUERY_TIMEOUT, QueryTimeout, StreamingQuery
+import local_store
+from downsampling import downsample
+profiler.mark("imports")
 
 # Set page configuration for wide view
 st.set_page_config(page_title="Wikimedia Dashboard", layout="wide")
@@ -11,8 +25,43 @@ st.set_page_config(page_title="Wikimedia Dashboard", layout="wide")
 # Set up the Streamlit app
 st.title("Wikimedia Dashboard")
 
-# Create tabs
-tab1, tab2, tab3, tab4 = st.tabs(["Pageviews", "Most Popular Pages", "Page Views for an Article", "Editors"])
+# Only the selected view is rendered (st.tabs would build every tab's widgets on each rerun)
+active_tab = st.radio(
+    "View",
+    ["Pageviews", "Most Popular Pages", "Page Views for an Article", "Editors", "Commons Impact"],
+    horizontal=True,
+    key="active_tab",
+    label_visibility="collapsed",
+)
+
+@st.cache_resource
+def load_dashboard_lookups():
+    # Country and project lists from the static dashboard_lookups.json asset
+    return load_lookups()
+
+lookups = load_dashboard_lookups()
+
+@st.cache_resource
+def load_figure_cache():
+    # One figure cache per server process, shared by every session
+    return FigureCache()
+
+figures = load_figure_cache()
+
+@st.cache_resource
+def load_range_cache():
+    # Per-series day segments shared by every session; moving the date window
+    # only fetches the days no earlier query covered
+    return RangeCache()
+
+ranges = load_range_cache()
+profiler.mark("setup")
+
+# Custom User-Agent header, shared by every view (only one view runs per rerun)
+headers = {
+    "accept": "application/json",
+    "User-Agent": "WikimediaDashboard/1.0 (your_email@example.com)"
+}
 
 def fetch_pageviews_data(input_dict):
     url = "https://wikimedia.org/api/rest_v1/metrics/pageviews/aggregate/{project}/{all_access}/{agent}/{granularity}/{start}/{end}"
@@ -23,9 +72,25 @@ def fetch_pageviews_data(input_dict):
     items = data.get("items", [])
     return items
 
-def get_country_name(country_code):
-        country = pycountry.countries.get(alpha_2=country_code.upper())
-        return country.name if country else "Invalid country code"
+def fetch_pageviews_frame(input_dict):
+    # Monthly, weekly and yearly views are summed from the stored daily series when
+    # the store covers the range; the API is only asked for what is missing
+    def fetch(granularity, start, end):
+        items = fetch_pageviews_data({**input_dict, 'granularity': granularity,
+                                      'start': start.strftime("%Y%m%d00"), 'end': end.strftime("%Y%m%d00")})
+        df = pd.DataFrame(items, columns=["timestamp", "views"])
+        df["timestamp"] = pd.to_datetime(df["timestamp"], format="%Y%m%d%H")
+        return df
+
+    series = {'project': input_dict['project'], 'access': input_dict['all_access'], 'agent': input_dict['agent']}
+    granularity = input_dict['granularity']
+
+    def load(start, end):
+        df, _ = granularity_planner.resolve("pageviews", granularity, series, start, end, fetch)
+        return df
+
+    key = ("pageviews", *series.values(), granularity)
+    return ranges.get(key, input_dict['start'][:8], input_dict['end'][:8], load, granularity)
 
 def fetch_most_popular_pages(popular_dict):
     if popular_dict['country'] == 'ALL':
@@ -40,6 +105,103 @@ def fetch_most_popular_pages(popular_dict):
     articles = data.get("items", [])[0].get("articles", [])
     return articles
 
+# Upper bound on articles x projects charted together in comparison mode
+MAX_COMPARE_SERIES = 20
+
+@st.cache_data(ttl=3600, show_spinner=False)
+def fetch_article_pageviews(project, access, agent, article, granularity, start, end):
+    api_url = (f"https://wikimedia.org/api/rest_v1/metrics/pageviews/per-article/"
+               f"{project}/{access}/{agent}/{quote(article, safe='')}/{granularity}/{start}/{end}")
+    article_headers = {
+        "User-Agent": "MyWikimediaApp/1.0 (mailto:example@example.com)",  # Replace with your email
+        "accept": "application/json"
+    }
+    response = requests.get(api_url, headers=article_headers)
+    response.raise_for_status()
+    items = response.json().get("items", [])
+    df = pd.DataFrame(items, columns=["timestamp", "views"])
+    df["timestamp"] = pd.to_datetime(df["timestamp"], format="%Y%m%d%H")
+    df["views"] = df["views"].astype(int)
+    return df
+
+def load_article_pageviews(project, access, agent, article, granularity, start, end):
+    # Weekly and yearly series (and monthly, once backfilled) come from daily data;
+    # every API call still goes through the st.cache_data cache above
+    def fetch(api_granularity, range_start, range_end):
+        return fetch_article_pageviews(project, access, agent, article, api_granularity,
+                                       range_start.strftime('%Y%m%d00'), range_end.strftime('%Y%m%d00'))
+
+    series = {'project': project, 'access': access, 'agent': agent, 'article': article}
+
+    def load(range_start, range_end):
+        df, _ = granularity_planner.resolve("article_pageviews", granularity, series, range_start, range_end, fetch,
+                                           load_article_dictionary())
+        return df
+
+    key = ("article_pageviews", project, access, agent, article, granularity)
+    return ranges.get(key, start[:8], end[:8], load, granularity)
+
+def start_query(view, tasks, timeout=QUERY_TIMEOUT):
+    # A view's previous query is cancelled when a new one starts (e.g. the inputs
+    # changed while it was still loading)
+    previous = st.session_state.get(f"query_{view}")
+    if previous is not None:
+        previous.cancel()
+    query = StreamingQuery(tasks, timeout=timeout)
+    st.session_state[f"query_{view}"] = query
+    return query
+
+def stream_article_series(series_keys, access, agent, granularity, start, end):
+    # One worker per (project, article), yielding each series as it arrives;
+    # each call goes through the st.cache_data cache above
+    def fetch_task(project, article):
+        return lambda: load_article_pageviews(project, access, agent, article, granularity, start, end)
+
+    return start_query("article_pageviews", {key: fetch_task(*key) for key in series_keys})
+
+def align_article_series(series, granularity, start_date, end_date, normalize=False):
+    # Put every series on one shared time index; days a series has no data stay empty
+    freq = {"daily": "D", "weekly": "W-MON", "monthly": "MS", "yearly": "YS"}[granularity]
+    index = pd.date_range(pd.Timestamp(start_date), pd.Timestamp(end_date), freq=freq, name="timestamp")
+    wide = pd.DataFrame(index=index)
+    for (project, article), df in series.items():
+        label = article if len({p for p, _ in series}) == 1 else f"{article} ({project})"
+        wide[label] = df.set_index("timestamp")["views"].reindex(index)
+    if normalize:
+        # Each series as a percentage of its own peak so small and large articles share a scale
+        wide = wide.div(wide.max().where(lambda peak: peak > 0)).mul(100)
+    return wide
+
+@st.cache_resource
+def load_article_dictionary():
+    return ArticleDictionary()
+
+@st.cache_resource
+def load_article_index():
+    # Built once per server process from every title in the top-pages datasets
+    return build_article_index()
+
+def fetch_editors_frame(params):
+    # Aggregate editor counts through the range cache; the API's end date is
+    # exclusive, the cache's ranges are inclusive
+    def fetch(start, end):
+        api_url = (
+            f"https://wikimedia.org/api/rest_v1/metrics/editors/aggregate/"
+            f"{params['project']}/{params['editor_type']}/{params['page_type']}/{params['activity_level']}/"
+            f"{params['granularity']}/{start.strftime('%Y%m%d')}/{(end + pd.Timedelta(days=1)).strftime('%Y%m%d')}"
+        )
+        response = requests.get(api_url, headers=headers)
+        response.raise_for_status()
+        items = response.json().get("items", [])
+        df = pd.DataFrame(items[0].get("results", []) if items else [], columns=["timestamp", "editors"])
+        df["timestamp"] = pd.to_datetime(df["timestamp"], utc=True).dt.tz_localize(None)
+        return df
+
+    key = ("editors", params['project'], params['editor_type'], params['page_type'],
+           params['activity_level'], params['granularity'])
+    last_day = pd.Timestamp(params['end']) - pd.Timedelta(days=1)
+    return ranges.get(key, params['start'], last_day, fetch, params['granularity'])
+
 def fetch_most_pageviews_category_data(most_by_cat_input):
     url = "https://wikimedia.org/api/rest_v1/metrics/commons-analytics/top-pages-per-category-monthly/{category}/{category_scope}/{wiki}/{year}/{month}"
     api_url = url.format(**most_by_cat_input)
@@ -50,25 +212,15 @@ def fetch_most_pageviews_category_data(most_by_cat_input):
 
 
 # Tab 1: Pageviews
-with tab1:
+if active_tab == "Pageviews":
     st.header("Pageviews")
 
     # Inputs specific to Pageviews tab, displayed horizontally
     col1, col2, col3, col4, col5 = st.columns(5)
     with col1:
-        projects = [
-            "all-projects",
-            "en.wikipedia.org",
-            "de.wikipedia.org",
-            "fr.wikipedia.org",
-            "es.wikipedia.org",
-            "hi.wikipedia.org",
-            "commons.wikimedia.org",
-            "meta.wikimedia.org"
-        ]
-        project = st.selectbox("Select Project", projects)
+        project = st.selectbox("Select Project", lookups["projects"]["pageviews"])
     with col2:
-        granularity_options = ["daily", "monthly"]
+        granularity_options = ["daily", "weekly", "monthly", "yearly"]
         granularity = st.selectbox("Select Granularity", granularity_options)
     with col3:
         agent_options = ["all-agents", "user", "spider", "automated"]
@@ -88,68 +240,80 @@ with tab1:
     page_views_dict_desk = page_views_dict.copy()
     page_views_dict_desk['all_access'] = 'desktop'
 
-    # Custom User-Agent header
-    headers = {
-        "accept": "application/json",
-        "User-Agent": "WikimediaDashboard/1.0 (your_email@example.com)"
-    }
-
     # Fetch data and display chart
     if st.button("Run"):
-        try:
-            items = fetch_pageviews_data(page_views_dict)
-            items_desktop =  fetch_pageviews_data(page_views_dict_desk)
-            if items:
-                df = pd.DataFrame(items)
-                df["timestamp"] = pd.to_datetime(df["timestamp"], format="%Y%m%d%H")
-                df = df[['timestamp', 'views']]
-
-                df_desk = pd.DataFrame(items_desktop)
-                df_desk["timestamp"] = pd.to_datetime(df_desk["timestamp"], format="%Y%m%d%H")
-                df_desk = df_desk[['timestamp', 'views']]
-
-
-                df = df.merge(df_desk, on = ['timestamp'], how = 'left')
-                df.rename({'views_x' : 'Overall Views', 'views_y' : 'Desktop Views'}, axis = 1, inplace = True)
-
-                df['Mobile Views'] = df['Overall Views'] - df['Desktop Views']
-
-                # Plot the data
-                fig = px.line(
-                    df,
-                    x="timestamp",
-                    y="Overall Views",
-                    title=f"Pageviews for {project}",
-                    labels={"timestamp": "Time", "views": "Page Views"}
-                )
+        # Identical queries reuse the cached figures: no fetch, no processing, no figure building
+        figure_version = api_data_version(end_date)
+        figs = figures.get("pageviews", page_views_dict, figure_version)
+        if figs is not None:
+            for fig in figs:
                 st.plotly_chart(fig)
+        else:
+            import plotly.express as px
+            # Both requests run at once; each chart is drawn as soon as its data is in
+            overall_slot, split_slot = st.empty(), st.empty()
+            frames = {}
+            rendered = {}
+            failed = False
+            query = start_query("pageviews", {
+                "overall": lambda: fetch_pageviews_frame(page_views_dict),
+                "desktop": lambda: fetch_pageviews_frame(page_views_dict_desk),
+            })
+            with query:
+                for key, df, error in query.results():
+                    if isinstance(error, QueryTimeout):
+                        st.warning(f"The {key} pageviews request timed out.")
+                        continue
+                    if isinstance(error, requests.exceptions.RequestException):
+                        failed = True
+                        continue
+                    if error is not None:
+                        raise error
+                    frames[key] = df
+
+                    if key == "overall" and not df.empty:
+                        # Plot the data (long daily ranges are downsampled to the chart width)
+                        rendered["overall"] = px.line(
+                            downsample(df, "timestamp", "views").rename(columns={"views": "Overall Views"}),
+                            x="timestamp",
+                            y="Overall Views",
+                            title=f"Pageviews for {project}",
+                            labels={"timestamp": "Time", "views": "Page Views"}
+                        )
+                        overall_slot.plotly_chart(rendered["overall"])
+
+                    if len(frames) == 2 and not frames["overall"].empty:
+                        df = frames["overall"].merge(frames["desktop"], on=['timestamp'], how='left')
+                        df.rename({'views_x' : 'Overall Views', 'views_y' : 'Desktop Views'}, axis = 1, inplace = True)
+                        df['Mobile Views'] = df['Overall Views'] - df['Desktop Views']
+                        rendered["split"] = px.bar(
+                            downsample(df, "timestamp", ["Desktop Views", "Mobile Views"], method="minmax"),
+                            x="timestamp",
+                            y=["Desktop Views", "Mobile Views"],
+                            title="Pageviews (Mobile vs Desktop)",
+                            labels={"value": "Views", "timestamp": "Date", "variable" : "Access Type"},
+                            barmode="stack"
+                        )
+                        split_slot.plotly_chart(rendered["split"])
 
-                fig = px.bar(
-                    df,
-                    x="timestamp",
-                    y=["Desktop Views", "Mobile Views"],
-                    title="Pageviews (Mobile vs Desktop)",
-                    labels={"value": "Views", "timestamp": "Date", "variable" : "Access Type"},
-                    barmode="stack"
-                )
-                st.plotly_chart(fig)
-            else:
+            if failed:
+                st.write("No data available for the selected parameters.")
+            elif "overall" in frames and frames["overall"].empty:
                 st.warning("No data available for the selected parameters.")
-        except requests.exceptions.RequestException as e:
-            st.write(f"No data available for the selected parameters.")
+            # Only complete results are cached
+            if len(rendered) == 2:
+                figures.put("pageviews", page_views_dict, figure_version, [rendered["overall"], rendered["split"]])
 
 
 # Tab 2: Most Viewed Pages
-with tab2:
+if active_tab == "Most Popular Pages":
     st.header("Most Viewed Pages")
 
     # Inputs for API parameters
     col1, col2, col3 = st.columns(3)
-    country_codes = [country.alpha_2 for country in pycountry.countries]
-    country_names = [get_country_name(x) for x in country_codes]
-    country_codes = ['ALL'] + country_codes
-    country_names = ['All Countries'] + country_names
-    country_dict = dict(zip(country_names, country_codes))
+    country_dict = {'All Countries': 'ALL'}
+    country_dict.update((c["name"], c["alpha_2"]) for c in lookups["countries"])
+    country_names = list(country_dict)
 
     with col1:
         ct_name = st.selectbox("Select Country", country_names, key="most_viewed_country", index = 0)
@@ -164,56 +328,103 @@ with tab2:
     month = date_input.strftime("%m")
     day = date_input.strftime("%d")
 
-    # Custom User-Agent header
-    headers = {
-        "User-Agent": "WikimediaDashboard/1.0 (your_email@example.com)",
-        "accept": "application/json"
-    }
-
     popular_dict = {'country' : country, 'access' : access, 'year' : year, 'month':month, 'day' : day}
 
     # Fetch data and display chart
     if st.button("Run", key="fetch_most_viewed"):
+        # Identical queries reuse the cached figures: no fetch, no processing, no figure building
+        figure_version = api_data_version(date_input)
+        figs = figures.get("most_viewed", popular_dict, figure_version)
+        if figs is None:
+            import plotly.express as px
+            rendered = []
+            try:
+                articles = fetch_most_popular_pages(popular_dict)
+                if articles:
+                    df = pd.DataFrame(articles)
+                    df.rename({'views' : 'views_ceil'}, axis = 1, inplace = True)
+                    df = df[~df['article'].str.contains('XX', case=False, na=False)].reset_index(drop=True)
+
+                    # Sort by views and take the top 15
+                    df = df.sort_values(by="views_ceil", ascending=False).head(15)
+                    df = df.sort_values(by="views_ceil", ascending=True)
+                    # Plot the data
+                    fig = px.bar(
+                        df,
+                        x="views_ceil",
+                        y="article",
+                        title=f"Most Viewed Pages in {ct_name} on {date_input}",
+                        labels={"views_ceil": "Views", "article": "Article"},
+                        orientation="h",
+                        height=600,  # Adjust height for better spacing
+                    )
+
+                    # Update layout for better readability
+                    fig.update_layout(
+                        yaxis=dict(title="", automargin=True),
+                        xaxis=dict(title="Views", tickformat=",d"),  # Format views with commas
+                        title=dict(font=dict(size=20)),
+                        margin=dict(l=100, r=30, t=60, b=30),  # Adjust margins
+                    )
+
+                    rendered.append(fig)
+                else:
+                    st.warning("No data available for the selected parameters.")
+            except requests.exceptions.RequestException as e:
+                st.write("No data available for the selected parameters.")
+            if rendered:
+                figs = figures.put("most_viewed", popular_dict, figure_version, rendered)
+        for fig in figs or []:
+            st.plotly_chart(fig, use_container_width=True)
+
+    # Precomputed by country_similarity.py / the refresh daemon; nothing is fetched here
+    import country_similarity
+    st.subheader("Country Similarity")
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        similarity_granularity = st.selectbox("Granularity", ["monthly", "daily"], key="similarity_granularity")
+    similarity_periods = country_similarity.list_periods(similarity_granularity)
+    if not similarity_periods:
+        st.info("No similarity data yet. Run country_similarity.py to materialize it.")
+    else:
+        with col2:
+            similarity_period = st.selectbox("Period", similarity_periods, key="similarity_period")
+        with col3:
+            similarity_measure = st.selectbox("Measure", ["jaccard", "cosine"], key="similarity_measure")
+
+        sim_df = country_similarity.read_similarity(similarity_granularity, similarity_period)
+        similarity_params = {'granularity': similarity_granularity, 'period': similarity_period, 'measure': similarity_measure}
+        # Versioned by the materialized file, so a refresh invalidates the heatmap
+        figure_version = local_store.dataset_version(country_similarity.DATASET)
+        figs = figures.get("country_similarity", similarity_params, figure_version)
+        if figs is None:
+            import plotly.express as px
+            matrix = sim_df.pivot(index="country_a", columns="country_b", values=similarity_measure)
+            fig = px.imshow(
+                matrix,
+                color_continuous_scale="Viridis",
+                title=f"Country similarity of top articles ({similarity_measure}, {similarity_period})",
+                labels={"x": "Country", "y": "Country", "color": similarity_measure},
+                height=800,
+            )
+            figs = figures.put("country_similarity", similarity_params, figure_version, [fig])
+        st.plotly_chart(figs[0], use_container_width=True)
 
-        try:
-            articles = fetch_most_popular_pages(popular_dict)
-            if articles:
-                df = pd.DataFrame(articles)
-                df.rename({'views' : 'views_ceil'}, axis = 1, inplace = True)
-                df = df[~df['article'].str.contains('XX', case=False, na=False)].reset_index(drop=True)
-
-                # Sort by views and take the top 15
-                df = df.sort_values(by="views_ceil", ascending=False).head(15)
-                df = df.sort_values(by="views_ceil", ascending=True)
-                # Plot the data
-                fig = px.bar(
-                    df,
-                    x="views_ceil",
-                    y="article",
-                    title=f"Most Viewed Pages in {ct_name} on {date_input}",
-                    labels={"views_ceil": "Views", "article": "Article"},
-                    orientation="h",
-                    height=600,  # Adjust height for better spacing
-                )
-
-                # Update layout for better readability
-                fig.update_layout(
-                    yaxis=dict(title="", automargin=True),
-                    xaxis=dict(title="Views", tickformat=",d"),  # Format views with commas
-                    title=dict(font=dict(size=20)),
-                    margin=dict(l=100, r=30, t=60, b=30),  # Adjust margins
-                )
-
-                st.plotly_chart(fig, use_container_width=True)
-            else:
-                st.warning("No data available for the selected parameters.")
-        except requests.exceptions.RequestException as e:
-            st.write("No data available for the selected parameters.")
+        similar_country = st.selectbox("Countries most similar to", sorted(sim_df["country_a"].unique()), key="similarity_country")
+        nearest = sim_df[sim_df["country_a"] == similar_country].sort_values(by=similarity_measure, ascending=False).head(10)
+        st.dataframe(nearest[["country_b", "shared_articles", "jaccard", "cosine"]], use_container_width=True)
 
-with tab3:
+if active_tab == "Page Views for an Article":
 
     st.header("Page Views for an Article")
 
+    compare_mode = st.radio(
+        'Mode',
+        ['Single article', 'Compare articles'],
+        horizontal=True,
+        key='article_pageview_mode'
+    ) == 'Compare articles'
+
     # Create columns for horizontal layout
     col1, col2, col3, col4, col5, col6 = st.columns(6)
 
@@ -232,16 +443,33 @@ with tab3:
         )
 
     with col3:
-        article = st.text_input(
-            'Article Name', 
-            value='Donald_Trump', 
-            key='article_pageview_article'
-        )
+        if compare_mode:
+            article_queries = st.text_area(
+                'Article Names (one per line)',
+                value='Donald_Trump\nKamala_Harris',
+                key='article_pageview_compare_articles'
+            )
+            compare_articles = list(dict.fromkeys(
+                normalize_title(a) for a in article_queries.splitlines() if a.strip()
+            ))
+        else:
+            article_query = st.text_input(
+                'Article Name', 
+                value='Donald_Trump', 
+                key='article_pageview_article'
+            )
+            # Suggest known titles as the user types. The index only holds top-pages titles,
+            # so the normalized input comes first and stays the default; suggestions follow
+            article = normalize_title(article_query)
+            suggestions = load_article_index().suggest(article_query) if article_query else []
+            if suggestions:
+                options = [article] + [title for title in suggestions if title != article]
+                article = st.selectbox('Matching Articles', options, index=0, key='article_pageview_suggestions')
 
     with col4:
         granularity = st.selectbox(
             'Granularity', 
-            ['daily', 'monthly'], 
+            ['daily', 'weekly', 'monthly', 'yearly'], 
             key='article_pageview_granularity'
         )
     default_start_date = date(2024, 1, 1)
@@ -259,68 +487,109 @@ with tab3:
             key='article_pageview_end_date'
         )
 
+    if compare_mode:
+        col1, col2 = st.columns(2)
+        with col1:
+            compare_projects = st.multiselect(
+                'Projects',
+                ["en.wikipedia.org", "de.wikipedia.org", "fr.wikipedia.org", "es.wikipedia.org", "hi.wikipedia.org"],
+                default=["en.wikipedia.org"],
+                key='article_pageview_compare_projects'
+            )
+        with col2:
+            compare_scale = st.radio(
+                'Scale',
+                ['Overlaid', 'Normalized (% of peak)'],
+                horizontal=True,
+                key='article_pageview_compare_scale'
+            )
+
     project = 'en.wikipedia.org'
 
     # Button to submit and fetch data
     if st.button('Run', key='article_pageview_fetch_data'):
+        import plotly.express as px
         # Convert dates to the required format (YYYYMMDDHH)
         start = start_date.strftime('%Y%m%d00')
         end = end_date.strftime('%Y%m%d00')
 
-        # API URL
-        api_url = f"https://wikimedia.org/api/rest_v1/metrics/pageviews/per-article/{project}/{access}/{agent}/{article}/{granularity}/{start}/{end}"
-
-        headers = {
-            "User-Agent": "MyWikimediaApp/1.0 (mailto:example@example.com)",  # Replace with your email
-            "accept": "application/json"
-        }
-
-        try:
-            # Request data from the API
-            response = requests.get(api_url, headers=headers)
-            response.raise_for_status() 
-            data = response.json()
-            
-            if 'items' in data:
-                df = pd.DataFrame(data['items'])
-                df['timestamp'] = pd.to_datetime(df['timestamp'], format='%Y%m%d%H')
-                df['views'] = df['views'].astype(int)
-
-                # Plot the line chart using Plotly
-                st.subheader("Pageviews Over Time")
-                fig = px.line(
-                    df, 
-                    x='timestamp', 
-                    y='views', 
-                    title=f'Pageviews for {article} ({granularity})', 
-                    labels={'timestamp': 'Date', 'views': 'Pageviews'}
-                )
-                st.plotly_chart(fig)
+        if compare_mode:
+            series_keys = [(p, a) for p in compare_projects for a in compare_articles]
+            if not series_keys:
+                st.warning("Enter at least one article and project to compare.")
+            elif len(series_keys) > MAX_COMPARE_SERIES:
+                st.warning(f"Too many series selected ({len(series_keys)}); compare at most {MAX_COMPARE_SERIES} article/project pairs.")
             else:
-                st.warning("No data found for the selected parameters.")
-        except requests.exceptions.RequestException as e:
-            st.write("No data available for the selected parameters.")
+                # The chart is redrawn as each series arrives, so the first one shows
+                # after a single request's latency
+                st.subheader("Pageviews Over Time")
+                progress_slot, chart_slot = st.empty(), st.empty()
+                normalize = compare_scale != 'Overlaid'
+                series = {}
+                missing = []
+                query = stream_article_series(series_keys, access, agent, granularity, start, end)
+                with query:
+                    for done, (key, df, error) in enumerate(query.results(), start=1):
+                        project_name, article_name = key
+                        if isinstance(error, QueryTimeout):
+                            missing.append(f"{article_name} ({project_name}, timed out)")
+                        elif error is not None and not isinstance(error, requests.exceptions.RequestException):
+                            raise error
+                        elif df is None or df.empty:
+                            missing.append(f"{article_name} ({project_name})")
+                        else:
+                            series[key] = df
+                        progress_slot.caption(f"Loaded {done} of {len(series_keys)} series")
+                        if series and df is not None and not df.empty:
+                            wide = align_article_series(series, granularity, start_date, end_date, normalize=normalize)
+                            long_df = wide.reset_index().melt(id_vars="timestamp", var_name="article", value_name="views")
+                            fig = px.line(
+                                downsample(long_df, 'timestamp', 'views', color='article'),
+                                x='timestamp',
+                                y='views',
+                                color='article',
+                                title=f'Pageviews comparison ({granularity})',
+                                labels={'timestamp': 'Date', 'views': '% of peak' if normalize else 'Pageviews', 'article': 'Article'}
+                            )
+                            chart_slot.plotly_chart(fig, use_container_width=True)
+                progress_slot.empty()
+                if missing:
+                    st.warning("No data for: " + ", ".join(missing))
+        else:
+            try:
+                df = load_article_pageviews(project, access, agent, article, granularity, start, end)
+
+                if not df.empty:
+                    # Plot the line chart using Plotly
+                    st.subheader("Pageviews Over Time")
+                    fig = px.line(
+                        downsample(df, 'timestamp', 'views'), 
+                        x='timestamp', 
+                        y='views', 
+                        title=f'Pageviews for {article} ({granularity})', 
+                        labels={'timestamp': 'Date', 'views': 'Pageviews'}
+                    )
+                    st.plotly_chart(fig)
+                else:
+                    st.warning("No data found for the selected parameters.")
+            except requests.exceptions.RequestException as e:
+                st.write("No data available for the selected parameters.")
 
     
 
 
-with tab4:
+if active_tab == "Editors":
     st.header("Editors")
-    editors_tab1, editors_tab2 = st.tabs(["Aggregate Editors", "Editors by Country"])
+    editors_view = st.radio("Editors view", ["Aggregate Editors", "Editors by Country"], horizontal=True,
+                            key="editors_view", label_visibility="collapsed")
 
-    with editors_tab1:
+    if editors_view == "Aggregate Editors":
         st.subheader("Aggregate Editors")
         col1, col2, col3, col4, col5, col6, col7 = st.columns(7)
         with col1:
             project_editors = st.selectbox(
                 "Project",
-                ["en.wikipedia.org",
-                 "de.wikipedia.org",
-                 "fr.wikipedia.org",
-                 "es.wikipedia.org",
-                 "hi.wikipedia.org",
-                 "commons.wikimedia.org",
-                 "meta.wikimedia.org"],
+                lookups["projects"]["editors"],
                 key="aggregate_editors_project"
             )
         with col2:
@@ -333,6 +602,7 @@ with tab4:
             activity_levels = ["all-activity-levels", "1..4-edits", "5..24-edits", "25..99-edits", "100..-edits"]
             activity_level = st.selectbox("Activity Level", activity_levels, key="aggregate_editors_activity_level")
         with col5:
+            # Editor counts are not additive across days, so monthly always comes from the API
             granularity_editors = st.selectbox("Granularity", ["daily", "monthly"], key="aggregate_editors_granularity")
         with col6:
             default_start_date_editors = date(2023, 1, 1)
@@ -343,44 +613,44 @@ with tab4:
 
         start_editors = start_date_editors.strftime("%Y%m%d")
         end_editors = end_date_editors.strftime("%Y%m%d")
+        aggregate_editors_params = {'project': project_editors, 'editor_type': editor_type, 'page_type': page_type,
+                                    'activity_level': activity_level, 'granularity': granularity_editors,
+                                    'start': start_editors, 'end': end_editors}
 
         if st.button("Run", key="fetch_aggregate_editors"):
-            api_url = (
-                f"https://wikimedia.org/api/rest_v1/metrics/editors/aggregate/"
-                f"{project_editors}/{editor_type}/{page_type}/{activity_level}/{granularity_editors}/{start_editors}/{end_editors}"
-            )
-            try:
-                response = requests.get(api_url, headers=headers)
-                response.raise_for_status()
-                data = response.json()
-                items = data.get("items", [])
-                if items and "results" in items[0]:
-                    results = items[0].get("results", [])
-                    if results:
-                        df = pd.DataFrame(results)
-                        df["timestamp"] = pd.to_datetime(df["timestamp"])
+            # Identical queries reuse the cached figures: no fetch, no processing, no figure building
+            figure_version = api_data_version(end_date_editors)
+            figs = figures.get("aggregate_editors", aggregate_editors_params, figure_version)
+            if figs is None:
+                import plotly.express as px
+                rendered = []
+                try:
+                    df = fetch_editors_frame(aggregate_editors_params)
+                    if not df.empty:
                         fig = px.line(
-                            df,
+                            downsample(df, "timestamp", "editors"),
                             x="timestamp",
                             y="editors",
                             title=f"Editors for {project_editors}",
                             labels={"timestamp": "Time", "editors": "Number of Editors"}
                         )
-                        st.plotly_chart(fig, use_container_width=True)
+                        rendered.append(fig)
                     else:
-                        st.warning("No data in 'results' for the selected parameters.")
-                else:
-                    st.warning("No data available for the selected parameters.")
-            except requests.exceptions.RequestException as e:
-                st.write("No data available for the selected parameters.")
+                        st.warning("No data available for the selected parameters.")
+                except requests.exceptions.RequestException as e:
+                    st.write("No data available for the selected parameters.")
+                if rendered:
+                    figs = figures.put("aggregate_editors", aggregate_editors_params, figure_version, rendered)
+            for fig in figs or []:
+                st.plotly_chart(fig, use_container_width=True)
 
-    with editors_tab2:
+    if editors_view == "Editors by Country":
         st.subheader("Editors by Country")
         col1, col2, col3, col4 = st.columns(4)
         with col1:
             project_country = st.selectbox(
                 "Project",
-                ["en.wikipedia.org", "de.wikipedia.org", "fr.wikipedia.org"],
+                lookups["projects"]["editors_by_country"],
                 key="country_editors_project"
             )
         with col2:
@@ -389,95 +659,113 @@ with tab4:
             year_country = st.selectbox("Year", list(range(2018, 2025)), key="country_editors_year")
         with col4:
             month_country = st.selectbox("Month", [f"{i:02d}" for i in range(1, 13)], key="country_editors_month")
+        country_editors_params = {'project': project_country, 'activity_level': activity_level_country,
+                                  'year': year_country, 'month': month_country}
 
         if st.button("Run", key="fetch_editors_by_country"):
-            api_url = (
-                f"https://wikimedia.org/api/rest_v1/metrics/editors/by-country/"
-                f"{project_country}/{activity_level_country}/{year_country}/{month_country}"
-            )
-            try:
-                response = requests.get(api_url, headers=headers)
-                response.raise_for_status()
-                data = response.json()
-                items = data.get("items", [])
-                if items and "countries" in items[0]:
-                    countries = items[0].get("countries", [])
-
-                    # Sort by editors-ceil and take top 50 (excluding '--')
-                    df = pd.DataFrame(countries)
-                    df = df[df["country"] != "--"]
-                    df = df.sort_values(by="editors-ceil", ascending=False).head(50)
-
-                    country_name_map = {
-                        "US": "United States",
-                        "GB": "United Kingdom",
-                        "IN": "India",
-                        "CA": "Canada",
-                        "AU": "Australia",
-                        "DE": "Germany",
-                        "PH": "Philippines",
-                        "ID": "Indonesia",
-                        "BR": "Brazil",
-                        "IT": "Italy",
-                        "FR": "France",
-                        "NL": "Netherlands",
-                        "IE": "Ireland",
-                        "MY": "Malaysia",
-                        "ES": "Spain",
-                        "BD": "Bangladesh",
-                        "GR": "Greece",
-                        "JP": "Japan",
-                        "NZ": "New Zealand",
-                        "PL": "Poland",
-                        "SE": "Sweden",
-                        "HK": "Hong Kong",
-                        "MX": "Mexico",
-                        "NG": "Nigeria",
-                        "IL": "Israel",
-                        "KR": "South Korea",
-                        "CH": "Switzerland",
-                        "BE": "Belgium",
-                        "AR": "Argentina",
-                        "PT": "Portugal",
-                        "NO": "Norway",
-                        "RO": "Romania",
-                        "ZA": "South Africa",
-                        "TW": "Taiwan",
-                        "FI": "Finland",
-                        "CZ": "Czech Republic",
-                        "RS": "Serbia",
-                        "BG": "Bulgaria",
-                        "UA": "Ukraine",
-                        "DK": "Denmark",
-                        "HU": "Hungary",
-                        "NP": "Nepal",
-                        "AT": "Austria",
-                        "CL": "Chile",
-                        "HR": "Croatia",
-                        "LK": "Sri Lanka",
-                        "PE": "Peru",
-                        "CO": "Colombia",
-                        "KE": "Kenya",
-                        "LT": "Lithuania"
-                    }
-
-                    df["country_name"] = df["country"].map(country_name_map)
-                    df = df.dropna(subset=["country_name"])
-                    if df.empty:
-                        st.warning("No mapped country data available for the selected parameters.")
+            # Identical queries reuse the cached figures: no fetch, no processing, no figure building
+            figure_version = api_data_version(pd.Timestamp(f"{year_country}-{month_country}-01") + pd.offsets.MonthEnd(0))
+            figs = figures.get("editors_by_country", country_editors_params, figure_version)
+            if figs is None:
+                import plotly.express as px
+                rendered = []
+                api_url = (
+                    f"https://wikimedia.org/api/rest_v1/metrics/editors/by-country/"
+                    f"{project_country}/{activity_level_country}/{year_country}/{month_country}"
+                )
+                try:
+                    response = requests.get(api_url, headers=headers)
+                    response.raise_for_status()
+                    data = response.json()
+                    items = data.get("items", [])
+                    if items and "countries" in items[0]:
+                        countries = items[0].get("countries", [])
+
+                        # Sort by editors-ceil and take top 50 (excluding '--')
+                        df = pd.DataFrame(countries)
+                        df = df[df["country"] != "--"]
+                        df = df.sort_values(by="editors-ceil", ascending=False).head(50)
+
+                        # ISO-3 codes let plotly place countries without matching names
+                        df["iso_alpha"] = df["country"].map(lookups["alpha_3"])
+                        df["country_name"] = df["country"].map(lookups["country_names"])
+                        df = df.dropna(subset=["iso_alpha"])
+                        if df.empty:
+                            st.warning("No mapped country data available for the selected parameters.")
+                        else:
+                            fig_map = px.choropleth(
+                                df,
+                                locations="iso_alpha",
+                                locationmode="ISO-3",
+                                color="editors-ceil",
+                                hover_name="country_name",
+                                color_continuous_scale="Viridis",
+                                title=f"Top 50 Countries by Editors for {project_country} ({year_country}-{month_country})"
+                            )
+                            fig_map.update_layout(height=800)
+                            rendered.append(fig_map)
                     else:
-                        fig_map = px.choropleth(
-                            df,
-                            locations="country_name",
-                            locationmode='country names',
-                            color="editors-ceil",
-                            hover_name="country_name",
-                            color_continuous_scale="Viridis",
-                            title=f"Top 50 Countries by Editors for {project_country} ({year_country}-{month_country})"
-                        )
-                        fig_map.update_layout(height=800)
-                        st.plotly_chart(fig_map, use_container_width=True)
+                        st.warning("No data available for the selected parameters.")
+                except requests.exceptions.RequestException as e:
+                    st.write("No data available for the selected parameters.")
+                if rendered:
+                    figs = figures.put("editors_by_country", country_editors_params, figure_version, rendered)
+            for fig in figs or []:
+                st.plotly_chart(fig, use_container_width=True)
+
+
+# Tab 5: Commons category impact, answered from the precomputed category_index.py index
+if active_tab == "Commons Impact":
+    st.header("Commons Impact")
+    import category_index
+
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        impact_scope = st.selectbox("Category Scope", ["shallow", "deep"], key="impact_scope")
+    impact_wikis = category_index.indexed_wikis(impact_scope)
+    if not impact_wikis:
+        st.info("No impact index yet. Run category_index.py to build it.")
+    else:
+        with col2:
+            impact_wiki = st.selectbox("Wiki", impact_wikis, key="impact_wiki")
+        with col3:
+            impact_month = st.selectbox("Month", category_index.indexed_months(impact_scope, impact_wiki), key="impact_month")
+
+        import plotly.express as px
+        st.subheader("Top Categories")
+        df = category_index.top_categories(impact_scope, impact_wiki, impact_month, k=20).sort_values(by="views")
+        fig = px.bar(
+            df,
+            x="views",
+            y="category",
+            orientation="h",
+            title=f"Categories driving the most views on {impact_wiki} ({impact_month})",
+            labels={"views": "Views", "category": "Category"},
+            height=600,
+        )
+        fig.update_layout(yaxis=dict(title="", automargin=True), xaxis=dict(tickformat=",d"))
+        st.plotly_chart(fig, use_container_width=True)
+
+        col1, col2 = st.columns(2)
+        with col1:
+            st.subheader("Categories for an Article")
+            impact_article = st.text_input("Article", key="impact_article")
+            if impact_article:
+                article_id = load_article_dictionary().lookup(normalize_title(impact_article))
+                df = pd.DataFrame()
+                if article_id is not None:
+                    df = category_index.categories_for_article(impact_scope, impact_wiki, impact_month, article_id)
+                if df.empty:
+                    st.warning("No category drove views to this article in the selected month.")
                 else:
-                    st.warning("No data available for the selected parameters.")
-            except requests.exceptions.RequestException as e:
-                st.write("No data available for the selected parameters.")
\ No newline at end of file
+                    st.dataframe(df, use_container_width=True)
+        with col2:
+            st.subheader("Top Articles of a Category")
+            impact_category = st.selectbox("Category", category_index.top_categories(impact_scope, impact_wiki, impact_month, k=1000)["category"], key="impact_category")
+            if impact_category:
+                df = category_index.top_articles(impact_scope, impact_wiki, impact_month, impact_category)
+                df["article"] = load_article_dictionary().decode(df["article_id"])
+                st.dataframe(df[["article", "views"]], use_container_width=True)
+
+profiler.mark(active_tab)
+profiler.report()
@@ -0,0 +1,144 @@
+from urllib.parse import quote
+import requests
+import pandas as pd
+from aqs_decode import decode_columns, loads
+
+# Shared Wikimedia REST (AQS) fetch helpers and response -> DataFrame builders.
+# The builders apply the same renames, filters and column order as the
+# matching Script_*.py collector, so rows from either path line up. Responses
+# are decoded into typed columns by aqs_decode rather than through a list of
+# dicts.
+
+BASE_URL = "https://wikimedia.org/api/rest_v1/metrics"
+
+# User-Agent header required by the API
+headers = {
+    "accept": "application/json",
+    "User-Agent": "WikimediaDataCollector/1.0 (youremail@example.com)"
+}
+
+
+def get(path, session=None, timeout=60):
+    http = session or requests
+    response = http.get(f"{BASE_URL}/{path}", headers=headers, timeout=timeout)
+    response.raise_for_status()
+    return response
+
+
+def fetch_json(path, session=None, timeout=60):
+    return loads(get(path, session, timeout).content)
+
+
+# Column layout of every dataset, as written by the collectors
+COLUMNS = {
+    "pageviews": ["project", "access", "agent", "timestamp", "views"],
+    "unique_devices": ["project", "access_site", "granularity", "timestamp", "devices", "offset", "underestimate"],
+    "editors_data": ["project", "editor_type", "page_type", "activity_level", "date", "editors"],
+    "editors_by_country": ["project", "activity_level", "year", "month", "country", "editors"],
+    "most_viewed_pages": ["project", "access", "year", "month", "day", "article", "views", "rank"],
+    "top_pages_by_country": ["country", "access", "year", "month", "day", "project", "article", "views_ceil", "rank"],
+    "top_pages_by_category": ["category", "category_scope", "wiki", "year", "month", "article", "views_ceil", "rank"],
+    "article_pageviews": ["project", "access", "agent", "article", "timestamp", "views"],
+}
+
+
+def columns_frame(count, columns, order, **constants):
+    # Frame from decoded column arrays plus one constant per request parameter
+    return pd.DataFrame({**constants, **columns}, index=pd.RangeIndex(count), columns=order)
+
+
+def pageviews_frame(data, project, access, agent):
+    count, columns = decode_columns(data, "aggregate")
+    columns["timestamp"] = pd.to_datetime(columns["timestamp"], format="%Y%m%d%H")
+    return columns_frame(count, columns, COLUMNS["pageviews"], project=project, access=access, agent=agent)
+
+
+def unique_devices_frame(data, project, access_site, granularity):
+    count, columns = decode_columns(data, "unique_devices")
+    columns["timestamp"] = pd.to_datetime(columns["timestamp"], format="%Y%m%d")
+    return columns_frame(count, columns, COLUMNS["unique_devices"],
+                         project=project, access_site=access_site, granularity=granularity)
+
+
+def editors_frame(data, project, editor_type, page_type, activity_level):
+    count, columns = decode_columns(data, "editors")
+    columns["date"] = pd.to_datetime(columns.pop("timestamp")).date
+    return columns_frame(count, columns, COLUMNS["editors_data"], project=project, editor_type=editor_type,
+                         page_type=page_type, activity_level=activity_level)
+
+
+def editors_by_country_frame(data, project, activity_level, year, month):
+    count, columns = decode_columns(data, "editors_by_country")
+    # Exclude rows where country is "--"
+    known = columns["country"] != "--"
+    if not known.all():
+        columns = {name: values[known] for name, values in columns.items()}
+        count = int(known.sum())
+    return columns_frame(count, columns, COLUMNS["editors_by_country"],
+                         project=project, activity_level=activity_level, year=year, month=month)
+
+
+def top_pages_frame(data, project, access, year, month, day):
+    count, columns = decode_columns(data, "top")
+    return columns_frame(count, columns, COLUMNS["most_viewed_pages"],
+                         project=project, access=access, year=year, month=month, day=day)
+
+
+def top_pages_by_country_frame(data, country, access, year, month, day):
+    count, columns = decode_columns(data, "top_by_country")
+    return columns_frame(count, columns, COLUMNS["top_pages_by_country"],
+                         country=country, access=access, year=year, month=month, day=day)
+
+
+def top_pages_by_category_frame(data, category, category_scope, wiki, year, month):
+    count, columns = decode_columns(data, "commons_top")
+    return columns_frame(count, columns, COLUMNS["top_pages_by_category"],
+                         category=category, category_scope=category_scope, wiki=wiki, year=year, month=month)
+
+
+def article_pageviews_frame(data, project, access, agent, article):
+    count, columns = decode_columns(data, "aggregate")
+    columns["timestamp"] = pd.to_datetime(columns["timestamp"], format="%Y%m%d%H")
+    return columns_frame(count, columns, COLUMNS["article_pageviews"],
+                         project=project, access=access, agent=agent, article=article)
+
+
+def fetch_pageviews(project, access, agent, granularity, start, end, session=None):
+    data = fetch_json(f"pageviews/aggregate/{project}/{access}/{agent}/{granularity}/{start}/{end}", session)
+    return pageviews_frame(data, project, access, agent)
+
+
+def fetch_article_pageviews(project, access, agent, article, granularity, start, end, session=None):
+    # Titles are path segments, so "/" and other reserved characters are escaped
+    data = fetch_json(f"pageviews/per-article/{project}/{access}/{agent}/{quote(article, safe='')}/{granularity}/{start}/{end}", session)
+    return article_pageviews_frame(data, project, access, agent, article)
+
+
+def fetch_unique_devices(project, access_site, granularity, start, end, session=None):
+    data = fetch_json(f"unique-devices/{project}/{access_site}/{granularity}/{start}/{end}", session)
+    return unique_devices_frame(data, project, access_site, granularity)
+
+
+def fetch_editors(project, editor_type, page_type, activity_level, granularity, start, end, session=None):
+    data = fetch_json(f"editors/aggregate/{project}/{editor_type}/{page_type}/{activity_level}/{granularity}/{start}/{end}", session)
+    return editors_frame(data, project, editor_type, page_type, activity_level)
+
+
+def fetch_editors_by_country(project, activity_level, year, month, session=None):
+    data = fetch_json(f"editors/by-country/{project}/{activity_level}/{year}/{month}", session)
+    return editors_by_country_frame(data, project, activity_level, year, month)
+
+
+def fetch_top_pages(project, access, year, month, day, session=None):
+    data = fetch_json(f"pageviews/top/{project}/{access}/{year}/{month}/{day}", session)
+    return top_pages_frame(data, project, access, year, month, day)
+
+
+def fetch_top_pages_by_country(country, access, year, month, day, session=None):
+    data = fetch_json(f"pageviews/top-per-country/{country}/{access}/{year}/{month}/{day}", session)
+    return top_pages_by_country_frame(data, country, access, year, month, day)
+
+
+def fetch_top_pages_by_category(category, category_scope, wiki, year, month, session=None):
+    data = fetch_json(f"commons-analytics/top-pages-per-category-monthly/{category}/{category_scope}/{wiki}/{year}/{month}", session)
+    return top_pages_by_category_frame(data, category, category_scope, wiki, year, month)